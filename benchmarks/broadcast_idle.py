@@ -0,0 +1,125 @@
+"""
+Нагрузка простаивающих WebSocket подключений на RedisBroadcastManager.
+
+Подключает N фиктивных сокетов, ждет заданное время без сообщений и выводит
+затраченное процессорное время процесса и количество клиентов Redis.
+
+Режим `legacy` воспроизводит прежнюю схему: отдельное pub/sub подключение
+на канал пользователя и задача опроса `get_message(timeout=5)` на каждый сокет.
+
+    python -m benchmarks.broadcast_idle --connections 20000 --users 10000 --idle 30
+    python -m benchmarks.broadcast_idle --connections 2000 --mode legacy --max-connections 5000
+"""
+
+import argparse
+import asyncio
+import time
+
+from redis.asyncio import Redis, ConnectionPool
+
+from messenger.settings import settings
+from messenger.sockets.frames import Frame
+from messenger.sockets.manager import RedisBroadcastManager
+from messenger.sockets.status import ClusterPresence
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.received = 0
+
+    async def send_text(self, data: str):
+        self.received += 1
+
+
+async def _connected_clients(redis: Redis) -> int:
+    info = await redis.info("clients")
+    return info["connected_clients"]
+
+
+async def _run_shared(redis: Redis, sockets: list[tuple[int, FakeWebSocket]]):
+    presence = ClusterPresence(redis, node_id=settings.node_id, node_ttl=settings.node_ttl)
+    manager = RedisBroadcastManager(redis, presence, heartbeat_interval=settings.node_heartbeat_interval)
+    users: dict[int, list[FakeWebSocket]] = {}
+    for user_id, websocket in sockets:
+        users.setdefault(user_id, []).append(websocket)
+
+    def receive(frame: Frame, user_id: int):
+        for websocket in users.get(user_id, ()):
+            websocket.received += 1
+
+    manager.set_receiver(receive)
+    for user_id in users:
+        await manager.run_listener(user_id)
+
+    async def stop():
+        for user_id in users:
+            await manager.stop_listener(user_id)
+
+    return stop
+
+
+async def _run_legacy(redis: Redis, sockets: list[tuple[int, FakeWebSocket]]):
+    async def listener(websocket: FakeWebSocket, user_id: int):
+        pubsub = redis.pubsub()
+        await pubsub.subscribe(str(user_id))
+        try:
+            while True:
+                msg = await pubsub.get_message(ignore_subscribe_messages=True, timeout=5)
+                if msg is not None and msg["type"] == "message":
+                    await websocket.send_text(msg["data"].decode("utf-8"))
+        finally:
+            await pubsub.unsubscribe()
+            await pubsub.aclose()
+
+    tasks = [asyncio.create_task(listener(websocket, user_id)) for user_id, websocket in sockets]
+
+    async def stop():
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    return stop
+
+
+async def main(args: argparse.Namespace):
+    pool = ConnectionPool.from_url(args.redis_url, max_connections=args.max_connections)
+    redis = Redis(connection_pool=pool)
+    control = Redis.from_url(args.redis_url)
+
+    sockets = [(i % args.users + 1, FakeWebSocket()) for i in range(args.connections)]
+    clients_before = await _connected_clients(control)
+
+    start = time.perf_counter()
+    if args.mode == "shared":
+        stop = await _run_shared(redis, sockets)
+    else:
+        stop = await _run_legacy(redis, sockets)
+    print(f"Подключение {args.connections} сокетов: {time.perf_counter() - start:.2f} с")
+
+    await asyncio.sleep(1)
+    clients_during = await _connected_clients(control)
+
+    cpu_start = time.process_time()
+    await asyncio.sleep(args.idle)
+    cpu_used = time.process_time() - cpu_start
+
+    print(f"Режим: {args.mode}")
+    print(f"Клиентов Redis: {clients_during - clients_before} (всего {clients_during})")
+    print(f"CPU за {args.idle} с простоя: {cpu_used:.3f} с ({cpu_used / args.idle * 100:.2f}% ядра)")
+
+    await stop()
+    await redis.aclose()
+    await control.aclose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--redis-url", default=settings.broadcast_redis_url)
+    parser.add_argument("--connections", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--idle", type=float, default=30)
+    parser.add_argument("--max-connections", type=int, default=settings.broadcast_redis_max_connections)
+    parser.add_argument("--mode", choices=["shared", "legacy"], default="shared")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,77 @@
+"""
+Сериализация значений кеша: pickle и msgpack с расширениями для схем.
+
+Для каждого типа значений, которые приложение хранит в кеше, выводит время
+записи (dumps) и чтения (loads) в микросекундах и размер значения в байтах.
+
+    python -m benchmarks.cache_serializers --repeat 2000
+"""
+
+import argparse
+import time
+from datetime import datetime
+
+from messenger.auth.schemas import CurrentUserSchema
+from messenger.cache.serializers import MsgpackSerializer, PickleSerializer
+from messenger.friendships.schemas import FriendshipEntitySchema
+from messenger.sockets.schemas import MessageResponseSchema
+
+
+def _message(index: int) -> MessageResponseSchema:
+    return MessageResponseSchema(
+        type="message",
+        status="new",
+        message=f"Сообщение номер {index}, немного текста для реалистичного размера",
+        recipient_id=2,
+        sender_id=1,
+        created_at=1_700_000_000_000 + index,
+    )
+
+
+def _values() -> dict:
+    return {
+        "last_message": _message(0),
+        "read_messages (100)": [_message(index) for index in range(100)],
+        "user_friendships (50)": [
+            FriendshipEntitySchema(id=index, type="user", username=f"user{index}", first_name="Имя")
+            for index in range(50)
+        ],
+        "auth_user": CurrentUserSchema(
+            id=1,
+            username="user1",
+            email="user1@example.com",
+            is_superuser=False,
+            is_staff=False,
+            is_active=True,
+            date_join=datetime.now(),
+        ),
+        "last_read_message_time": datetime.now(),
+        "last_seen": 1_700_000_000_000,
+    }
+
+
+def _measure(function, argument, repeat: int) -> float:
+    started_at = time.perf_counter()
+    for _ in range(repeat):
+        function(argument)
+    return (time.perf_counter() - started_at) / repeat * 1_000_000
+
+
+def main(args: argparse.Namespace):
+    serializers = {"pickle": PickleSerializer(), "msgpack": MsgpackSerializer()}
+    print(f"{'Значение':<26}{'Формат':<10}{'dumps, мкс':>12}{'loads, мкс':>12}{'Байт':>9}")
+    for name, value in _values().items():
+        for serializer_name, serializer in serializers.items():
+            data = serializer.dumps(value)
+            assert serializer.loads(data) == value
+            dumps = _measure(serializer.dumps, value, args.repeat)
+            loads = _measure(serializer.loads, data, args.repeat)
+            print(f"{name:<26}{serializer_name:<10}{dumps:>12.2f}{loads:>12.2f}{len(data):>9}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--repeat", type=int, default=2000)
+    main(parser.parse_args())
@@ -0,0 +1,83 @@
+"""
+Задержка чтения кеша: RedisCache и TieredCache (LRU в памяти процесса перед Redis).
+
+Заполняет Redis списками друзей (`user_friendships:{id}`), затем читает их с неравномерным
+распределением ключей (часть пользователей активнее остальных), изредка изменяя значения.
+Выводит задержку `get`, долю попаданий в локальный уровень и количество чтений в секунду.
+
+    python -m benchmarks.cache_tiers --redis redis://localhost:6379/0 --keys 10000 --reads 50000
+"""
+
+import argparse
+import asyncio
+import random
+import time
+
+from benchmarks.loadgen import _print_percentiles
+from messenger.cache.redis import RedisCache
+from messenger.cache.tiered import TieredCache
+from messenger.friendships.schemas import FriendshipEntitySchema
+
+
+def _friendships(count: int) -> list[FriendshipEntitySchema]:
+    return [
+        FriendshipEntitySchema(
+            id=index, type="user", username=f"user{index}", first_name="Имя", last_name=None
+        )
+        for index in range(count)
+    ]
+
+
+async def _run(name: str, cache, args: argparse.Namespace, keys: list[str]):
+    latencies = []
+    started_at = time.perf_counter()
+    for _ in range(args.reads):
+        key = keys[min(int(random.paretovariate(1.2)) - 1, len(keys) - 1)]
+        if random.random() < args.write_ratio:
+            await cache.set(key, _friendships(args.friends), expire=-1)
+            continue
+        read_at = time.perf_counter()
+        await cache.get(key)
+        latencies.append((time.perf_counter() - read_at) * 1000)
+    elapsed = time.perf_counter() - started_at
+
+    print(f"{name}: {len(latencies) / elapsed:.0f} чтений/с")
+    _print_percentiles("  Задержка get", latencies)
+    if stats := cache.stats():
+        print(f"  Доля попаданий: {stats['namespaces']['user_friendships']['hit_ratio']}")
+
+
+async def main(args: argparse.Namespace):
+    remote = RedisCache(url=args.redis, max_connections=5)
+    keys = [f"user_friendships:{index}" for index in range(args.keys)]
+    random.shuffle(keys)
+    value = _friendships(args.friends)
+    for key in keys:
+        await remote.set(key, value, expire=600)
+
+    await _run("RedisCache", remote, args, keys)
+
+    tiered = TieredCache(
+        remote,
+        url=args.redis,
+        namespaces={"user_friendships": 60},
+        max_size=args.local_size,
+        node_id="benchmark",
+    )
+    await tiered.get(keys[0])  # Запуск подписки на инвалидацию.
+    await asyncio.sleep(0.5)
+    await _run("TieredCache", tiered, args, keys)
+    await tiered.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--redis", default="redis://localhost:6379/0")
+    parser.add_argument("--keys", type=int, default=10000)
+    parser.add_argument("--friends", type=int, default=50, help="размер списка друзей")
+    parser.add_argument("--reads", type=int, default=50000)
+    parser.add_argument("--write-ratio", type=float, default=0.01, help="доля операций записи")
+    parser.add_argument("--local-size", type=int, default=10000, help="размер локального уровня")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,121 @@
+"""
+Микробенчмарк сериализации исходящих сообщений.
+
+Сравнивает прежнюю схему (сериализация на каждый сокет и каждого друга)
+с кадрами :class:`Frame`, которые сериализуются один раз.
+
+    python -m benchmarks.frames --tabs 5 --friends 500
+"""
+
+import argparse
+import asyncio
+import time
+from datetime import datetime
+
+from messenger.sockets.frames import Frame, frames_for_recipients
+from messenger.sockets.schemas import MessageResponseSchema
+
+
+class FakeWebSocket:
+    async def send_text(self, data: str):
+        pass
+
+
+def _message(recipient_id: int) -> MessageResponseSchema:
+    return MessageResponseSchema(
+        type="message",
+        status="new",
+        message="Привет! Как дела? " * 4,
+        recipient_id=recipient_id,
+        sender_id=1,
+        created_at=int(datetime.now().timestamp() * 1000),
+    )
+
+
+async def legacy_tabs(message: MessageResponseSchema, sockets: list[FakeWebSocket]):
+    for websocket in sockets:
+        await websocket.send_text(message.model_dump_json(by_alias=True))
+
+
+async def frame_tabs(message: MessageResponseSchema, sockets: list[FakeWebSocket]):
+    frame = Frame.from_schema(message)
+    for websocket in sockets:
+        await frame.send(websocket)
+
+
+async def legacy_status(friends: list[int]):
+    for friend_id in friends:
+        message = MessageResponseSchema(
+            type="change_status",
+            status="online",
+            recipient_id=friend_id,
+            sender_id=1,
+            message="Пользователь 1 online.",
+            created_at=int(datetime.now().timestamp() * 1000),
+        )
+        _ = message.model_dump_json(by_alias=True).encode("utf-8")
+
+
+async def frame_status(friends: list[int]):
+    message = MessageResponseSchema(
+        type="change_status",
+        status="online",
+        recipient_id=1,
+        sender_id=1,
+        message="Пользователь 1 online.",
+        created_at=int(datetime.now().timestamp() * 1000),
+    )
+    for _, frame in frames_for_recipients(message, friends):
+        _ = frame.data
+
+
+async def legacy_redis_forward(payload: bytes, sockets: list[FakeWebSocket]):
+    for websocket in sockets:
+        await websocket.send_text(payload.decode("utf-8"))
+
+
+async def frame_redis_forward(payload: bytes, sockets: list[FakeWebSocket]):
+    frame = Frame(data=payload)
+    for websocket in sockets:
+        await frame.send(websocket)
+
+
+async def _measure(name: str, func, *args, rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        await func(*args)
+    elapsed = (time.perf_counter() - start) / rounds * 1_000_000
+    print(f"  {name:<10} {elapsed:10.1f} мкс")
+    return elapsed
+
+
+async def main(args: argparse.Namespace):
+    sockets = [FakeWebSocket() for _ in range(args.tabs)]
+    friends = list(range(2, args.friends + 2))
+    message = _message(2)
+    payload = Frame.from_schema(message).data
+
+    cases = [
+        (f"Сообщение в {args.tabs} вкладок", (legacy_tabs, frame_tabs), (message, sockets)),
+        (f"Статус для {args.friends} друзей", (legacy_status, frame_status), (friends,)),
+        (
+            f"Пересылка из Redis в {args.tabs} вкладок",
+            (legacy_redis_forward, frame_redis_forward),
+            (payload, sockets),
+        ),
+    ]
+    for title, (legacy, new), case_args in cases:
+        print(title)
+        before = await _measure("прежняя", legacy, *case_args, rounds=args.rounds)
+        after = await _measure("Frame", new, *case_args, rounds=args.rounds)
+        print(f"  ускорение: x{before / after:.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--tabs", type=int, default=5)
+    parser.add_argument("--friends", type=int, default=500)
+    parser.add_argument("--rounds", type=int, default=2000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,352 @@
+"""
+Генератор нагрузки WebSocket и измерение задержки доставки сообщений.
+
+Режим `remote` работает с запущенным сервером: регистрирует N пользователей через
+`/api/v1/auth/users`, получает токены, связывает пары друзей, открывает сокеты `/ws`
+и отправляет сообщения внутри пар с заданной частотой. В тексте сообщения передается
+время отправки, поэтому задержка считается на клиенте от отправки до получения.
+Для RSS сервера укажите `--server-pid` (читается /proc, только Linux).
+
+    python -m benchmarks.loadgen remote --url http://127.0.0.1:8000 --users 1000 --rate 2 --duration 30
+
+Режим `cluster` поднимает в одном процессе несколько экземпляров ConnectionManager
+(узлов) с фиктивными сокетами. Друзья пары подключены к разным узлам, поэтому каждое
+сообщение проходит межузловую доставку. Узлы связаны локальным хабом вместо Redis,
+а с `--redis` - настоящим RedisBroadcastManager. `--nodes 1` - LocalBroadcastManager.
+
+    python -m benchmarks.loadgen cluster --nodes 2 --users 1000 --rate 2 --duration 30
+    python -m benchmarks.loadgen cluster --nodes 2 --redis redis://localhost:6379/0
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+import uuid
+
+from messenger.cache import InMemoryCache
+from messenger.friendships.schemas import FriendshipEntitySchema
+from messenger.orm.session_manager import db_manager
+from messenger.settings import settings
+from messenger.sockets.frames import Frame
+from messenger.sockets.manager import (
+    BroadcastManager,
+    ConnectionManager,
+    LocalBroadcastManager,
+    RedisBroadcastManager,
+)
+from messenger.sockets.status import ClusterPresence
+from messenger.sockets.storages import NoMessagesStorage
+
+PASSWORD = "loadgen-password"
+
+
+class Report:
+    """Задержки доставки и подключения в миллисекундах."""
+
+    def __init__(self):
+        self.delivery: list[float] = []
+        self.connect: list[float] = []
+        self.sent = 0
+        self.errors = 0
+
+    def on_frame(self, payload):
+        """Учитывает полученный кадр (в том числе кадр-массив в режиме `batch`)."""
+        now = time.time_ns()
+        for item in payload if isinstance(payload, list) else [payload]:
+            if item.get("type") == "message":
+                self.delivery.append((now - int(item["message"])) / 1_000_000)
+
+    def print(self, duration: float):
+        print(f"Отправлено сообщений: {self.sent}, получено: {len(self.delivery)}, ошибок: {self.errors}")
+        print(f"Пропускная способность: {len(self.delivery) / duration:.0f} сообщений/с")
+        _print_percentiles("Задержка доставки", self.delivery)
+        _print_percentiles("Задержка подключения", self.connect)
+
+
+def _print_percentiles(title: str, values: list[float]):
+    if len(values) < 2:
+        print(f"{title}: недостаточно данных")
+        return
+    quantiles = statistics.quantiles(values, n=100, method="inclusive")
+    print(
+        f"{title}, мс: p50 {quantiles[49]:.2f}, p95 {quantiles[94]:.2f}, "
+        f"p99 {quantiles[98]:.2f}, max {max(values):.2f}"
+    )
+
+
+def _rss_mb(pid: int) -> float | None:
+    try:
+        with open(f"/proc/{pid}/status") as file:
+            for line in file:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        return None
+
+
+def _message(recipient_id: int) -> str:
+    # Время отправки передается в тексте сообщения.
+    return json.dumps(
+        {"type": "message", "status": "new", "message": str(time.time_ns()), "recipientId": recipient_id}
+    )
+
+
+async def _send_loop(send, recipient_id: int, rate: float, until: float, report: Report):
+    interval = 1 / rate
+    # Случайный сдвиг, чтобы отправители не срабатывали одновременно.
+    await asyncio.sleep(interval * (uuid.uuid4().int % 1000) / 1000)
+    while time.monotonic() < until:
+        try:
+            await send(_message(recipient_id))
+            report.sent += 1
+        except Exception:
+            report.errors += 1
+            return
+        await asyncio.sleep(interval)
+
+
+# ----------------------------------------- remote -----------------------------------------
+
+
+async def _register(client, prefix: str, index: int) -> tuple[int, str]:
+    username = f"{prefix}{index}"
+    response = await client.post(
+        "/api/v1/auth/users",
+        json={"username": username, "email": f"{username}@loadgen.example.com", "password": PASSWORD},
+    )
+    response.raise_for_status()
+    user_id = response.json()["id"]
+    response = await client.post("/api/v1/auth/token", json={"username": username, "password": PASSWORD})
+    response.raise_for_status()
+    return user_id, response.json()["accessToken"]
+
+
+async def _befriend(client, token: str, username: str):
+    response = await client.post(
+        "/api/v1/friendships", json={"username": username}, headers={"Authorization": f"Bearer {token}"}
+    )
+    response.raise_for_status()
+
+
+async def _gather_limited(coroutines, limit: int) -> list:
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(coroutine):
+        async with semaphore:
+            return await coroutine
+
+    return await asyncio.gather(*(run(coroutine) for coroutine in coroutines))
+
+
+async def run_remote(args: argparse.Namespace):
+    import httpx
+    import websockets
+
+    prefix = f"lg{uuid.uuid4().hex[:6]}u"
+    users = args.users - args.users % 2
+    ws_url = args.url.replace("http", "ws", 1).rstrip("/") + "/ws" + ("?batch=1" if args.batch else "")
+
+    async with httpx.AsyncClient(base_url=args.url, timeout=30) as client:
+        start = time.perf_counter()
+        accounts = await _gather_limited(
+            (_register(client, prefix, i) for i in range(users)), args.concurrency
+        )
+        await _gather_limited(
+            (
+                _befriend(client, accounts[i][1], f"{prefix}{i ^ 1}")
+                for i in range(users)  # Пары: 0-1, 2-3, ...
+            ),
+            args.concurrency,
+        )
+        print(f"Регистрация {users} пользователей и пар друзей: {time.perf_counter() - start:.1f} с")
+
+    report = Report()
+    rss_before = _rss_mb(args.server_pid) if args.server_pid else None
+
+    async def connect(token: str):
+        start = time.perf_counter()
+        websocket = await websockets.connect(ws_url, max_queue=None)
+        await websocket.send(token)
+        reply = json.loads(await websocket.recv())
+        if reply.get("status") != "ok":
+            raise RuntimeError(f"Ошибка авторизации сокета: {reply}")
+        report.connect.append((time.perf_counter() - start) * 1000)
+        return websocket
+
+    sockets = await _gather_limited((connect(token) for _, token in accounts), args.concurrency)
+    rss_connected = _rss_mb(args.server_pid) if args.server_pid else None
+
+    async def receive_loop(websocket):
+        try:
+            async for data in websocket:
+                report.on_frame(json.loads(data))
+        except websockets.ConnectionClosed:
+            pass
+
+    readers = [asyncio.create_task(receive_loop(websocket)) for websocket in sockets]
+    until = time.monotonic() + args.duration
+    await asyncio.gather(
+        *(
+            _send_loop(websocket.send, accounts[i ^ 1][0], args.rate, until, report)
+            for i, websocket in enumerate(sockets)
+        )
+    )
+    await asyncio.sleep(1)  # Ожидание сообщений, находящихся в пути.
+    rss_loaded = _rss_mb(args.server_pid) if args.server_pid else None
+
+    for websocket in sockets:
+        await websocket.close()
+    for reader in readers:
+        reader.cancel()
+
+    report.print(args.duration)
+    if args.server_pid:
+        print(
+            f"RSS сервера, МБ: до {rss_before}, после подключения {rss_connected}, под нагрузкой {rss_loaded}"
+        )
+
+
+# ----------------------------------------- cluster ----------------------------------------
+
+
+class HubBroadcastManager(BroadcastManager):
+    """Локальная замена Redis: узлы одного процесса пересылают кадры друг другу напрямую."""
+
+    def __init__(self, hub: dict[int, set["HubBroadcastManager"]]):
+        super().__init__()
+        self._hub = hub
+
+    async def send(self, frame: Frame, chat_id: int):
+        for node in self._hub.get(chat_id, ()):
+            if node is not self:
+                # Имитация сетевого перехода: получатель обрабатывает кадр в своей итерации цикла.
+                asyncio.get_running_loop().call_soon(
+                    node._receiver, Frame(data=frame.data, droppable=frame.droppable), chat_id
+                )
+
+    async def run_listener(self, chat_id: int):
+        self._hub.setdefault(chat_id, set()).add(self)
+
+    async def stop_listener(self, chat_id: int):
+        self._hub.get(chat_id, set()).discard(self)
+
+    async def is_connected_elsewhere(self, chat_id: int) -> bool:
+        return bool(self._hub.get(chat_id, set()) - {self})
+
+
+class FakeWebSocket:
+    def __init__(self, report: Report):
+        self._report = report
+
+    async def send_text(self, data: str):
+        self._report.on_frame(json.loads(data))
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+def _broadcast_managers(args: argparse.Namespace) -> list[BroadcastManager]:
+    if args.nodes == 1:
+        return [LocalBroadcastManager()]
+    if args.redis:
+        from redis.asyncio import Redis
+
+        redis = Redis.from_url(args.redis)
+        run = uuid.uuid4().hex[:6]
+        return [
+            RedisBroadcastManager(
+                redis,
+                ClusterPresence(redis, node_id=f"loadgen-{run}-{node}", node_ttl=settings.node_ttl),
+                heartbeat_interval=settings.node_heartbeat_interval,
+            )
+            for node in range(args.nodes)
+        ]
+    hub: dict[int, set[HubBroadcastManager]] = {}
+    return [HubBroadcastManager(hub) for _ in range(args.nodes)]
+
+
+async def run_cluster(args: argparse.Namespace):
+    # Списки друзей берутся из кеша, база данных не используется.
+    db_manager.init("sqlite+aiosqlite:///:memory:")
+    cache = InMemoryCache()  # Общий кеш узлов, как Redis в реальном кластере.
+    users = args.users - args.users % 2
+    for user_id in range(1, users + 1):
+        friend_id = ((user_id - 1) ^ 1) + 1
+        await cache.set(
+            f"user_friendships:{user_id}",
+            [FriendshipEntitySchema(id=friend_id, type="user", username=f"user{friend_id}")],
+            expire=-1,
+        )
+
+    # ConnectionManager - синглтон, поэтому узлы создаются через исходный класс.
+    nodes = [
+        ConnectionManager.__wrapped__(broadcast, NoMessagesStorage(), cache)
+        for broadcast in _broadcast_managers(args)
+    ]
+
+    report = Report()
+    rss_before = _rss_mb(os.getpid())
+    connections = []
+    for user_id in range(1, users + 1):
+        node = nodes[user_id % len(nodes)]  # Друзья пары оказываются на разных узлах.
+        start = time.perf_counter()
+        connections.append((node, await node.connect(FakeWebSocket(report), user_id)))
+        report.connect.append((time.perf_counter() - start) * 1000)
+    rss_connected = _rss_mb(os.getpid())
+
+    def sender(node: ConnectionManager, user_id: int):
+        async def send(data: str):
+            await node.analyze_message(data, user_id)
+
+        return send
+
+    until = time.monotonic() + args.duration
+    cpu_start = time.process_time()
+    await asyncio.gather(
+        *(
+            _send_loop(
+                sender(node, connection.user_id), ((connection.user_id - 1) ^ 1) + 1, args.rate, until, report
+            )
+            for node, connection in connections
+        )
+    )
+    await asyncio.sleep(0.5)
+    cpu_used = time.process_time() - cpu_start
+
+    for node, connection in connections:
+        await node.disconnect(connection)
+
+    print(f"Узлов: {args.nodes}, пользователей: {users}")
+    report.print(args.duration)
+    print(f"CPU: {cpu_used:.2f} с ({cpu_used / args.duration * 100:.0f}% ядра)")
+    print(
+        f"RSS процесса, МБ: до {rss_before}, после подключения {rss_connected}, итог {_rss_mb(os.getpid())}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    subparsers = parser.add_subparsers(dest="mode", required=True)
+
+    remote = subparsers.add_parser("remote", help="нагрузка на запущенный сервер")
+    remote.add_argument("--url", default="http://127.0.0.1:8000")
+    remote.add_argument("--server-pid", type=int, help="PID процесса uvicorn для измерения RSS")
+    remote.add_argument("--concurrency", type=int, default=50, help="одновременных регистраций и подключений")
+    remote.add_argument("--batch", action="store_true", help="подключаться к /ws?batch=1")
+
+    cluster = subparsers.add_parser("cluster", help="несколько узлов в одном процессе")
+    cluster.add_argument("--nodes", type=int, default=2)
+    cluster.add_argument("--redis", help="URL Redis для RedisBroadcastManager вместо локального хаба")
+
+    for subparser in (remote, cluster):
+        subparser.add_argument("--users", type=int, default=100, help="количество пользователей (четное)")
+        subparser.add_argument("--rate", type=float, default=1, help="сообщений в секунду от каждого")
+        subparser.add_argument("--duration", type=float, default=10, help="длительность нагрузки, секунды")
+
+    arguments = parser.parse_args()
+    asyncio.run(run_remote(arguments) if arguments.mode == "remote" else run_cluster(arguments))
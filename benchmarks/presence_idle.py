@@ -0,0 +1,109 @@
+"""
+Стоимость присутствия пользователей в простое.
+
+Подключает N пользователей к :class:`PresenceEngine` и измеряет процессорное время
+процесса за время простоя. Для сравнения выполняет один проход прежнего цикла,
+который каждые 5 секунд отмечал всех пользователей online и рассылал статус друзьям.
+
+    python -m benchmarks.presence_idle --users 50000 --friends 50 --idle 60
+"""
+
+import argparse
+import asyncio
+import time
+from datetime import datetime
+
+from messenger.cache import InMemoryCache
+from messenger.friendships.schemas import FriendshipEntitySchema
+from messenger.settings import settings
+from messenger.sockets.frames import Frame
+from messenger.sockets.presence import PresenceEngine
+from messenger.sockets.schemas import MessageResponseSchema
+from messenger.sockets.status import is_user_online, set_user_online
+
+LEGACY_INTERVAL = 5
+
+
+async def _legacy_pass(cache: InMemoryCache, users: int):
+    """Один проход прежнего `_check_user_online_status`."""
+    for user_id in range(1, users + 1):
+        await set_user_online(user_id, cache)
+        friendships: list[FriendshipEntitySchema] = await cache.get(f"user_friendships:{user_id}")
+        for friendship in friendships:
+            if await is_user_online(friendship.id, cache):
+                message = MessageResponseSchema(
+                    type="change_status",
+                    status="online",
+                    recipient_id=friendship.id,
+                    sender_id=user_id,
+                    message=f"Пользователь {user_id} online.",
+                    created_at=int(datetime.now().timestamp() * 1000),
+                )
+                Frame.from_schema(message)
+
+
+async def main(args: argparse.Namespace):
+    cache = InMemoryCache()
+    notifications = 0
+
+    async def notify(user_id: int, status: str):
+        nonlocal notifications
+        notifications += 1
+
+    async def is_connected_elsewhere(user_id: int) -> bool:
+        return False
+
+    engine = PresenceEngine(
+        cache,
+        notify=notify,
+        is_connected_elsewhere=is_connected_elsewhere,
+        ttl=settings.presence_ttl,
+        heartbeat_interval=args.heartbeat,
+        offline_delay=settings.presence_offline_delay,
+    )
+    engine.start()
+
+    start = time.perf_counter()
+    for user_id in range(1, args.users + 1):
+        await engine.connected(user_id)
+    print(f"Подключение {args.users} пользователей: {time.perf_counter() - start:.2f} с")
+    print(f"Событий online при подключении: {notifications}")
+
+    notifications = 0
+    cpu_start = time.process_time()
+    await asyncio.sleep(args.idle)
+    cpu_used = time.process_time() - cpu_start
+    print(
+        f"PresenceEngine: CPU за {args.idle} с простоя: {cpu_used:.3f} с ({cpu_used / args.idle * 100:.2f}% ядра)"
+    )
+    print(f"Событий за время простоя: {notifications}")
+
+    if args.friends:
+        for user_id in range(1, args.users + 1):
+            friends = [(user_id + i) % args.users + 1 for i in range(args.friends)]
+            await cache.set(
+                f"user_friendships:{user_id}",
+                [
+                    FriendshipEntitySchema(id=friend, type="user", username=f"user{friend}")
+                    for friend in friends
+                ],
+                expire=-1,
+            )
+        cpu_start = time.process_time()
+        await _legacy_pass(cache, args.users)
+        cpu_used = time.process_time() - cpu_start
+        print(
+            f"Прежний цикл: один проход {cpu_used:.2f} с CPU "
+            f"({cpu_used / LEGACY_INTERVAL * 100:.0f}% ядра при запуске каждые {LEGACY_INTERVAL} с)"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--users", type=int, default=50000)
+    parser.add_argument("--friends", type=int, default=50, help="0 - не запускать прежний цикл")
+    parser.add_argument("--idle", type=float, default=60)
+    parser.add_argument("--heartbeat", type=int, default=settings.presence_heartbeat_interval)
+    asyncio.run(main(parser.parse_args()))
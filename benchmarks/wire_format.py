@@ -0,0 +1,68 @@
+"""
+Сравнение форматов WebSocket: JSON и подпротокол `msgpack.v1`.
+
+Выводит размер сообщения на проводе и время кодирования/декодирования одного сообщения.
+
+    python -m benchmarks.wire_format --rounds 20000
+"""
+
+import argparse
+import json
+import time
+from datetime import datetime
+
+from messenger.sockets.codecs import JsonCodec, MsgpackCodec
+from messenger.sockets.frames import Frame, pack_compact
+from messenger.sockets.schemas import MessageResponseSchema
+
+
+def _measure(func, rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func()
+    return (time.perf_counter() - start) / rounds * 1_000_000
+
+
+def main(args: argparse.Namespace):
+    message = MessageResponseSchema(
+        type="message",
+        status="new",
+        message=args.text,
+        recipient_id=123456,
+        sender_id=654321,
+        created_at=int(datetime.now().timestamp() * 1000),
+    )
+    request = {"type": "message", "status": "new", "message": args.text, "recipientId": 123456}
+    json_request = json.dumps(request).encode("utf-8")
+    packed_request = pack_compact(request)
+
+    frame = Frame.from_schema(message)
+
+    print(f"{'':<10}{'байт':>8}{'кодирование, мкс':>20}{'декодирование, мкс':>22}")
+    rows = [
+        (
+            "JSON",
+            len(frame.data),
+            _measure(lambda: Frame.from_schema(message).data, args.rounds),
+            _measure(lambda: JsonCodec().decode_request(json_request), args.rounds),
+        ),
+        (
+            "msgpack",
+            len(frame.packed),
+            _measure(lambda: Frame.from_schema(message).packed, args.rounds),
+            _measure(lambda: MsgpackCodec().decode_request(packed_request), args.rounds),
+        ),
+    ]
+    for name, size, encode, decode in rows:
+        print(f"{name:<10}{size:>8}{encode:>20.2f}{decode:>22.2f}")
+
+    print(f"Запрос клиента: JSON {len(json_request)} байт, msgpack {len(packed_request)} байт")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--rounds", type=int, default=20000)
+    parser.add_argument("--text", default="Привет! Как дела?")
+    main(parser.parse_args())
@@ -0,0 +1,117 @@
+"""
+Пропускная способность доставки сообщений при нескольких воркерах на одном хосте.
+
+Запускает N процессов с ConnectionManager и HostBroadcastManager (Unix сокеты),
+подключает к ним фиктивные сокеты пользователей и отправляет сообщения случайным
+получателям без пауз. Получатель находится на другом воркере с вероятностью (N-1)/N.
+Выводит суммарное количество доставленных сообщений в секунду и задержку доставки.
+
+    python -m benchmarks.workers --workers 1 2 4 8 --users 2000 --senders 50 --duration 10
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.loadgen import Report, _print_percentiles
+
+
+def _worker(index: int, args: argparse.Namespace, workers: int, ipc_dir: str, barrier, results):
+    from messenger.cache import InMemoryCache
+    from messenger.orm.session_manager import db_manager
+    from messenger.sockets.ipc import HostBroadcastManager
+    from messenger.sockets.manager import ConnectionManager, LocalBroadcastManager
+    from messenger.sockets.storages import NoMessagesStorage
+
+    class FakeWebSocket:
+        def __init__(self, report: Report):
+            self._report = report
+
+        async def send_text(self, data: str):
+            self._report.on_frame(json.loads(data))
+
+    async def main():
+        db_manager.init("sqlite+aiosqlite:///:memory:")
+        cache = InMemoryCache()
+        users = [user_id for user_id in range(1, args.users + 1) if user_id % workers == index]
+        for user_id in users:
+            await cache.set(f"user_friendships:{user_id}", [], expire=-1)
+
+        broadcast = HostBroadcastManager(LocalBroadcastManager(), node_id=f"worker-{index}", ipc_dir=ipc_dir)
+        manager = ConnectionManager.__wrapped__(broadcast, NoMessagesStorage(), cache)
+        report = Report()
+        for user_id in users:
+            await manager.connect(FakeWebSocket(report), user_id)
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, barrier.wait)
+        await asyncio.sleep(1)  # Воркеры обмениваются списками пользователей.
+        await loop.run_in_executor(None, barrier.wait)
+
+        until = time.monotonic() + args.duration
+
+        async def sender(user_id: int):
+            while time.monotonic() < until:
+                recipient = random.randint(1, args.users)
+                data = json.dumps(
+                    {
+                        "type": "message",
+                        "status": "new",
+                        "message": str(time.time_ns()),
+                        "recipientId": recipient,
+                    }
+                )
+                await manager.analyze_message(data, user_id)
+                report.sent += 1
+                await asyncio.sleep(0)
+
+        await asyncio.gather(*(sender(random.choice(users)) for _ in range(args.senders)))
+        await asyncio.sleep(1)  # Ожидание сообщений, находящихся в пути.
+        delivery = report.delivery
+        results.put((report.sent, len(delivery), random.sample(delivery, min(len(delivery), 20000))))
+        await loop.run_in_executor(None, barrier.wait)
+
+    asyncio.run(main())
+
+
+def run(args: argparse.Namespace, workers: int):
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+    with tempfile.TemporaryDirectory() as ipc_dir:
+        processes = [
+            context.Process(target=_worker, args=(index, args, workers, ipc_dir, barrier, results))
+            for index in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        collected = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+
+    sent = sum(item[0] for item in collected)
+    received = sum(item[1] for item in collected)
+    latencies = [value for item in collected for value in item[2]]
+    print(
+        f"Воркеров: {workers}, отправлено: {sent}, доставлено: {received} ({received / args.duration:.0f}/с)"
+    )
+    _print_percentiles("  Задержка доставки", latencies)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--senders", type=int, default=50, help="одновременных отправителей на воркер")
+    parser.add_argument("--duration", type=float, default=10)
+    arguments = parser.parse_args()
+    print(f"Процессорных ядер: {os.cpu_count()}")
+    for count in arguments.workers:
+        run(arguments, count)
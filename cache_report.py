@@ -0,0 +1,34 @@
+"""
+Отчет о памяти кеша по пространствам имен.
+
+Для каждого пространства имен (часть ключа до ":") выводит количество ключей,
+занимаемый объем и количество ключей без времени жизни.
+
+    python cache_report.py --sort keys
+"""
+
+import argparse
+import asyncio
+
+from messenger.cache import get_cache
+
+
+async def main(args: argparse.Namespace):
+    report = await get_cache().memory_report()
+    rows = sorted(report.items(), key=lambda item: item[1][args.sort], reverse=True)
+    total = sum(usage["bytes"] for usage in report.values()) or 1
+
+    print(f"{'Пространство имен':<32}{'Ключей':>10}{'МБ':>10}{'Доля':>8}{'Без TTL':>10}")
+    for namespace, usage in rows:
+        print(
+            f"{namespace:<32}{usage['keys']:>10}{usage['bytes'] / 1024 / 1024:>10.2f}"
+            f"{usage['bytes'] / total:>8.1%}{usage['no_ttl']:>10}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--sort", choices=["bytes", "keys", "no_ttl"], default="bytes")
+    asyncio.run(main(parser.parse_args()))
@@ -10,6 +10,12 @@ export interface ChatMessageType {
     message: string
 }
 
+export interface ChatMessagesPageType {
+    messages: ChatMessageType[]
+    nextCursor: string | null
+    prevCursor: string | null
+}
+
 export interface RequestMessageType {
     type: string
     status: string
@@ -37,10 +43,12 @@ export async function handleMessage(data: any): Promise<ResponseMessageType> {
 export class ChatService {
     private _chats: Ref<Map<number, ChatMessageType[]>>
     private _lastReadTimes: Map<number, number>
+    private _nextCursors: Map<number, string | null>
 
     constructor() {
         this._chats = ref(new Map());
         this._lastReadTimes = new Map();
+        this._nextCursors = new Map();
     }
 
     get chats() {
@@ -59,19 +67,25 @@ export class ChatService {
         const {data} = await api.get<{timestamp: number}>("/chats/"+chat_id+"/lastRead");
         this._lastReadTimes.set(chat_id, data.timestamp);
 
-        let response = await api.get<ChatMessageType[]>("/chats/"+chat_id+"/lastMessages");
+        const response = await api.get<ChatMessagesPageType>("/chats/"+chat_id+"/messages");
 
-        this.chats.set(chat_id, response.data);
-        return response.data;
+        this._nextCursors.set(chat_id, response.data.nextCursor);
+        this.chats.set(chat_id, response.data.messages);
+        return response.data.messages;
     }
 
-    async getChatMessages(chat_id: number, timeTo: number, limit: number = 100): Promise<ChatMessageType[]> {
-        const {data} = await api.get<ChatMessageType[]>(
-            "/chats/"+chat_id+"/lastMessages",
-            {params: {timeTo: timeTo, limit: limit, withUnread: false}}
+    async getChatMessages(chat_id: number, limit: number = 100): Promise<ChatMessageType[]> {
+        // Более ранние сообщения загружаются по курсору, пока не дойдем до начала переписки.
+        const cursor = this._nextCursors.get(chat_id);
+        if (!cursor) return [];
+
+        const {data} = await api.get<ChatMessagesPageType>(
+            "/chats/"+chat_id+"/messages",
+            {params: {before: cursor, limit: limit}}
         );
 
-        return data;
+        this._nextCursors.set(chat_id, data.nextCursor);
+        return data.messages;
     }
 
     async getLastReadTime(chat_id: number): Promise<number> {
@@ -8,12 +8,16 @@ from messenger.friendships.handlers import router as friendships_router
 from messenger.orm.session_manager import db_manager
 from messenger.settings import settings
 from messenger.sockets.handlers import router as sockets_router
+from messenger.sockets.manager import drain_connections, install_drain_signal_handler
 
 
 @asynccontextmanager
 async def startup(app_instance: FastAPI):
     db_manager.init(settings.database_url, pool_size=settings.database_max_connections)
+    install_drain_signal_handler()
     yield
+    # Оставшиеся сокеты закрываются сразу, принятые сообщения сохраняются.
+    await drain_connections(window=0)
     await db_manager.close()
 
 
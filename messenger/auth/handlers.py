@@ -1,16 +1,18 @@
-from fastapi import Depends
+from fastapi import Depends, HTTPException
 from fastapi.routing import APIRouter
 from sqlalchemy.ext.asyncio import AsyncSession
+from starlette import status
 
 from .jwt import create_jwt_token_pair, refresh_access_token
-from .models import User
-from .users import create_user, get_user_by_credentials, get_current_user
+from .users import create_user, get_user_by_credentials, get_current_user, deactivate_user
+from ..cache import AbstractCache, get_cache
 from ..orm.session_manager import get_session
 from .schemas import (
     TokenPair,
     RefreshToken,
     AccessToken,
     UserSchema,
+    CurrentUserSchema,
     UserCreateSchema,
     UserCredentialsSchema,
 )
@@ -38,6 +40,19 @@ def refresh_token(token: RefreshToken):
 
 
 @router.get("/myself", response_model=UserSchema)
-def verify_jwt(user: User = Depends(get_current_user)):
+def verify_jwt(user: CurrentUserSchema = Depends(get_current_user)):
     """Проверка JWT"""
     return user
+
+
+@router.post("/users/{user_id}/deactivate", status_code=204)
+async def deactivate_user_api_view(
+    user_id: int,
+    user: CurrentUserSchema = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session),
+    cache: AbstractCache = Depends(get_cache),
+):
+    """Деактивация пользователя, его токены перестают приниматься"""
+    if not user.is_staff:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Недостаточно прав")
+    await deactivate_user(session, user_id, cache)
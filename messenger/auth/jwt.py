@@ -1,4 +1,7 @@
+import hashlib
 import os
+import time
+from collections import OrderedDict
 from datetime import timedelta, datetime, UTC
 
 from fastapi import HTTPException
@@ -50,6 +53,52 @@ def refresh_access_token(refresh_token: str) -> str:
     )
 
 
+class _VerifiedTokens:
+    """
+    LRU проверенных access токенов: SHA-256 токена -> (идентификатор пользователя, exp).
+    Запись действительна до истечения токена, сами токены в памяти не хранятся.
+    """
+
+    def __init__(self, max_size: int):
+        self._max_size = max_size
+        self._tokens: OrderedDict[bytes, tuple[int, float]] = OrderedDict()
+
+    def get(self, token: str) -> int | None:
+        key = hashlib.sha256(token.encode("utf-8")).digest()
+        item = self._tokens.get(key)
+        if item is None:
+            return None
+        if item[1] <= time.time():
+            del self._tokens[key]
+            return None
+        self._tokens.move_to_end(key)
+        return item[0]
+
+    def set(self, token: str, user_id: int, expires: float):
+        if self._max_size <= 0:
+            return
+        self._tokens[hashlib.sha256(token.encode("utf-8")).digest()] = (user_id, expires)
+        if len(self._tokens) > self._max_size:
+            self._tokens.popitem(last=False)
+
+
+_verified_tokens = _VerifiedTokens(settings.auth_token_cache_size)
+
+
+def get_access_token_user_id(token: str) -> int:
+    """
+    Возвращает идентификатор пользователя из access токена.
+    Подпись токена проверяется только при первом обращении.
+
+    :raises InvalidAccessTokenException: Если токен недействителен.
+    """
+    if (user_id := _verified_tokens.get(token)) is not None:
+        return user_id
+    payload = _get_token_payload(token, "access")
+    _verified_tokens.set(token, payload[USER_IDENTIFIER], payload["exp"])
+    return payload[USER_IDENTIFIER]
+
+
 def _create_jwt_token(data: dict, delta: timedelta) -> str:
     """
     Создает JWT токен.
@@ -29,6 +29,12 @@ class UserSchema(CamelSerializerModel):
     date_join: datetime
 
 
+class CurrentUserSchema(UserSchema):
+    """Аутентифицированный пользователь, хранится в кеше вместо объекта модели."""
+
+    is_active: bool
+
+
 class UserCredentialsSchema(CamelAliasModel):
     username: str = Field(..., max_length=150)
     password: str = Field(..., max_length=128)
@@ -6,55 +6,93 @@ from sqlalchemy.exc import NoResultFound, IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from .models import User
-from ..orm.session_manager import get_session
-from .schemas import UserCreateSchema
+from ..cache import AbstractCache, get_cache
+from ..orm.session_manager import db_manager
+from ..settings import settings
+from .schemas import UserCreateSchema, CurrentUserSchema
 from .encrypt import encrypt_password, validate_password
 from .exc import CredentialsException
-from .jwt import oauth2_scheme, _get_token_payload, USER_IDENTIFIER
+from .jwt import oauth2_scheme, get_access_token_user_id
 
 
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
-    session: AsyncSession = Depends(get_session, use_cache=True),
-) -> User:
+    cache: AbstractCache = Depends(get_cache),
+) -> CurrentUserSchema:
     """
     Получение текущего пользователя по токену аутентификации.
 
+    Подпись токена проверяется один раз, а данные пользователя берутся из кеша,
+    поэтому обычно обращения к базе не требуется. При промахе кеша открывается
+    отдельная короткая сессия, которая закрывается сразу после запроса.
+
     :param token: Токен пользователя.
-    :param session: :class:`AsyncSession` объект сессии.
-    :return: Объект пользователя :class:`User`.
-    :raises CredentialsException: Если пользователь не найден.
+    :param cache: Кеш данных пользователей.
+    :return: Объект пользователя :class:`CurrentUserSchema`.
+    :raises CredentialsException: Если пользователь не найден или деактивирован.
     """
-    payload = _get_token_payload(token, "access")
-    try:
-        user = await User.get(session, id=payload[USER_IDENTIFIER])
-    except NoResultFound:
-        raise CredentialsException
+    user_id = get_access_token_user_id(token)
+    key = _auth_user_cache_key(user_id)
+    user: CurrentUserSchema | None = await cache.get(key)
+    if user is None:
+        async with db_manager.session() as session:
+            try:
+                user_model = await User.get(session, id=user_id)
+            except NoResultFound:
+                raise CredentialsException
+        user = CurrentUserSchema.model_validate(user_model)
+        await cache.set(key, user, expire=settings.auth_user_cache_ttl)
 
+    if not user.is_active:
+        raise CredentialsException
     return user
 
 
 async def get_user_or_none(
     authorization: Optional[str] = Header(None),
-    session: AsyncSession = Depends(get_session, use_cache=True),
-) -> User | None:
+    cache: AbstractCache = Depends(get_cache),
+) -> CurrentUserSchema | None:
     """
     Получение текущего пользователя по токену аутентификации.
 
     :param authorization: Значение заголовка HTTP (Authorization).
-    :param session: :class:`AsyncSession` объект сессии.
-    :return: Объект пользователя :class:`User` или :class:`None`.
-    :raises CredentialsException: Если пользователь не найден.
+    :param cache: Кеш данных пользователей.
+    :return: Объект пользователя :class:`CurrentUserSchema` или :class:`None`.
     """
     if authorization:
         if token_match := re.match(r"Bearer (\S+)", authorization):
             try:
-                return await get_current_user(token_match.group(1), session)
+                return await get_current_user(token_match.group(1), cache)
             except HTTPException:
                 return None
     return None
 
 
+async def deactivate_user(session: AsyncSession, user_id: int, cache: AbstractCache) -> None:
+    """
+    Деактивирует пользователя и удаляет его данные из кеша аутентификации,
+    после чего его токены перестают приниматься.
+
+    :raises HTTPException: Если пользователь не найден.
+    """
+    try:
+        user_model = await User.get(session, id=user_id)
+    except NoResultFound:
+        raise HTTPException(status_code=404, detail="Пользователь не найден")
+    user_model.is_active = False
+    await session.commit()
+    await invalidate_auth_user(user_id, cache)
+
+
+async def invalidate_auth_user(user_id: int, cache: AbstractCache) -> None:
+    """Удаляет данные пользователя из кеша аутентификации после их изменения."""
+    await cache.delete(_auth_user_cache_key(user_id))
+
+
+def _auth_user_cache_key(user_id: int) -> str:
+    return f"auth_user:{user_id}"
+
+
 async def create_user(session: AsyncSession, user: UserCreateSchema) -> User:
     obj = User(
         username=user.username,
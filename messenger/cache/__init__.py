@@ -2,14 +2,35 @@ from ..settings import settings
 from .base import AbstractCache
 from .local import InMemoryCache
 from .redis import RedisCache
+from .serializers import CacheSerializer, get_serializer
+from .tiered import TieredCache
 
 
 def get_cache() -> AbstractCache:
     """Возвращает кэш в зависимости от настроек приложения"""
     if settings.redis_cache_url:
-        return RedisCache(
+        cache = RedisCache(
             url=settings.redis_cache_url,
             max_connections=settings.redis_cache_max_connections,
+            serializer=get_serializer(settings.cache_serializer, settings.cache_compress_threshold),
+            generation_refresh=settings.cache_generation_refresh,
+            max_value_size=settings.cache_max_value_size,
+            namespace_ttls=settings.cache_namespace_ttls_dict,
         )
+        if settings.cache_local_namespaces:
+            return TieredCache(
+                cache,
+                url=settings.redis_cache_url,
+                namespaces=settings.cache_local_namespaces_dict,
+                max_size=settings.cache_local_max_size,
+                node_id=settings.node_id,
+                serializer=get_serializer(settings.cache_serializer, settings.cache_compress_threshold),
+            )
+        return cache
     else:
-        return InMemoryCache()
+        return InMemoryCache(
+            max_entries=settings.cache_memory_max_entries,
+            max_bytes=settings.cache_memory_max_bytes,
+            serializer=get_serializer(settings.cache_serializer, settings.cache_compress_threshold),
+            max_value_size=settings.cache_max_value_size,
+        )
@@ -1,3 +1,4 @@
+import re
 from abc import ABC, abstractmethod
 from typing import Optional, Any
 
@@ -20,7 +21,90 @@ class AbstractCache(ABC):
         """Удаляет значение из кеша по ключу."""
         pass
 
+    async def set_if_absent(self, key: str, value: Any, expire: int) -> bool:
+        """Записывает значение, только если ключа нет в кеше. Возвращает True, если значение записано."""
+        if await self.get(key) is not None:
+            return False
+        await self.set(key, value, expire)
+        return True
+
+    async def get_many(self, keys: list[str]) -> list[Optional[Any]]:
+        """Получает значения нескольких ключей, порядок значений соответствует `keys`."""
+        return [await self.get(key) for key in keys]
+
+    async def set_many(self, values: dict[str, Any], expire: int) -> None:
+        """Записывает несколько значений с одинаковым таймаутом."""
+        for key, value in values.items():
+            await self.set(key, value, expire)
+
+    async def delete_many(self, keys: list[str]) -> None:
+        """Удаляет несколько ключей."""
+        for key in keys:
+            await self.delete(key)
+
+    async def get_counters(self, keys: list[str]) -> list[tuple[Optional[int], int]]:
+        """
+        Получает целочисленные счетчики и номера их версий (см. :meth:`invalidate_counters`).
+        Отсутствующий счетчик - None, версия счетчика, который ни разу не сбрасывался, - 0.
+        """
+        values = await self.get_many([*keys, *map(self._counter_version_key, keys)])
+        return [(value, version or 0) for value, version in zip(values[: len(keys)], values[len(keys) :])]
+
+    async def set_counters(
+        self, values: dict[str, int], expire: int, versions: Optional[dict[str, int]] = None
+    ) -> None:
+        """
+        Записывает целочисленные счетчики.
+        Если переданы версии, полученные :meth:`get_counters` до вычисления значений, записываются
+        только счетчики, которые с тех пор не сбрасывались: иначе значение уже устарело.
+
+        Реализация по умолчанию атомарна только для кеша, операции которого не прерываются
+        (в памяти процесса), RedisCache проверяет версии скриптом.
+        """
+        if versions is not None:
+            current = await self.get_many([self._counter_version_key(key) for key in values])
+            values = {
+                key: value
+                for (key, value), version in zip(values.items(), current)
+                if (version or 0) == versions[key]
+            }
+        await self.set_many(values, expire)
+
+    async def invalidate_counters(self, keys: list[str], expire: int) -> None:
+        """
+        Удаляет счетчики и увеличивает номера их версий, которые хранятся `expire` секунд.
+        Значение, вычисленное до сброса, после него не записывается (см. :meth:`set_counters`).
+        """
+        version_keys = [self._counter_version_key(key) for key in keys]
+        versions = await self.get_many(version_keys)
+        await self.set_many({key: (version or 0) + 1 for key, version in zip(version_keys, versions)}, expire)
+        await self.delete_many(keys)
+
+    @staticmethod
+    def _counter_version_key(key: str) -> str:
+        return f"{key}:version"
+
     @abstractmethod
     async def delete_namespace(self, prefix: str) -> None:
         """Удаляет все ключи с указанным префиксом"""
         pass
+
+    async def memory_report(self) -> dict[str, dict]:
+        """
+        Занимаемая кешем память по пространствам имен: название -> количество ключей (`keys`),
+        объем в байтах (`bytes`) и количество ключей без времени жизни (`no_ttl`).
+        """
+        return {}
+
+    @staticmethod
+    def _report_namespace(key: str) -> str:
+        """Пространство имен ключа для отчета :meth:`memory_report`."""
+        namespace, separator, _ = key.partition(":")
+        if separator:
+            return namespace.partition("@")[0]
+        # Ключи без пространства имен (например, "{user_id}_online") группируются по шаблону.
+        return re.sub(r"\d+", "*", key)
+
+    def stats(self) -> dict:
+        """Статистика работы кеша."""
+        return {}
@@ -1,47 +1,119 @@
-from functools import wraps
+import asyncio
+import inspect
+import math
+import random
+import time
+from asyncio import Task
+from functools import wraps, partial
+from logging import getLogger
 from typing import Optional, Callable, Any
 
 from . import get_cache
 
+logger = getLogger(__name__)
+
 
 def cached(
     timeout: int,
     key: Optional[str] = None,
     variable_positions: Optional[list[int]] = None,
     delimiter: str = ":",
+    variables: Optional[list[str]] = None,
+    soft_timeout: Optional[int] = None,
+    negative_timeout: Optional[int] = None,
+    jitter: float = 0.1,
+    lock_timeout: float = 0,
 ) -> Callable[..., Any]:
     """
     Декоратор кэширования функции.
 
+    Одновременные вызовы с одним ключом при промахе ожидают одно вычисление. Если указан
+    `soft_timeout`, после него значение считается устаревшим: вызов сразу получает его, а новое
+    вычисляется в фоне. Результат `None` тоже кэшируется (на `negative_timeout` секунд).
+    Время жизни уменьшается на случайную долю до `jitter`, чтобы ключи не истекали одновременно.
+
     :param timeout: Время жизни кэш.
     :param key: Ключ кэша, если не указан будет взято имя функции.
-    :param variable_positions: Список позиций аргументов, которые будут добавлены в ключ через str().
+    :param variable_positions: Список позиций аргументов (с 1), которые будут добавлены в ключ через str().
     :param delimiter: Разделитель позиций аргументов.
+    :param variables: Названия аргументов, которые будут добавлены в ключ (вместо позиций).
+    :param soft_timeout: Время, после которого значение обновляется в фоне.
+    :param negative_timeout: Время жизни результата `None`, по умолчанию как `timeout`.
+    :param jitter: Максимальная доля, на которую уменьшается время жизни.
+    :param lock_timeout: Если больше 0, при промахе узлы кластера ожидают вычисление на одном из них,
+        но не дольше `lock_timeout` секунд.
 
     :return: Декоратор функции.
     """
 
     def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
-        @wraps(func)
-        async def wrapper(*args: Any, **kwargs: Any) -> Any:
-            cache_key: str = key if key is not None else func.__name__
+        signature = inspect.signature(func)
+        parameters = list(signature.parameters)
+        names = list(variables or [])
+        # Позиции переводятся в названия, поэтому ключ не зависит от способа передачи аргументов.
+        names += [parameters[pos - 1] for pos in variable_positions or []]
+        inflight: dict[str, Task] = {}
+
+        def build_key(args: tuple, kwargs: dict) -> str:
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            cache_key = key if key is not None else func.__name__
+            for name in names:
+                cache_key += delimiter + str(bound.arguments[name])
+            return cache_key
 
-            # Добавляем в название ключа значение аргументов
-            if variable_positions is not None:
-                for pos in variable_positions:
-                    if len(args) >= pos:
-                        cache_key += delimiter + str(args[pos - 1])
-                    elif len(kwargs) >= pos - len(args):
-                        values = list(kwargs.values())
-                        cache_key += delimiter + str(values[pos - len(args) - 1])
+        def ttl(seconds: Optional[int]) -> int:
+            if seconds is None or seconds <= 0:
+                return -1
+            return max(1, round(seconds * (1 - random.uniform(0, jitter))))
 
+        async def compute(cache_key: str, args: tuple, kwargs: dict) -> Any:
             cache = get_cache()
-            value = await cache.get(cache_key)
-            if value is not None:
+            lock_key = f"lock:{cache_key}"
+            locked = lock_timeout > 0 and await cache.set_if_absent(lock_key, True, math.ceil(lock_timeout))
+            if lock_timeout > 0 and not locked:
+                # Значение вычисляет другой узел, после `lock_timeout` вычисляем сами.
+                deadline = time.monotonic() + lock_timeout
+                while time.monotonic() < deadline:
+                    await asyncio.sleep(0.05)
+                    if (entry := await cache.get(cache_key)) is not None:
+                        return entry[0]
+
+            try:
+                value = await func(*args, **kwargs)
+                soft_expires = time.time() + ttl(soft_timeout) if soft_timeout else None
+                expire = ttl(negative_timeout if value is None and negative_timeout is not None else timeout)
+                await cache.set(cache_key, (value, soft_expires), expire)
+                return value
+            finally:
+                if locked:
+                    await cache.delete(lock_key)
+
+        def log_error(cache_key: str, task: Task):
+            if not task.cancelled() and task.exception() is not None:
+                logger.error(f"Не удалось обновить значение кеша {cache_key}: {task.exception()!r}")
+
+        def single_flight(cache_key: str, args: tuple, kwargs: dict, background: bool = False) -> Task:
+            task = inflight.get(cache_key)
+            if task is None:
+                task = inflight[cache_key] = asyncio.create_task(compute(cache_key, args, kwargs))
+                task.add_done_callback(lambda _: inflight.pop(cache_key, None))
+                if background:
+                    # Исключение фонового обновления некому получить.
+                    task.add_done_callback(partial(log_error, cache_key))
+            return task
+
+        @wraps(func)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            cache_key = build_key(args, kwargs)
+            # Значение хранится вместе со временем устаревания, поэтому `None` отличается от промаха.
+            entry = await get_cache().get(cache_key)
+            if entry is not None:
+                value, soft_expires = entry
+                if soft_expires is not None and soft_expires < time.time():
+                    single_flight(cache_key, args, kwargs, background=True)
                 return value
-            value = await func(*args, **kwargs)
-            await cache.set(cache_key, value, timeout)
-            return value
+            return await asyncio.shield(single_flight(cache_key, args, kwargs))
 
         return wrapper
 
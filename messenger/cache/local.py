@@ -1,50 +1,194 @@
-import pickle
-from datetime import datetime, timedelta
-from typing import TypedDict, Any, Optional
+import asyncio
+import heapq
+import sys
+import time
+from asyncio import Task
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Any, Optional
 
 from .base import AbstractCache
+from .serializers import CacheSerializer, get_serializer
 from ..deco import singleton
 
-
 # from loguru import logger
 
+# Значения этих типов нельзя изменить, поэтому они хранятся без сериализации.
+_IMMUTABLE_TYPES = (str, bytes, int, float, bool, type(None), datetime, date, timedelta, Decimal)
+
+
+class _Entry:
+    __slots__ = ("data", "serialized", "size", "expires")
 
-class _ValueType(TypedDict):
-    data: Any
-    expires: datetime
+    def __init__(self, data: Any, serialized: bool, size: int, expires: float | None):
+        self.data = data
+        self.serialized = serialized
+        self.size = size
+        self.expires = expires
 
 
 @singleton
 class InMemoryCache(AbstractCache):
-    """Кэш данных в памяти."""
+    """
+    Кэш данных в памяти.
+
+    Размер ограничен количеством записей и суммарным объемом значений, при превышении
+    удаляются давно не использованные записи (LRU). Истекшие записи удаляются фоновой
+    задачей по куче сроков истечения, не дожидаясь повторного чтения.
+
+    Неизменяемые значения (строки, числа, даты и кортежи из них) хранятся как есть,
+    остальные сериализуются, чтобы изменение полученного объекта не влияло на кеш.
+    Значения больше `max_value_size` байт не кешируются.
+    """
 
-    def __init__(self) -> None:
-        self._cache: dict[str, _ValueType] = {}
+    expire_interval = 1
+
+    def __init__(
+        self,
+        max_entries: int = 100_000,
+        max_bytes: int = 256 * 1024 * 1024,
+        serializer: CacheSerializer | None = None,
+        max_value_size: int = 0,
+    ) -> None:
+        self._serializer = serializer or get_serializer("msgpack")
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._max_value_size = max_value_size
+        self._cache: OrderedDict[str, _Entry] = OrderedDict()
+        # Пространство имен (часть ключа до ":" включительно) -> ключи, для delete_namespace.
+        self._namespaces: dict[str, set[str]] = {}
+        self._expiry: list[tuple[float, str]] = []
+        self._expiry_task: Task | None = None
+        self._bytes = 0
+
+        self.evictions = 0
+        self.expirations = 0
+        self.oversized = 0
 
     async def get(self, key: str) -> Optional[Any]:
         # logger.debug(f"Get from cache {key}", key=key)
 
-        if value := self._cache.get(key, None):
-            if value["expires"] is None or value["expires"] > datetime.now():
-                return pickle.loads(value["data"])
-            else:
-                await self.delete(key)
-        return None
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        if entry.expires is not None and entry.expires <= time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            return None
+        self._cache.move_to_end(key)
+        return self._serializer.loads(entry.data) if entry.serialized else entry.data
 
     async def set(self, key: str, value: Any, expire: int) -> None:
         # logger.debug(f"Set to cache {key}", key=key)
 
-        self._cache[key] = {
-            "data": pickle.dumps(value),
-            "expires": (datetime.now() + timedelta(seconds=expire)) if expire > 0 else None,
-        }
+        if self._is_immutable(value):
+            entry = _Entry(value, serialized=False, size=sys.getsizeof(value), expires=None)
+        else:
+            data = self._serializer.dumps(value)
+            entry = _Entry(data, serialized=True, size=len(data), expires=None)
+        if self._max_value_size and entry.size > self._max_value_size:
+            # Прежнее значение устарело, а новое не кешируется.
+            self._remove(key)
+            self.oversized += 1
+            return
+        entry.size += sys.getsizeof(key)
+        if expire > 0:
+            entry.expires = time.monotonic() + expire
+            heapq.heappush(self._expiry, (entry.expires, key))
+            self._ensure_expiry_task()
+
+        self._remove(key)
+        self._cache[key] = entry
+        self._bytes += entry.size
+        self._namespaces.setdefault(self._namespace(key), set()).add(key)
+        self._evict()
 
     async def delete(self, key: str) -> None:
         # logger.debug(f"Delete_ from cache {key}", key=key)
-        self._cache.pop(key, None)
+        self._remove(key)
 
     async def delete_namespace(self, prefix: str) -> None:
         # logger.debug(f"Delete namespace from cache {prefix}", prefix=prefix)
-        for key in list(self._cache.keys()):
+        namespace = self._namespace(prefix)
+        if namespace.endswith(":"):
+            candidates = list(self._namespaces.get(namespace, ()))
+        else:
+            # Префикс короче пространства имен, проверяются только подходящие пространства.
+            candidates = [
+                key for name, keys in self._namespaces.items() if name.startswith(prefix) for key in keys
+            ]
+        for key in candidates:
             if key.startswith(prefix):
-                self._cache.pop(key, None)
+                self._remove(key)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._cache),
+            "bytes": self._bytes,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "oversized": self.oversized,
+        }
+
+    async def memory_report(self) -> dict[str, dict]:
+        report: dict[str, dict] = {}
+        for key, entry in self._cache.items():
+            usage = report.setdefault(self._report_namespace(key), {"keys": 0, "bytes": 0, "no_ttl": 0})
+            usage["keys"] += 1
+            usage["bytes"] += entry.size
+            usage["no_ttl"] += entry.expires is None
+        return report
+
+    @staticmethod
+    def _namespace(key: str) -> str:
+        namespace, separator, _ = key.partition(":")
+        return namespace + separator
+
+    @classmethod
+    def _is_immutable(cls, value: Any) -> bool:
+        if isinstance(value, tuple):
+            return all(cls._is_immutable(item) for item in value)
+        return isinstance(value, _IMMUTABLE_TYPES)
+
+    def _remove(self, key: str):
+        entry = self._cache.pop(key, None)
+        if entry is None:
+            return
+        self._bytes -= entry.size
+        namespace = self._namespace(key)
+        keys = self._namespaces.get(namespace)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._namespaces[namespace]
+
+    def _evict(self):
+        while self._cache and (len(self._cache) > self._max_entries or self._bytes > self._max_bytes):
+            self._remove(next(iter(self._cache)))
+            self.evictions += 1
+
+    def _remove_expired(self):
+        now = time.monotonic()
+        while self._expiry and self._expiry[0][0] <= now:
+            expires, key = heapq.heappop(self._expiry)
+            entry = self._cache.get(key)
+            # Ключ мог быть перезаписан с другим сроком или удален.
+            if entry is not None and entry.expires == expires:
+                self._remove(key)
+                self.expirations += 1
+        # Куча содержит и устаревшие элементы перезаписанных ключей, не даем ей разрастаться.
+        if len(self._expiry) > 2 * len(self._cache) + 1024:
+            self._expiry = [
+                (entry.expires, key) for key, entry in self._cache.items() if entry.expires is not None
+            ]
+            heapq.heapify(self._expiry)
+
+    def _ensure_expiry_task(self):
+        if self._expiry_task is None or self._expiry_task.done():
+            self._expiry_task = asyncio.create_task(self._run_expiry())
+
+    async def _run_expiry(self):
+        while self._expiry:
+            await asyncio.sleep(self.expire_interval)
+            self._remove_expired()
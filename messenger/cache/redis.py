@@ -1,17 +1,65 @@
-import pickle
+import asyncio
+import time
+from asyncio import Task
+from logging import getLogger
 from typing import Optional, Any
 
-from redis.asyncio import Redis, ConnectionPool
+from redis.asyncio import Redis, ConnectionPool, RedisError
 
 from .base import AbstractCache
+from .serializers import CacheSerializer, get_serializer
 from ..deco import singleton
 
+logger = getLogger(__name__)
+
+# KEYS - пары (счетчик, версия), ARGV - тройки (значение, ожидаемая версия, время жизни или 0).
+_SET_COUNTERS_IF_VERSION_SCRIPT = """
+for pair = 0, #KEYS / 2 - 1 do
+    local value, expected, ttl = ARGV[pair * 3 + 1], ARGV[pair * 3 + 2], tonumber(ARGV[pair * 3 + 3])
+    if (redis.call("GET", KEYS[pair * 2 + 2]) or "0") == expected then
+        if ttl > 0 then
+            redis.call("SET", KEYS[pair * 2 + 1], value, "EX", ttl)
+        else
+            redis.call("SET", KEYS[pair * 2 + 1], value)
+        end
+    end
+end
+"""
+
 
 @singleton
 class RedisCache(AbstractCache):
-    """Кэш данных в Redis."""
+    """
+    Кэш данных в Redis.
+
+    Ключи с пространством имен (часть ключа до первого ":") хранятся с номером поколения
+    пространства: `{namespace}@{generation}:{rest}`, поколение 0 - без номера. Удаление пространства
+    имен увеличивает номер поколения, а ключи прежних поколений удаляются в фоне (дважды: сразу и после
+    того, как остальные узлы перечитают поколения).
+    Номера поколений перечитываются из Redis не чаще раза в `generation_refresh` секунд,
+    поэтому другие узлы перестают видеть удаленное пространство с этой задержкой.
+
+    Для пространств имен из `namespace_ttls` время жизни ключа не превышает указанного (секунды)
+    и продлевается при каждом чтении, поэтому ключи, к которым не обращаются, удаляются.
+    Значения больше `max_value_size` байт не кешируются.
+    """
 
-    def __init__(self, url: str, max_connections: int = 5) -> None:
+    generations_key = "cache:generations"
+    # Запас (секунды) сверх generation_refresh перед повторным удалением прежних поколений:
+    # на случай команд, отправленных узлами до перечитывания поколений.
+    sweep_delay_margin = 1
+    sweep_max_retries = 3
+
+    def __init__(
+        self,
+        url: str,
+        max_connections: int = 5,
+        serializer: CacheSerializer | None = None,
+        generation_refresh: float = 1,
+        max_value_size: int = 0,
+        namespace_ttls: dict[str, int] | None = None,
+    ) -> None:
+        self._serializer = serializer or get_serializer("msgpack")
         self._pool = ConnectionPool.from_url(
             url=url,
             socket_timeout=2,
@@ -19,22 +67,122 @@ class RedisCache(AbstractCache):
             max_connections=max_connections,
         )
         self._redis = Redis(connection_pool=self._pool)
+        self._set_counters_if_version = self._redis.register_script(_SET_COUNTERS_IF_VERSION_SCRIPT)
+        self._generation_refresh = generation_refresh
+        self._generations: dict[str, int] = {}
+        self._generations_loaded_at = float("-inf")
+        self._sweep_tasks: set[Task] = set()
+        self._max_value_size = max_value_size
+        self._namespace_ttls = namespace_ttls or {}
+
+        self.oversized = 0
 
     async def get(self, key: str) -> Optional[Any]:
         # logger.debug(f"Get from cache {key}", key=key)
 
-        value = await self._redis.get(key)
+        ttl = self._namespace_ttl(key)
+        if ttl is None:
+            value = await self._redis.get(await self._versioned_key(key))
+        else:
+            value = await self._redis.getex(await self._versioned_key(key), ex=ttl)
         if value is not None:
-            return pickle.loads(value)
+            return self._serializer.loads(value)
         return None
 
     async def set(self, key: str, value: Any, expire: int) -> None:
         # logger.debug(f"Set to cache {key}", key=key)
-        await self._redis.set(key, pickle.dumps(value), ex=expire if expire > 0 else None)
+        await self.set_many({key: value}, expire)
+
+    async def set_if_absent(self, key: str, value: Any, expire: int) -> bool:
+        data = self._dumps(value)
+        if data is None:
+            return False
+        return bool(
+            await self._redis.set(await self._versioned_key(key), data, ex=self._expire(key, expire), nx=True)
+        )
 
     async def delete(self, key: str) -> None:
         # logger.debug(f"Delete_ from cache {key}", key=key)
-        await self._redis.delete(key)
+        await self._redis.delete(await self._versioned_key(key))
+
+    async def get_many(self, keys: list[str]) -> list[Optional[Any]]:
+        if not keys:
+            return []
+        versioned_keys = [await self._versioned_key(key) for key in keys]
+        ttls = [self._namespace_ttl(key) for key in keys]
+        if not any(ttls):
+            values = await self._redis.mget(versioned_keys)
+        else:
+            async with self._redis.pipeline(transaction=False) as pipe:
+                for versioned_key, ttl in zip(versioned_keys, ttls):
+                    if ttl is None:
+                        pipe.get(versioned_key)
+                    else:
+                        pipe.getex(versioned_key, ex=ttl)
+                values = await pipe.execute()
+        return [self._serializer.loads(value) if value is not None else None for value in values]
+
+    async def set_many(self, values: dict[str, Any], expire: int) -> None:
+        if not values:
+            return
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for key, value in values.items():
+                data = self._dumps(value)
+                if data is None:
+                    # Прежнее значение устарело, а новое не кешируется.
+                    pipe.delete(await self._versioned_key(key))
+                else:
+                    pipe.set(await self._versioned_key(key), data, ex=self._expire(key, expire))
+            await pipe.execute()
+
+    async def delete_many(self, keys: list[str]) -> None:
+        if keys:
+            await self._redis.delete(*[await self._versioned_key(key) for key in keys])
+
+    async def get_counters(self, keys: list[str]) -> list[tuple[Optional[int], int]]:
+        if not keys:
+            return []
+        versioned_keys = [await self._versioned_key(key) for key in keys]
+        version_keys = [await self._versioned_key(self._counter_version_key(key)) for key in keys]
+        values = await self._redis.mget([*versioned_keys, *version_keys])
+        return [
+            (int(value) if value is not None else None, int(version or 0))
+            for value, version in zip(values[: len(keys)], values[len(keys) :])
+        ]
+
+    async def set_counters(
+        self, values: dict[str, int], expire: int, versions: Optional[dict[str, int]] = None
+    ) -> None:
+        if not values:
+            return
+        if versions is not None:
+            keys, args = [], []
+            for key, value in values.items():
+                keys += [
+                    await self._versioned_key(key),
+                    await self._versioned_key(self._counter_version_key(key)),
+                ]
+                args += [str(value), str(versions[key]), self._expire(key, expire) or 0]
+            await self._set_counters_if_version(keys=keys, args=args)
+            return
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for key, value in values.items():
+                # Счетчики хранятся числом в виде текста.
+                pipe.set(await self._versioned_key(key), str(value), ex=self._expire(key, expire))
+            await pipe.execute()
+
+    async def invalidate_counters(self, keys: list[str], expire: int) -> None:
+        if not keys:
+            return
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for key in keys:
+                version_key = await self._versioned_key(self._counter_version_key(key))
+                # Версия увеличивается до удаления: значение, записанное между этими командами,
+                # иначе пережило бы сброс.
+                pipe.incr(version_key)
+                pipe.expire(version_key, expire)
+                pipe.delete(await self._versioned_key(key))
+            await pipe.execute()
 
     async def clear(self) -> None:
         # logger.debug("Clear cache")
@@ -42,5 +190,132 @@ class RedisCache(AbstractCache):
 
     async def delete_namespace(self, prefix: str) -> None:
         # logger.debug(f"Delete namespace from cache {prefix}", prefix=prefix)
-        async for key in self._redis.scan_iter(f"{prefix}*"):
-            await self._redis.delete(key)
+        namespace, separator, rest = prefix.partition(":")
+        if not separator or rest:
+            # Префикс не совпадает с пространством имен целиком, ключи удаляются перебором.
+            async for key in self._redis.scan_iter(await self._versioned_key(prefix) + "*"):
+                await self._redis.delete(key)
+            return
+
+        self._generations[namespace] = await self._redis.hincrby(self.generations_key, namespace, 1)
+        task = asyncio.create_task(self._sweep(namespace))
+        self._sweep_tasks.add(task)
+        task.add_done_callback(self._sweep_tasks.discard)
+
+    def stats(self) -> dict:
+        return {"oversized": self.oversized}
+
+    async def memory_report(self) -> dict[str, dict]:
+        report: dict[str, dict] = {}
+        batch = []
+
+        async def measure():
+            async with self._redis.pipeline(transaction=False) as pipe:
+                for key in batch:
+                    pipe.memory_usage(key)
+                    pipe.ttl(key)
+                results = await pipe.execute()
+            for key, size, ttl in zip(batch, results[::2], results[1::2]):
+                usage = report.setdefault(
+                    self._report_namespace(key.decode()), {"keys": 0, "bytes": 0, "no_ttl": 0}
+                )
+                usage["keys"] += 1
+                usage["bytes"] += size or 0
+                usage["no_ttl"] += ttl == -1
+            batch.clear()
+
+        async for key in self._redis.scan_iter(count=500):
+            batch.append(key)
+            if len(batch) >= 500:
+                await measure()
+        if batch:
+            await measure()
+        return report
+
+    def _namespace_ttl(self, key: str) -> Optional[int]:
+        return self._namespace_ttls.get(key.partition(":")[0])
+
+    def _expire(self, key: str, expire: int) -> Optional[int]:
+        ttl = self._namespace_ttl(key)
+        if ttl is not None and (expire <= 0 or expire > ttl):
+            return ttl
+        return expire if expire > 0 else None
+
+    def _dumps(self, value: Any) -> Optional[bytes]:
+        data = self._serializer.dumps(value)
+        if self._max_value_size and len(data) > self._max_value_size:
+            self.oversized += 1
+            return None
+        return data
+
+    @staticmethod
+    def _generation_prefix(namespace: str, generation: int) -> str:
+        return f"{namespace}:" if generation == 0 else f"{namespace}@{generation}:"
+
+    async def _versioned_key(self, key: str) -> str:
+        namespace, separator, rest = key.partition(":")
+        if not separator:
+            return key
+        generation = (await self._load_generations()).get(namespace, 0)
+        return self._generation_prefix(namespace, generation) + rest
+
+    async def _load_generations(self) -> dict[str, int]:
+        now = time.monotonic()
+        if now - self._generations_loaded_at >= self._generation_refresh:
+            self._generations_loaded_at = now
+            try:
+                generations = await self._redis.hgetall(self.generations_key)
+            except RedisError as e:
+                logger.error(f"Не удалось получить поколения пространств имен кеша: {e}")
+            else:
+                # Поколения только растут: ответ, полученный одновременно с удалением пространства
+                # на этом узле, не должен вернуть прежний номер.
+                self._generations = {
+                    name.decode(): max(int(value), self._generations.get(name.decode(), 0))
+                    for name, value in generations.items()
+                }
+        return self._generations
+
+    async def _sweep(self, namespace: str):
+        """
+        Удаляет ключи прежних поколений пространства имен небольшими пачками, не блокируя Redis.
+
+        Другие узлы переходят на новое поколение в течение `generation_refresh` секунд и до этого
+        еще записывают ключи прежнего, поэтому после первого прохода выполняется второй.
+        Неудачный проход повторяется не более `sweep_max_retries` раз.
+        """
+        delay = self._generation_refresh + self.sweep_delay_margin
+        passes, failures = 2, 0
+        while True:
+            try:
+                await self._sweep_once(namespace)
+                passes -= 1
+            except RedisError as e:
+                failures += 1
+                if failures > self.sweep_max_retries:
+                    logger.error(
+                        f"Ключи прежних поколений пространства имен {namespace} не удалены из Redis "
+                        f"после {failures} попыток, их удалит следующее удаление пространства: {e}"
+                    )
+                    return
+                logger.warning(
+                    f"Не удалось удалить прежние поколения пространства имен {namespace}, "
+                    f"повтор через {delay} с: {e}"
+                )
+            if not passes:
+                return
+            await asyncio.sleep(delay)
+
+    async def _sweep_once(self, namespace: str):
+        # Номер поколения перечитывается: пространство могли удалить снова на другом узле.
+        current = self._generation_prefix(namespace, (await self._load_generations()).get(namespace, 0))
+        for pattern in (f"{namespace}:*", f"{namespace}@*"):
+            batch = []
+            async for key in self._redis.scan_iter(pattern, count=500):
+                if not key.startswith(current.encode()):
+                    batch.append(key)
+                if len(batch) >= 500:
+                    await self._redis.unlink(*batch)
+                    batch.clear()
+            if batch:
+                await self._redis.unlink(*batch)
@@ -0,0 +1,171 @@
+import pickle
+import zlib
+from abc import ABC, abstractmethod
+from datetime import datetime
+from functools import cache
+from typing import Any
+
+from pydantic import BaseModel
+
+try:
+    import msgpack
+except ImportError:  # Без msgpack доступен только формат pickle (CACHE_SERIALIZER=pickle).
+    msgpack = None
+
+# Первый байт значения определяет формат, поэтому узлы разных версий читают записи друг друга.
+# Данные pickle (протокол 2 и выше) всегда начинаются с байта 0x80.
+_MSGPACK_V1_TAG = 0x01
+_ZLIB_TAG = 0x02
+# Счетчики (AbstractCache.set_counters) хранятся числом в виде текста: "-" или цифра.
+_COUNTER_TAGS = frozenset(b"-0123456789")
+
+_EXT_DATETIME = 1
+_EXT_TUPLE = 2
+_EXT_PICKLE = 3
+_EXT_MODEL_LIST = 4
+
+
+@cache
+def _models() -> dict[int, type[BaseModel]]:
+    """Схемы, которые хранятся в кеше в компактном виде: код расширения msgpack -> класс."""
+    from ..auth.schemas import CurrentUserSchema
+    from ..friendships.schemas import FriendshipEntitySchema, ExistingFriendshipEntitySchema
+    from ..sockets.schemas import MessageResponseSchema
+
+    return {
+        10: MessageResponseSchema,
+        11: FriendshipEntitySchema,
+        12: ExistingFriendshipEntitySchema,
+        13: CurrentUserSchema,
+    }
+
+
+@cache
+def _model_codes() -> dict[type[BaseModel], int]:
+    return {model: code for code, model in _models().items()}
+
+
+class CacheSerializer(ABC):
+    """Формат хранения значений кеша. Чтение не зависит от формата записи."""
+
+    @abstractmethod
+    def dumps(self, value: Any) -> bytes:
+        pass
+
+    def loads(self, data: bytes) -> Any:
+        if data[0] in _COUNTER_TAGS:
+            return int(data)
+        if data[0] == _ZLIB_TAG:
+            data = zlib.decompress(memoryview(data)[1:])
+        if data[0] == _MSGPACK_V1_TAG:
+            if msgpack is None:
+                raise ValueError("Для чтения значения кеша требуется msgpack")
+            return _unpackb(memoryview(data)[1:])
+        return pickle.loads(data)
+
+
+class PickleSerializer(CacheSerializer):
+    """Формат прежних версий, используется при обновлении кластера, пока не все узлы читают msgpack."""
+
+    def dumps(self, value: Any) -> bytes:
+        return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+class MsgpackSerializer(CacheSerializer):
+    """
+    MessagePack с расширениями: известные схемы pydantic хранятся как названия и значения полей
+    (для списка однотипных схем названия записываются один раз) и восстанавливаются без валидации,
+    datetime - в формате ISO, остальные объекты - через pickle.
+    """
+
+    def dumps(self, value: Any) -> bytes:
+        if type(value) is list and value and (code := _model_codes().get(type(value[0]))) is not None:
+            if all(type(item) is type(value[0]) for item in value):
+                # Список однотипных схем: названия полей записываются один раз.
+                names = list(value[0].__dict__)
+                rows = [list(item.__dict__.values()) for item in value]
+                value = msgpack.ExtType(_EXT_MODEL_LIST, _packb([code, names, rows]))
+        return bytes((_MSGPACK_V1_TAG,)) + _packb(value)
+
+
+class CompressedSerializer(CacheSerializer):
+    """Сжимает zlib значения `serializer` размером от `threshold` байт, если сжатие уменьшает размер."""
+
+    def __init__(self, serializer: CacheSerializer, threshold: int):
+        self._serializer = serializer
+        self._threshold = threshold
+
+    def dumps(self, value: Any) -> bytes:
+        data = self._serializer.dumps(value)
+        if len(data) < self._threshold:
+            return data
+        compressed = bytes((_ZLIB_TAG,)) + zlib.compress(data, 1)
+        return compressed if len(compressed) < len(data) else data
+
+
+def _packb(value: Any) -> bytes:
+    return msgpack.packb(value, default=_default, strict_types=True)
+
+
+def _unpackb(data: bytes) -> Any:
+    return msgpack.unpackb(data, ext_hook=_ext_hook, strict_map_key=False)
+
+
+def _build_models(model: type[BaseModel], names: list[str], rows: list[list]) -> list[BaseModel]:
+    if tuple(names) != tuple(model.model_fields):
+        # Значение записано другой версией схемы: лишние поля отбрасываются, недостающие получают
+        # значения по умолчанию.
+        return [model.model_construct(**dict(zip(names, values))) for values in rows]
+
+    # Как при распаковке pickle: поля уже проверены при создании объекта.
+    new, set_attribute = model.__new__, object.__setattr__
+    models = []
+    for values in rows:
+        obj = new(model)
+        set_attribute(obj, "__dict__", dict(zip(names, values)))
+        set_attribute(obj, "__pydantic_fields_set__", set(names))
+        set_attribute(obj, "__pydantic_extra__", None)
+        set_attribute(obj, "__pydantic_private__", None)
+        models.append(obj)
+    return models
+
+
+def _default(value: Any) -> Any:
+    code = _model_codes().get(type(value))
+    if code is not None:
+        return msgpack.ExtType(code, _packb([list(value.__dict__), list(value.__dict__.values())]))
+    if isinstance(value, datetime):
+        return msgpack.ExtType(_EXT_DATETIME, value.isoformat().encode("ascii"))
+    if type(value) is tuple:
+        return msgpack.ExtType(_EXT_TUPLE, _packb(list(value)))
+    return msgpack.ExtType(_EXT_PICKLE, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def _ext_hook(code: int, data: bytes) -> Any:
+    model = _models().get(code)
+    if model is not None:
+        names, values = _unpackb(data)
+        return _build_models(model, names, [values])[0]
+    if code == _EXT_MODEL_LIST:
+        model_code, names, rows = _unpackb(data)
+        return _build_models(_models()[model_code], names, rows)
+    if code == _EXT_DATETIME:
+        return datetime.fromisoformat(data.decode("ascii"))
+    if code == _EXT_TUPLE:
+        return tuple(_unpackb(data))
+    if code == _EXT_PICKLE:
+        return pickle.loads(data)
+    return msgpack.ExtType(code, data)
+
+
+def get_serializer(name: str, compress_threshold: int = 0) -> CacheSerializer:
+    """
+    Возвращает сериализатор по названию из настроек.
+    Если `compress_threshold` больше 0, значения от этого размера (байт) сжимаются.
+    """
+    if name == "msgpack" and msgpack is None:
+        raise RuntimeError("Сериализатор кеша msgpack требует пакет msgpack")
+    serializer = MsgpackSerializer() if name == "msgpack" else PickleSerializer()
+    if compress_threshold > 0:
+        return CompressedSerializer(serializer, compress_threshold)
+    return serializer
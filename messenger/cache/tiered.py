@@ -0,0 +1,255 @@
+import asyncio
+import statistics
+import time
+from asyncio import Task
+from collections import OrderedDict, deque
+from logging import getLogger
+from typing import Optional, Any
+
+from redis.asyncio import Redis, RedisError
+
+from .base import AbstractCache
+from .serializers import CacheSerializer, get_serializer
+from ..deco import singleton
+
+logger = getLogger(__name__)
+
+# Отметка отсутствующего в удаленном кеше ключа, такие промахи тоже кешируются локально.
+_MISSING = b""
+
+
+class _NamespaceStats:
+    __slots__ = ("hits", "misses")
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+
+@singleton
+class TieredCache(AbstractCache):
+    """
+    Двухуровневый кеш: ограниченный LRU в памяти процесса перед удаленным кешем (Redis).
+
+    Локально хранятся только ключи пространств имен из `namespaces` (часть ключа до первого ":"),
+    каждое со своим временем жизни в секундах, остальные ключи всегда читаются из `remote`.
+    При записи и удалении локальных ключей узел публикует их в канал `channel`, и остальные узлы
+    удаляют их из своего LRU. Пока подписка на канал не активна, локальный уровень не используется.
+
+    Значения хранятся сериализованными, поэтому изменение полученного объекта не влияет на кеш.
+    """
+
+    channel = "cache:invalidate"
+
+    def __init__(
+        self,
+        remote: AbstractCache,
+        url: str,
+        namespaces: dict[str, float],
+        max_size: int,
+        node_id: str,
+        serializer: CacheSerializer | None = None,
+    ):
+        self._remote = remote
+        self._serializer = serializer or get_serializer("msgpack")
+        # Отдельный клиент без socket_timeout: подписка может долго простаивать.
+        self._redis = Redis.from_url(url, socket_connect_timeout=2)
+        self._namespaces = namespaces
+        self._max_size = max_size
+        self._node_id = node_id
+
+        self._local: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self._listener: Task | None = None
+        self._subscribed = False
+        # Растет при каждой инвалидации. Значение, прочитанное из Redis во время инвалидации,
+        # может быть уже устаревшим и в локальный уровень не попадает.
+        self._invalidations = 0
+
+        self._stats: dict[str, _NamespaceStats] = {namespace: _NamespaceStats() for namespace in namespaces}
+        self._remote_latencies: deque[float] = deque(maxlen=1000)
+
+    async def get(self, key: str) -> Optional[Any]:
+        return (await self.get_many([key]))[0]
+
+    async def get_many(self, keys: list[str]) -> list[Optional[Any]]:
+        values: list[Optional[Any]] = [None] * len(keys)
+        missing: list[int] = []
+        for position, key in enumerate(keys):
+            found, value = self._local_get(key)
+            if found:
+                values[position] = value
+            else:
+                missing.append(position)
+        if not missing:
+            return values
+
+        invalidations = self._invalidations
+        started_at = time.perf_counter()
+        remote_values = await self._remote.get_many([keys[position] for position in missing])
+        self._remote_latencies.append((time.perf_counter() - started_at) * 1000)
+
+        for position, value in zip(missing, remote_values):
+            values[position] = value
+            ttl = self._local_ttl(keys[position])
+            if ttl is not None and self._subscribed and invalidations == self._invalidations:
+                self._store(keys[position], ttl, _MISSING if value is None else self._serializer.dumps(value))
+        return values
+
+    async def set(self, key: str, value: Any, expire: int) -> None:
+        await self.set_many({key: value}, expire)
+
+    async def set_many(self, values: dict[str, Any], expire: int) -> None:
+        await self._remote.set_many(values, expire)
+        await self._invalidate(list(values))
+
+    async def set_if_absent(self, key: str, value: Any, expire: int) -> bool:
+        if not await self._remote.set_if_absent(key, value, expire):
+            return False
+        await self._invalidate([key])
+        return True
+
+    async def get_counters(self, keys: list[str]) -> list[tuple[Optional[int], int]]:
+        # Версии сравниваются в Redis, поэтому счетчики не читаются из локального уровня.
+        return await self._remote.get_counters(keys)
+
+    async def set_counters(
+        self, values: dict[str, int], expire: int, versions: Optional[dict[str, int]] = None
+    ) -> None:
+        await self._remote.set_counters(values, expire, versions)
+        await self._invalidate(list(values))
+
+    async def invalidate_counters(self, keys: list[str], expire: int) -> None:
+        await self._remote.invalidate_counters(keys, expire)
+        await self._invalidate(keys)
+
+    async def delete(self, key: str) -> None:
+        await self.delete_many([key])
+
+    async def delete_many(self, keys: list[str]) -> None:
+        await self._remote.delete_many(keys)
+        await self._invalidate(keys)
+
+    async def delete_namespace(self, prefix: str) -> None:
+        await self._remote.delete_namespace(prefix)
+        self._invalidate_prefix(prefix)
+        await self._publish([prefix], is_prefix=True)
+
+    async def memory_report(self) -> dict[str, dict]:
+        return await self._remote.memory_report()
+
+    def stats(self) -> dict:
+        latencies = sorted(self._remote_latencies)
+        namespaces = {}
+        for namespace, stats in self._stats.items():
+            total = stats.hits + stats.misses
+            namespaces[namespace] = {
+                "hits": stats.hits,
+                "misses": stats.misses,
+                "hit_ratio": round(stats.hits / total, 3) if total else None,
+            }
+        return {
+            **self._remote.stats(),
+            "local_keys": len(self._local),
+            "subscribed": self._subscribed,
+            "namespaces": namespaces,
+            "remote_latency_ms_p50": round(statistics.median(latencies), 3) if latencies else None,
+            "remote_latency_ms_p99": (
+                round(latencies[int(len(latencies) * 0.99) - 1], 3) if len(latencies) >= 100 else None
+            ),
+        }
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass  # Это ожидаемая ошибка при отмене задач
+            self._listener = None
+        await self._redis.aclose()
+
+    @staticmethod
+    def _namespace(key: str) -> str:
+        return key.split(":", 1)[0]
+
+    def _local_ttl(self, key: str) -> float | None:
+        """Время жизни ключа в локальном уровне или None, если ключ читается только из Redis."""
+        return self._namespaces.get(self._namespace(key))
+
+    def _ensure_subscribed(self) -> bool:
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+        return self._subscribed
+
+    def _local_get(self, key: str) -> tuple[bool, Optional[Any]]:
+        """Ищет ключ в локальном уровне, возвращает признак наличия и значение."""
+        if self._local_ttl(key) is None or not self._ensure_subscribed():
+            return False, None
+
+        stats = self._stats[self._namespace(key)]
+        item = self._local.get(key)
+        if item is not None:
+            if item[0] > time.monotonic():
+                self._local.move_to_end(key)
+                stats.hits += 1
+                return True, self._serializer.loads(item[1]) if item[1] else None
+            del self._local[key]
+        stats.misses += 1
+        return False, None
+
+    async def _invalidate(self, keys: list[str]):
+        keys = [key for key in keys if self._local_ttl(key) is not None]
+        if keys:
+            for key in keys:
+                self._local.pop(key, None)
+            await self._publish(keys)
+
+    def _store(self, key: str, ttl: float, data: bytes):
+        self._local[key] = (time.monotonic() + ttl, data)
+        self._local.move_to_end(key)
+        if len(self._local) > self._max_size:
+            self._local.popitem(last=False)
+
+    def _invalidate_prefix(self, prefix: str):
+        self._invalidations += 1
+        for key in [key for key in self._local if key.startswith(prefix)]:
+            del self._local[key]
+
+    async def _publish(self, keys: list[str], is_prefix: bool = False):
+        self._invalidations += 1
+        # Несколько ключей передаются одним сообщением через перевод строки.
+        message = f"{self._node_id}|{'p' if is_prefix else 'k'}|" + "\n".join(keys)
+        try:
+            await self._redis.publish(self.channel, message)
+        except RedisError as e:
+            # Остальные узлы увидят изменение не позже истечения локального времени жизни ключа.
+            logger.error(f"Не удалось разослать инвалидацию ключей {keys}: {e}")
+
+    def _on_invalidation(self, message: str):
+        node_id, kind, keys = message.split("|", 2)
+        if node_id == self._node_id:
+            return
+        if kind == "p":
+            self._invalidate_prefix(keys)
+        else:
+            self._invalidations += 1
+            for key in keys.split("\n"):
+                self._local.pop(key, None)
+
+    async def _listen(self):
+        while True:
+            try:
+                async with self._redis.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    async for message in pubsub.listen():
+                        if message["type"] == "subscribe":
+                            self._subscribed = True
+                        elif message["type"] == "message":
+                            self._on_invalidation(message["data"].decode("utf-8"))
+            except (RedisError, OSError) as e:
+                logger.error(f"Подписка на инвалидацию кеша потеряна: {e}")
+            finally:
+                # Пока подписки нет, инвалидации могли быть пропущены.
+                self._subscribed = False
+                self._local.clear()
+            await asyncio.sleep(1)
@@ -1,8 +1,8 @@
 from datetime import datetime
 
-from fastapi import Depends, APIRouter, Query
+from fastapi import Depends, APIRouter, Query, HTTPException
 
-from messenger.auth.models import User
+from messenger.auth.schemas import CurrentUserSchema
 from messenger.auth.users import get_current_user
 from messenger.cache import get_cache
 from messenger.chats.messages import (
@@ -10,8 +10,10 @@ from messenger.chats.messages import (
     get_last_read_message_time,
     get_unread_messages_count,
     get_last_messages,
+    get_messages_page,
+    MESSAGES_PAGE_MAX_SIZE,
 )
-from messenger.chats.schemas import UpdateLastReadSchema, LastReadSchema
+from messenger.chats.schemas import UpdateLastReadSchema, LastReadSchema, MessagesPageSchema
 from messenger.orm.session_manager import get_session
 from messenger.sockets.schemas import MessageResponseSchema
 
@@ -36,7 +38,7 @@ def last_messages_query_params(
 async def get_last_messages_api_view(
     chat_id: int,
     query: dict = Depends(last_messages_query_params),
-    user: User = Depends(get_current_user),
+    user: CurrentUserSchema = Depends(get_current_user),
     session=Depends(get_session),
 ):
     if query["with_unread"]:
@@ -50,14 +52,30 @@ async def get_last_messages_api_view(
         user_id=user.id,
         time_from=query["time_from"],
         time_to=query["time_to"],
-        limit=query["limit"] + unread_messages_count,
+        # Непрочитанные сообщения дополняют страницу, но не сверх предела, остальные - по курсору.
+        limit=min(query["limit"] + unread_messages_count, MESSAGES_PAGE_MAX_SIZE),
     )
 
 
+@router.get("/{chat_id}/messages", response_model=MessagesPageSchema)
+async def get_messages_page_api_view(
+    chat_id: int,
+    limit: int = Query(default=MESSAGES_PAGE_MAX_SIZE, ge=1, le=MESSAGES_PAGE_MAX_SIZE),
+    before: str | None = Query(default=None),
+    after: str | None = Query(default=None),
+    user: CurrentUserSchema = Depends(get_current_user),
+    session=Depends(get_session),
+):
+    try:
+        return await get_messages_page(session, chat_id, user.id, limit=limit, before=before, after=after)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+
+
 @router.get("/{chat_id}/unreadMessagesCount", response_model=int)
 async def get_unread_messages_count_api_view(
     chat_id: int,
-    user: User = Depends(get_current_user),
+    user: CurrentUserSchema = Depends(get_current_user),
     session=Depends(get_session),
 ):
     return await get_unread_messages_count(session, chat_id, user.id, cache=get_cache())
@@ -66,9 +84,10 @@ async def get_unread_messages_count_api_view(
 @router.get("/{chat_id}/lastRead", status_code=200, response_model=LastReadSchema)
 async def get_last_read_api_view(
     chat_id: int,
-    user: User = Depends(get_current_user),
+    user: CurrentUserSchema = Depends(get_current_user),
+    session=Depends(get_session),
 ):
-    last_read_message_time = await get_last_read_message_time(chat_id, user.id, cache=get_cache())
+    last_read_message_time = await get_last_read_message_time(session, chat_id, user.id, cache=get_cache())
     timestamp = int(last_read_message_time.timestamp() * 1000)
     return LastReadSchema(timestamp=timestamp)
 
@@ -77,8 +96,10 @@ async def get_last_read_api_view(
 async def update_last_read_api_view(
     data: UpdateLastReadSchema,
     chat_id: int,
-    user: User = Depends(get_current_user),
+    user: CurrentUserSchema = Depends(get_current_user),
+    session=Depends(get_session),
 ):
+    new_datetime = datetime.fromtimestamp((data.timestamp + 1) / 1000)
     await update_last_read_message_time(
-        chat_id, user.id, new_datetime=datetime.fromtimestamp((data.timestamp + 1) / 1000), cache=get_cache()
+        session, chat_id, user.id, new_datetime=new_datetime, cache=get_cache()
     )
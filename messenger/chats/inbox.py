@@ -0,0 +1,116 @@
+from datetime import datetime
+
+from sqlalchemy import insert, select, func, case, or_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from messenger.chats.models import Message, Inbox, get_conversation_id
+from messenger.sockets.schemas import MessageResponseSchema
+
+
+async def store_messages(session: AsyncSession, messages: list[MessageResponseSchema]):
+    """
+    Сохраняет пачку сообщений и обновляет переписки получателей и отправителей в таблице `inbox`.
+    Изменения фиксирует вызывающий код, поэтому сообщения и `inbox` записываются одной транзакцией.
+
+    :param session: Объект сессии базы данных.
+    :param messages: Сообщения в порядке поступления.
+    """
+    if not messages:
+        return
+    rows = [
+        {
+            "sender_id": message.sender_id,
+            "recipient_id": message.recipient_id,
+            "conversation_id": get_conversation_id(message.sender_id, message.recipient_id),
+            "message": message.message,
+            "created_at": datetime.fromtimestamp(message.created_at / 1000),
+        }
+        for message in messages
+    ]
+    ids = await session.scalars(insert(Message).returning(Message.id, sort_by_parameter_order=True), rows)
+    for row, message_id in zip(rows, ids):
+        row["id"] = message_id
+    await _upsert_inbox(session, rows)
+
+
+async def mark_inbox_read(session: AsyncSession, user_id: int, peer_id: int, read_at: datetime) -> int:
+    """
+    Сохраняет время прочтения переписки и обновляет количество непрочитанных сообщений.
+    Если прочитано последнее сообщение, непрочитанных нет, иначе они пересчитываются из `messages`.
+
+    Строка `inbox` создается, если ее еще нет (например, сохранение сообщений в очереди отстает
+    от прочтения): время прочтения не теряется, а сообщения, отправленные до него, не считаются
+    непрочитанными при сохранении.
+
+    :param session: Объект сессии базы данных.
+    :param user_id: Идентификатор пользователя.
+    :param peer_id: Идентификатор собеседника.
+    :param read_at: Время последнего прочитанного сообщения.
+    :return: Количество непрочитанных сообщений, 0 для переписки без сообщений.
+    """
+    unread_count = (
+        select(func.count(Message.id))
+        .where(
+            Message.conversation_id == get_conversation_id(user_id, peer_id),
+            Message.created_at > read_at,
+            Message.sender_id == peer_id,
+        )
+        .scalar_subquery()
+    )
+    dialect = postgresql if session.get_bind().dialect.name == "postgresql" else sqlite
+    stmt = dialect.insert(Inbox).values(
+        user_id=user_id, peer_id=peer_id, unread_count=0, last_read_at=read_at
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Inbox.user_id, Inbox.peer_id],
+        set_={
+            "unread_count": case((Inbox.last_datetime <= read_at, 0), else_=unread_count),
+            "last_read_at": stmt.excluded.last_read_at,
+        },
+    )
+    new_count = (await session.execute(stmt.returning(Inbox.unread_count))).scalar_one()
+    await session.commit()
+    return new_count
+
+
+async def _upsert_inbox(session: AsyncSession, rows: list[dict]):
+    entries: dict[tuple[int, int], dict] = {}
+    for row in rows:
+        # У отправителя сообщение прочитано, у получателя - нет.
+        for user_id, peer_id, unread in (
+            (row["sender_id"], row["recipient_id"], 0),
+            (row["recipient_id"], row["sender_id"], 1),
+        ):
+            entry = entries.setdefault(
+                (user_id, peer_id), {"user_id": user_id, "peer_id": peer_id, "unread_count": 0}
+            )
+            entry["last_message_id"] = row["id"]
+            entry["last_message"] = row["message"]
+            entry["last_sender_id"] = row["sender_id"]
+            entry["last_datetime"] = row["created_at"]
+            entry["unread_count"] += unread
+
+    dialect = postgresql if session.get_bind().dialect.name == "postgresql" else sqlite
+    # Строки упорядочены по ключу, чтобы параллельные синхронизаторы не блокировали друг друга взаимно.
+    stmt = dialect.insert(Inbox).values([entries[key] for key in sorted(entries)])
+    excluded = stmt.excluded
+    # Пачки могут фиксироваться не в порядке id, более раннее сообщение не заменяет последнее.
+    # Строка без сообщений создается при прочтении переписки (`mark_inbox_read`).
+    newer = or_(Inbox.last_message_id.is_(None), excluded.last_message_id > Inbox.last_message_id)
+    # Сохранение в очереди может отстать от прочтения: сообщения пачки, отправленные до прочтения
+    # переписки, не считаются непрочитанными.
+    unread = or_(Inbox.last_read_at.is_(None), excluded.last_datetime > Inbox.last_read_at)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Inbox.user_id, Inbox.peer_id],
+        set_={
+            "last_message_id": case((newer, excluded.last_message_id), else_=Inbox.last_message_id),
+            "last_message": case((newer, excluded.last_message), else_=Inbox.last_message),
+            "last_sender_id": case((newer, excluded.last_sender_id), else_=Inbox.last_sender_id),
+            "last_datetime": case((newer, excluded.last_datetime), else_=Inbox.last_datetime),
+            "unread_count": case(
+                (unread, Inbox.unread_count + excluded.unread_count), else_=Inbox.unread_count
+            ),
+        },
+    )
+    await session.execute(stmt)
@@ -1,12 +1,20 @@
+import base64
+import binascii
 from datetime import datetime, UTC
 
-from sqlalchemy import select, or_, and_, func
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from messenger.cache import AbstractCache
-from messenger.chats.models import Message
+from messenger.chats.inbox import mark_inbox_read
+from messenger.chats.models import Message, Inbox, get_conversation_id
+from messenger.chats.schemas import MessagesPageSchema
+from messenger.settings import settings
 from messenger.sockets.schemas import MessageResponseSchema
 
+# Максимальное количество сообщений в ответе, независимо от запрошенного.
+MESSAGES_PAGE_MAX_SIZE = 100
+
 
 async def get_last_messages(
     session: AsyncSession,
@@ -23,7 +31,7 @@ async def get_last_messages(
     :param session: Объект сессии базы данных.
     :param chat_id: Идентификатор чата.
     :param user_id: Идентификатор пользователя.
-    :param limit: Количество сообщений.
+    :param limit: Количество сообщений, не больше `MESSAGES_PAGE_MAX_SIZE`.
     :param time_from: Время начала поиска сообщений.
     :param time_to: Время окончания поиска сообщений.
     :param status: Статус сообщения, которые будут возвращены.
@@ -31,18 +39,15 @@ async def get_last_messages(
 
     query = (
         select(Message)
-        .where(
-            or_(
-                and_(Message.recipient_id == chat_id, Message.sender_id == user_id),
-                and_(Message.recipient_id == user_id, Message.sender_id == chat_id),
-            )
-        )
-        .distinct(Message.id)
-        .order_by(Message.id.desc(), Message.created_at.desc())
+        .where(Message.conversation_id == get_conversation_id(chat_id, user_id))
+        .limit(min(limit, MESSAGES_PAGE_MAX_SIZE) if limit else MESSAGES_PAGE_MAX_SIZE)
     )
 
-    if limit:
-        query = query.limit(limit)
+    if time_from or time_to:
+        # Выборка по времени читает диапазон индекса (conversation_id, created_at).
+        query = query.order_by(Message.created_at.desc(), Message.id.desc())
+    else:
+        query = query.order_by(Message.id.desc())
 
     if time_from:
         query = query.where(Message.created_at > time_from)
@@ -51,20 +56,97 @@ async def get_last_messages(
         query = query.where(Message.created_at <= time_to)
 
     result = await session.execute(query)
+    messages = [_message_schema(msg, status) for msg in result.scalars()]
+    return list(reversed(messages))
 
-    messages = [
-        MessageResponseSchema(
-            type="message",
-            status=status,
-            message=msg.message,
-            recipient_id=msg.recipient_id,
-            sender_id=msg.sender_id,
-            created_at=int(msg.created_at.timestamp() * 1000),
-        )
-        for msg in result.scalars()
-    ]
 
-    return list(reversed(messages))
+async def get_messages_page(
+    session: AsyncSession,
+    chat_id: int,
+    user_id: int,
+    limit: int = MESSAGES_PAGE_MAX_SIZE,
+    before: str | None = None,
+    after: str | None = None,
+) -> MessagesPageSchema:
+    """
+    Возвращает страницу сообщений чата по курсору в порядке отправки.
+
+    Без курсоров возвращаются последние сообщения. `next_cursor` страницы передается в `before`
+    для более ранних сообщений, `prev_cursor` - в `after` для более поздних. Курсор содержит
+    идентификатор сообщения, страница читается из индекса (conversation_id, id), поэтому
+    ее стоимость не зависит от глубины истории.
+
+    :param session: Объект сессии базы данных.
+    :param chat_id: Идентификатор чата.
+    :param user_id: Идентификатор пользователя.
+    :param limit: Количество сообщений, не больше `MESSAGES_PAGE_MAX_SIZE`.
+    :param before: Курсор, сообщения до которого нужно вернуть.
+    :param after: Курсор, сообщения после которого нужно вернуть.
+    :raises ValueError: Если курсор некорректный.
+    """
+    limit = max(1, min(limit, MESSAGES_PAGE_MAX_SIZE))
+    before_id = decode_cursor(before) if before else None
+    after_id = decode_cursor(after) if after else None
+    forward = after_id is not None and before_id is None
+
+    query = select(Message).where(Message.conversation_id == get_conversation_id(chat_id, user_id))
+    if before_id is not None:
+        query = query.where(Message.id < before_id)
+    if after_id is not None:
+        query = query.where(Message.id > after_id)
+    query = query.order_by(Message.id.asc() if forward else Message.id.desc()).limit(limit + 1)
+    rows = list((await session.execute(query)).scalars())
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if not forward:
+        rows.reverse()
+
+    next_cursor = prev_cursor = None
+    if rows and forward:
+        # Более ранние сообщения есть всегда: как минимум то, на которое указывает `after`.
+        next_cursor = encode_cursor(rows[0].id)
+        prev_cursor = encode_cursor(rows[-1].id) if has_more else None
+    elif rows:
+        next_cursor = encode_cursor(rows[0].id) if has_more else None
+        prev_cursor = encode_cursor(rows[-1].id) if before_id is not None else None
+
+    return MessagesPageSchema(
+        messages=[_message_schema(msg, "stored") for msg in rows],
+        next_cursor=next_cursor,
+        prev_cursor=prev_cursor,
+    )
+
+
+def encode_cursor(message_id: int) -> str:
+    """Возвращает курсор сообщения: `m{message_id}` в URL-safe base64 без выравнивания `=`."""
+    return base64.urlsafe_b64encode(f"m{message_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    """
+    Возвращает идентификатор сообщения из курсора.
+
+    :raises ValueError: Если курсор некорректный.
+    """
+    try:
+        value = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+    except (binascii.Error, UnicodeDecodeError):
+        raise ValueError("Некорректный курсор")
+    if not value.startswith("m") or not value[1:].isdigit():
+        raise ValueError("Некорректный курсор")
+    return int(value[1:])
+
+
+def _message_schema(msg: Message, status: str) -> MessageResponseSchema:
+    return MessageResponseSchema(
+        type="message",
+        status=status,
+        message=msg.message,
+        recipient_id=msg.recipient_id,
+        sender_id=msg.sender_id,
+        created_at=int(msg.created_at.timestamp() * 1000),
+    )
 
 
 async def get_one_last_message(
@@ -87,14 +169,58 @@ async def get_one_last_message(
         return messages[0]
 
 
+async def get_many_last_messages(
+    session: AsyncSession, chat_ids: list[int], user_id: int, cache: AbstractCache
+) -> dict[int, MessageResponseSchema | None]:
+    """
+    Возвращает последние сообщения пользователя в нескольких чатах.
+    Кэш читается одним запросом, отсутствующие в кэше сообщения загружаются одним запросом из `inbox`.
+
+    :param session: Объект сессии базы данных.
+    :param chat_ids: Идентификаторы чатов.
+    :param user_id: Идентификатор пользователя.
+    :param cache: Объект кэша.
+    :return: Словарь: идентификатор чата -> последнее сообщение или None.
+    """
+    cached = await cache.get_many([f"last_message:{chat_id}:{user_id}" for chat_id in chat_ids])
+    result: dict[int, MessageResponseSchema | None] = dict(zip(chat_ids, cached))
+
+    missing = [chat_id for chat_id, message in result.items() if message is None]
+    if missing:
+        query = select(Inbox).where(
+            Inbox.user_id == user_id, Inbox.peer_id.in_(missing), Inbox.last_message_id.is_not(None)
+        )
+        loaded = {}
+        for row in (await session.execute(query)).scalars():
+            result[row.peer_id] = loaded[f"last_message:{row.peer_id}:{user_id}"] = MessageResponseSchema(
+                type="message",
+                status="stored",
+                message=row.last_message,
+                recipient_id=user_id if row.last_sender_id == row.peer_id else row.peer_id,
+                sender_id=row.last_sender_id,
+                created_at=int(row.last_datetime.timestamp() * 1000),
+            )
+        await cache.set_many(loaded, -1)
+    return result
+
+
 async def update_last_message(message: MessageResponseSchema, cache: AbstractCache):
     """
     Обновляет кэш последнего сообщения как для получателя, так и для отправителя.
     """
-    cache_key = f"last_message:{message.recipient_id}:{message.sender_id}"
-    await cache.set(cache_key, message, -1)
-    cache_key = f"last_message:{message.sender_id}:{message.recipient_id}"
-    await cache.set(cache_key, message, -1)
+    await update_last_messages([message], cache)
+
+
+async def update_last_messages(messages: list[MessageResponseSchema], cache: AbstractCache):
+    """
+    Обновляет кэш последних сообщений нескольких чатов одним запросом.
+    Если в списке несколько сообщений одного чата, в кэше остается последнее.
+    """
+    values = {}
+    for message in messages:
+        values[f"last_message:{message.recipient_id}:{message.sender_id}"] = message
+        values[f"last_message:{message.sender_id}:{message.recipient_id}"] = message
+    await cache.set_many(values, -1)
 
 
 async def get_last_read_messages(
@@ -114,7 +240,7 @@ async def get_last_read_messages(
     if data := await cache.get(cache_key):
         return data
 
-    last_read_message_time = await get_last_read_message_time(chat_id, user_id, cache=cache)
+    last_read_message_time = await get_last_read_message_time(session, chat_id, user_id, cache=cache)
     read_messages = await get_last_messages(
         session, chat_id, user_id, time_to=last_read_message_time, limit=limit
     )
@@ -134,7 +260,7 @@ async def get_unread_messages(
     :param cache: Объект кэша.
     """
 
-    last_read_message_time = await get_last_read_message_time(chat_id, user_id, cache=cache)
+    last_read_message_time = await get_last_read_message_time(session, chat_id, user_id, cache=cache)
     unread_messages = await get_last_messages(
         session, chat_id, user_id, time_from=last_read_message_time, status="unread"
     )
@@ -146,29 +272,79 @@ async def get_unread_messages_count(
 ) -> int:
     """
     Возвращает количество непрочитанных сообщений пользователем в чате.
+    Счетчик хранится в кэше, из базы количество считается, только если счетчика нет.
 
     :param session: Объект сессии базы данных.
     :param chat_id: Идентификатор чата, для которого необходимо получить количество непрочитанных сообщений.
     :param user_id: Идентификатор пользователя
     :param cache: Объект кэша.
     """
-    last_read_message_time = await get_last_read_message_time(chat_id, user_id, cache=cache)
+    return (await get_many_unread_messages_counts(session, [chat_id], user_id, cache))[chat_id]
 
-    query = select(func.count(Message.id)).where(
-        and_(
-            Message.recipient_id == user_id,
-            Message.sender_id == chat_id,
-            Message.created_at > last_read_message_time,
+
+async def get_many_unread_messages_counts(
+    session: AsyncSession, chat_ids: list[int], user_id: int, cache: AbstractCache
+) -> dict[int, int]:
+    """
+    Возвращает количество непрочитанных сообщений пользователем в нескольких чатах.
+
+    Счетчики - кэш `inbox.unread_count`: они читаются из кэша одним запросом, отсутствующие
+    загружаются одним запросом из `inbox` и живут `settings.unread_counter_ttl` секунд.
+    Изменение `inbox` сбрасывает счетчики (:func:`invalidate_unread_messages_counts`), а загруженное
+    значение записывается, только если счетчик не сбрасывался с начала загрузки: иначе оно могло
+    быть прочитано до изменения.
+
+    :param session: Объект сессии базы данных.
+    :param chat_ids: Идентификаторы чатов.
+    :param user_id: Идентификатор пользователя.
+    :param cache: Объект кэша.
+    :return: Словарь: идентификатор чата -> количество непрочитанных сообщений.
+    """
+    keys = [_unread_count_key(chat_id, user_id) for chat_id in chat_ids]
+    cached = await cache.get_counters(keys)
+    result: dict[int, int] = {chat_id: count for chat_id, (count, _) in zip(chat_ids, cached)}
+    versions = {key: version for key, (count, version) in zip(keys, cached) if count is None}
+
+    missing = [chat_id for chat_id, count in result.items() if count is None]
+    if missing:
+        query = select(Inbox.peer_id, Inbox.unread_count).where(
+            Inbox.user_id == user_id, Inbox.peer_id.in_(missing)
         )
+        counts = dict((await session.execute(query)).tuples().all())
+        loaded = {}
+        for chat_id in missing:
+            result[chat_id] = loaded[_unread_count_key(chat_id, user_id)] = counts.get(chat_id, 0)
+        await cache.set_counters(loaded, settings.unread_counter_ttl, versions=versions)
+    return result
+
+
+async def invalidate_unread_messages_counts(messages: list[MessageResponseSchema], cache: AbstractCache):
+    """
+    Сбрасывает счетчики непрочитанных сообщений получателей одним запросом.
+    Вызывается после фиксации сообщений в базе: счетчики будут загружены из `inbox` при чтении.
+
+    Счетчик не увеличивается, а сбрасывается: загрузка, начатая до фиксации, иначе учла бы
+    сообщения дважды или потеряла их.
+    """
+    pairs = {(message.sender_id, message.recipient_id) for message in messages}
+    await cache.invalidate_counters(
+        [_unread_count_key(chat_id, user_id) for chat_id, user_id in pairs], settings.unread_counter_ttl
     )
-    return (await session.execute(query)).scalar_one()
 
 
-async def get_last_read_message_time(chat_id: int, user_id: int, cache: AbstractCache) -> datetime:
+def _unread_count_key(chat_id: int, user_id: int) -> str:
+    return f"unread_messages_count:{chat_id}:{user_id}"
+
+
+async def get_last_read_message_time(
+    session: AsyncSession, chat_id: int, user_id: int, cache: AbstractCache
+) -> datetime:
     """
     Возвращает время последнего прочитанного сообщения пользователя в чате.
-    Для хранения времени используется кэш.
+    Время хранится в `inbox.last_read_at` и кэшируется. Если переписка не читалась,
+    возвращается начало эпохи: непрочитанными считаются все сообщения, как и в `inbox`.
 
+    :param session: Объект сессии базы данных.
     :param chat_id: Идентификатор чата.
     :param user_id: Идентификатор пользователя.
     :param cache: Объект кэша.
@@ -176,31 +352,37 @@ async def get_last_read_message_time(chat_id: int, user_id: int, cache: Abstract
     cache_key = f"last_read_message_time:{chat_id}:{user_id}"
     last_time: datetime | None = await cache.get(cache_key)
     if last_time is None:
-        now = datetime.now()
-        await cache.set(f"last_read_message_time:{chat_id}:{user_id}", now, -1)
-        return now
+        query = select(Inbox.last_read_at).where(Inbox.user_id == user_id, Inbox.peer_id == chat_id)
+        last_time = (await session.execute(query)).scalar_one_or_none() or datetime.fromtimestamp(0)
+        await cache.set(cache_key, last_time, -1)
     return last_time
 
 
 async def update_last_read_message_time(
-    chat_id: int, user_id: int, new_datetime: datetime, cache: AbstractCache
-):
+    session: AsyncSession, chat_id: int, user_id: int, new_datetime: datetime, cache: AbstractCache
+) -> None:
     """
     Обновляет время последнего прочитанного сообщения пользователя в чате.
-    Для хранения времени используется кэш.
+    Время и количество непрочитанных сохраняются в `inbox`, затем обновляется кэш времени,
+    а счетчик непрочитанных сбрасывается.
 
     Также обнуляет кеш для последних прочитанных сообщений.
 
+    :param session: Объект сессии базы данных.
     :param chat_id: Идентификатор чата.
     :param user_id: Идентификатор пользователя.
     :param new_datetime: Обновляемое время.
     :param cache: Объект кэша.
     """
 
-    last_read_message_time = await get_last_read_message_time(chat_id, user_id, cache=cache)
+    last_read_message_time = await get_last_read_message_time(session, chat_id, user_id, cache=cache)
 
     if last_read_message_time > new_datetime:
         return
 
+    await mark_inbox_read(session, user_id, chat_id, new_datetime)
+
     await cache.set(f"last_read_message_time:{chat_id}:{user_id}", new_datetime, -1)
     await cache.delete(f"read_messages:{chat_id}:{user_id}")
+    # Записанный здесь счетчик могла бы перезаписать загрузка, начатая до отметки о прочтении.
+    await cache.invalidate_counters([_unread_count_key(chat_id, user_id)], settings.unread_counter_ttl)
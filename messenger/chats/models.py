@@ -1,17 +1,57 @@
 from datetime import datetime
 
-from sqlalchemy import Text, func
+from sqlalchemy import BigInteger, Text, Index, func
 from sqlalchemy.orm import Mapped, mapped_column
 
 from messenger.orm.base_model import OrmBase
 from messenger.orm.manager import Manager
 
 
+def get_conversation_id(user_id: int, other_user_id: int) -> int:
+    """
+    Возвращает идентификатор переписки двух пользователей, не зависящий от направления сообщения:
+    меньший идентификатор в старших 32 битах, больший - в младших.
+    """
+    low, high = sorted((user_id, other_user_id))
+    return low << 32 | high
+
+
 class Message(OrmBase, Manager):
     __tablename__ = "messages"
+    __table_args__ = (
+        # История переписки: страницы по id и выборки по времени читают один диапазон индекса.
+        Index(None, "conversation_id", "id"),
+        Index(None, "conversation_id", "created_at"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     sender_id: Mapped[int] = mapped_column(index=True)
     recipient_id: Mapped[int] = mapped_column(index=True)
+    # См. get_conversation_id. В PostgreSQL заполняется также триггером: сообщения, записанные узлами
+    # прежних версий во время обновления, не должны пропасть из истории.
+    conversation_id: Mapped[int | None] = mapped_column(BigInteger)
     message: Mapped[str] = mapped_column(Text, nullable=False)
     created_at: Mapped[datetime] = mapped_column(server_default=func.now(), index=True)
+
+
+class Inbox(OrmBase, Manager):
+    """
+    Последнее сообщение и количество непрочитанных сообщений каждой переписки пользователя.
+    Строка без последнего сообщения хранит только время прочтения переписки, в которой еще нет
+    сохраненных сообщений, и в список переписок не попадает.
+    """
+
+    __tablename__ = "inbox"
+    __table_args__ = (
+        # Список переписок пользователя по последней активности, постранично.
+        Index(None, "user_id", "last_datetime", "peer_id"),
+    )
+
+    user_id: Mapped[int] = mapped_column(primary_key=True)
+    peer_id: Mapped[int] = mapped_column(primary_key=True)
+    last_message_id: Mapped[int | None]
+    last_message: Mapped[str | None] = mapped_column(Text)
+    last_sender_id: Mapped[int | None]
+    last_datetime: Mapped[datetime | None]
+    unread_count: Mapped[int] = mapped_column(default=0, server_default="0")
+    last_read_at: Mapped[datetime | None]
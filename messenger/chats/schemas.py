@@ -1,5 +1,8 @@
 from pydantic import BaseModel
 
+from messenger.base_schemas import CamelSerializerModel
+from messenger.sockets.schemas import MessageResponseSchema
+
 
 class UpdateLastReadSchema(BaseModel):
     timestamp: int
@@ -7,3 +10,11 @@ class UpdateLastReadSchema(BaseModel):
 
 class LastReadSchema(BaseModel):
     timestamp: int | None
+
+
+class MessagesPageSchema(CamelSerializerModel):
+    messages: list[MessageResponseSchema]
+    # Курсор для параметра `before`: более ранние сообщения, None - это начало переписки.
+    next_cursor: str | None
+    # Курсор для параметра `after`: более поздние сообщения, None - это последние сообщения.
+    prev_cursor: str | None
@@ -1,8 +1,19 @@
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, Query, HTTPException
 
-from .schemas import FriendshipEntitySchema, NewFriendshipEntitySchema, ExistingFriendshipEntitySchema
-from .services import create_friendship, delete_friendship, search_chat_entities, get_my_friendships_data
-from ..auth.models import User
+from .schemas import (
+    FriendshipEntitySchema,
+    NewFriendshipEntitySchema,
+    ExistingFriendshipEntitySchema,
+    InboxPageSchema,
+)
+from .services import (
+    create_friendship,
+    delete_friendship,
+    search_chat_entities,
+    get_my_friendships_data,
+    get_inbox_page,
+)
+from ..auth.schemas import CurrentUserSchema
 from ..auth.users import get_current_user
 from ..cache import AbstractCache, get_cache
 from ..orm.session_manager import get_session
@@ -12,17 +23,31 @@ router = APIRouter(prefix="/friendships", tags=["friendships"])
 
 @router.get("", response_model=list[ExistingFriendshipEntitySchema])
 async def get_my_friendships_api_view(
-    user: User = Depends(get_current_user),
+    user: CurrentUserSchema = Depends(get_current_user),
     session=Depends(get_session),
     cache: AbstractCache = Depends(get_cache),
 ):
     return await get_my_friendships_data(session, user.id, cache=cache)
 
 
+@router.get("/inbox", response_model=InboxPageSchema)
+async def get_inbox_api_view(
+    limit: int = Query(default=50, ge=1, le=100),
+    cursor: str | None = Query(default=None),
+    user: CurrentUserSchema = Depends(get_current_user),
+    session=Depends(get_session),
+    cache: AbstractCache = Depends(get_cache),
+):
+    try:
+        return await get_inbox_page(session, user.id, cache, limit=limit, cursor=cursor)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+
+
 @router.post("", response_model=FriendshipEntitySchema)
 async def create_friendship_api_view(
     data: NewFriendshipEntitySchema,
-    user: User = Depends(get_current_user),
+    user: CurrentUserSchema = Depends(get_current_user),
     session=Depends(get_session),
     cache: AbstractCache = Depends(get_cache),
 ):
@@ -32,7 +57,7 @@ async def create_friendship_api_view(
 @router.delete("/{username}", status_code=204)
 async def delete_friendship_api_view(
     username: str,
-    user: User = Depends(get_current_user),
+    user: CurrentUserSchema = Depends(get_current_user),
     session=Depends(get_session),
     cache: AbstractCache = Depends(get_cache),
 ):
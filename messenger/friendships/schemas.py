@@ -17,8 +17,15 @@ class ExistingFriendshipEntitySchema(FriendshipEntitySchema):
     last_message: Optional[str] = Field(default=None)
     last_datetime: Optional[int] = Field(default=None)
     online: bool = Field(default=False)
+    last_seen: Optional[int] = Field(default=None)
     new_messages_count: int = Field(default=0)
 
 
+class InboxPageSchema(CamelSerializerModel):
+    items: list[ExistingFriendshipEntitySchema]
+    # Курсор следующей страницы для параметра `cursor`, None - это последняя страница.
+    next_cursor: Optional[str] = Field(default=None)
+
+
 class NewFriendshipEntitySchema(BaseModel):
     username: str
@@ -1,14 +1,21 @@
-from sqlalchemy import select
+import base64
+import binascii
+from datetime import datetime
+
+from sqlalchemy import select, tuple_
 from sqlalchemy.exc import IntegrityError, NoResultFound
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from .models import Friendship
-from .schemas import FriendshipEntitySchema, ExistingFriendshipEntitySchema
+from .schemas import FriendshipEntitySchema, ExistingFriendshipEntitySchema, InboxPageSchema
 from ..auth.models import User
 from ..cache import AbstractCache
-from ..chats.messages import get_one_last_message, get_unread_messages_count
-from ..sockets.schemas import MessageResponseSchema
-from ..sockets.status import is_user_online
+from ..chats.models import Inbox
+from ..chats.messages import (
+    get_many_last_messages,
+    get_many_unread_messages_counts,
+)
+from ..sockets.status import get_users_online, get_users_last_seen
 
 
 async def get_my_friendships_data(
@@ -16,17 +23,21 @@ async def get_my_friendships_data(
 ) -> list[ExistingFriendshipEntitySchema]:
 
     friendships = await get_user_friendships(session, user_id, cache)
+    friend_ids = [friendship.id for friendship in friendships]
+
+    # Данные всех друзей читаются из кеша пачками, промахи загружаются одним запросом из `inbox`,
+    # поэтому список совпадает со страницами `get_inbox_page`.
+    last_messages = await get_many_last_messages(session, friend_ids, user_id, cache)
+    unread_counts = await get_many_unread_messages_counts(session, friend_ids, user_id, cache)
+    online = await get_users_online(friend_ids, cache)
+    last_seen = await get_users_last_seen(
+        [friend_id for friend_id in friend_ids if not online[friend_id]], cache
+    )
 
     result = []
 
     for friendship in friendships:
-        last_message: MessageResponseSchema | None = await get_one_last_message(
-            session,
-            chat_id=friendship.id,
-            user_id=user_id,
-            cache=cache,
-        )
-        new_messages_count = await get_unread_messages_count(session, friendship.id, user_id, cache=cache)
+        last_message = last_messages[friendship.id]
 
         result.append(
             ExistingFriendshipEntitySchema(
@@ -37,13 +48,81 @@ async def get_my_friendships_data(
                 last_name=friendship.last_name,
                 last_message=last_message.message if last_message else None,
                 last_datetime=last_message.created_at if last_message else None,
-                online=await is_user_online(friendship.id, cache),
-                new_messages_count=new_messages_count,
+                online=online[friendship.id],
+                last_seen=last_seen.get(friendship.id),
+                new_messages_count=unread_counts[friendship.id],
             )
         )
     return result
 
 
+async def get_inbox_page(
+    session: AsyncSession, user_id: int, cache: AbstractCache, limit: int = 50, cursor: str | None = None
+) -> InboxPageSchema:
+    """
+    Возвращает страницу переписок пользователя, упорядоченных по последней активности.
+    Последние сообщения и количество непрочитанных читаются из таблицы `inbox` одним запросом.
+
+    :param session: Объект сессии базы данных.
+    :param user_id: Идентификатор пользователя.
+    :param cache: Объект кэша.
+    :param limit: Количество переписок.
+    :param cursor: Курсор страницы (`next_cursor` предыдущей страницы).
+    :raises ValueError: Если курсор некорректный.
+    """
+    query = (
+        select(Inbox, User.username, User.first_name, User.last_name)
+        .join(User, User.id == Inbox.peer_id)
+        .where(Inbox.user_id == user_id, Inbox.last_message_id.is_not(None))
+        .order_by(Inbox.last_datetime.desc(), Inbox.peer_id.desc())
+        .limit(limit + 1)
+    )
+    if cursor:
+        last_datetime, peer_id = _decode_inbox_cursor(cursor)
+        query = query.where(tuple_(Inbox.last_datetime, Inbox.peer_id) < tuple_(last_datetime, peer_id))
+    rows = (await session.execute(query)).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_inbox_cursor(rows[-1].Inbox.last_datetime, rows[-1].Inbox.peer_id)
+
+    peer_ids = [row.Inbox.peer_id for row in rows]
+    online = await get_users_online(peer_ids, cache)
+    last_seen = await get_users_last_seen([peer_id for peer_id in peer_ids if not online[peer_id]], cache)
+
+    items = [
+        ExistingFriendshipEntitySchema(
+            id=row.Inbox.peer_id,
+            type="user",
+            username=row.username,
+            first_name=row.first_name,
+            last_name=row.last_name,
+            last_message=row.Inbox.last_message,
+            last_datetime=int(row.Inbox.last_datetime.timestamp() * 1000),
+            online=online[row.Inbox.peer_id],
+            last_seen=last_seen.get(row.Inbox.peer_id),
+            new_messages_count=row.Inbox.unread_count,
+        )
+        for row in rows
+    ]
+    return InboxPageSchema(items=items, next_cursor=next_cursor)
+
+
+def _encode_inbox_cursor(last_datetime: datetime, peer_id: int) -> str:
+    value = f"{last_datetime.isoformat()}|{peer_id}"
+    return base64.urlsafe_b64encode(value.encode()).decode().rstrip("=")
+
+
+def _decode_inbox_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        value = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        last_datetime, peer_id = value.split("|")
+        return datetime.fromisoformat(last_datetime), int(peer_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError("Некорректный курсор")
+
+
 async def get_user_friendships(
     session: AsyncSession, user_id: int, cache: AbstractCache | None = None
 ) -> list[FriendshipEntitySchema]:
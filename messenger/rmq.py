@@ -43,10 +43,19 @@ class RabbitMQConnector:
         await queue.bind(self._exchange_name, self._routing_key)
         return queue
 
+    async def flush(self, timeout: float) -> None:
+        """Waits until the in-memory queue is published (at most `timeout` seconds)."""
+        if not self._publisher_is_run:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            print(f"RabbitMQ publisher flush timed out, {self._queue.qsize()} messages left in queue")
+
     async def _run_publisher(self) -> None:
         while True:
+            message = await self._queue.get()
             try:
-                message = await self._queue.get()
                 exchange = await self._get_exchange()
                 await exchange.publish(
                     aio_pika.Message(message.encode("utf-8"), content_type="application/json"),
@@ -55,6 +64,8 @@ class RabbitMQConnector:
 
             except aio_pika.exceptions.AMQPError as exc:
                 print(f"Failed to publish message: {exc}")
+            finally:
+                self._queue.task_done()
 
     async def _init_exchanges_pool(self) -> None:
         """Initialize a pool of channels."""
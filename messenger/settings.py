@@ -1,8 +1,12 @@
+import importlib.util
 import logging
+import os
+import socket
+import uuid
 from enum import Enum
 
 from pydantic_settings import BaseSettings
-from pydantic import field_validator, HttpUrl, RedisDsn
+from pydantic import field_validator, Field, HttpUrl, RedisDsn
 
 
 class SyncStorage(str, Enum):
@@ -51,6 +55,7 @@ class _SyncSettings(BaseSettings):
 class BroadcastType(str, Enum):
     LOCAL = "local"
     REDIS = "redis"
+    REDIS_STREAMS = "redis_streams"
 
 
 class MessageStorageType(str, Enum):
@@ -59,15 +64,120 @@ class MessageStorageType(str, Enum):
     RABBITMQ = "rabbitmq"
 
 
+class CacheSerializerType(str, Enum):
+    PICKLE = "pickle"
+    MSGPACK = "msgpack"
+
+
+class WebSocketCodecType(str, Enum):
+    MSGPACK_V1 = "msgpack.v1"
+
+
+def _require_msgpack(option: str):
+    # Без пакета формат пришлось бы молча заменить, поэтому узел не запускается.
+    if importlib.util.find_spec("msgpack") is None:
+        raise ValueError(f"{option} требует пакет msgpack, установите его или измените настройку")
+
+
 class _Settings(BaseSettings):
     log_level: str = "INFO"
 
-    broadcast_type: BroadcastType = BroadcastType.LOCAL  # local or redis
+    broadcast_type: BroadcastType = BroadcastType.LOCAL  # local, redis или redis_streams
     broadcast_redis_url: str = "redis://localhost:6379/0"
     broadcast_redis_max_connections: int = 10
+    # Поток сообщений каждого пользователя для redis_streams, ограничен по длине и возрасту (секунды).
+    # Клиент, пропустивший больше, получает служебное сообщение `resync`.
+    broadcast_stream_max_len: int = 500
+    broadcast_stream_max_age: int = 24 * 60 * 60
+
+    # Каталог Unix сокетов для обмена сообщениями между воркерами одного хоста (uvicorn --workers N).
+    # Пустое значение - один воркер.
+    workers_ipc_dir: str = ""
+
+    # Идентификатор узла (процесса) в кластере, по нему адресуются сообщения между узлами.
+    node_id: str = Field(
+        default_factory=lambda: f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    )
+    # Период heartbeat узла и время, после которого узел без heartbeat считается недоступным (секунды).
+    # Записи присутствия пользователей узла живут столько же и продлеваются его heartbeat'ом.
+    node_heartbeat_interval: int = 10
+    node_ttl: int = 30
+
+    # Статус online хранится с TTL и продлевается heartbeat'ом узла (секунды).
+    presence_ttl: int = 60
+    presence_heartbeat_interval: int = 20
+    # Задержка перед отметкой offline, переподключение в этот период не порождает событий (секунды).
+    # Для подключений, закрытых при отключении узла, к ней добавляется назначенная клиенту
+    # задержка переподключения (до drain_reconnect_jitter).
+    presence_offline_delay: float = 5
+
+    # Очередь исходящих кадров каждого WebSocket подключения.
+    # При переполнении сначала отбрасываются события присутствия, а подключение,
+    # остающееся переполненным дольше ws_slow_consumer_timeout секунд, закрывается.
+    ws_send_queue_max_frames: int = 1000
+    ws_send_queue_max_bytes: int = 1024 * 1024
+    ws_slow_consumer_timeout: float = 10
+    # Режим объединения кадров, включается клиентом параметром `/ws?batch=1`:
+    # кадры, накопившиеся за окно (мс), но не более ws_batch_max_size, отправляются одним JSON-массивом.
+    ws_batch_window_ms: int = 10
+    ws_batch_max_size: int = 50
+    # Подпротоколы WebSocket помимо JSON через запятую, пустое значение - только JSON.
+    ws_codecs: str = "msgpack.v1"
+
+    # Ограничение входящих сообщений WebSocket: частота (сообщений в секунду) и запас для всплесков
+    # для каждого подключения и для пользователя на всех устройствах, максимальный размер сообщения.
+    # В кластере лимит пользователя за окно ws_rate_cluster_window секунд контролируется общим счетчиком.
+    # После ws_rate_max_violations нарушений подряд подключение закрывается.
+    ws_rate_connection: float = 5
+    ws_rate_connection_burst: int = 20
+    ws_rate_user: float = 10
+    ws_rate_user_burst: int = 40
+    ws_rate_cluster_window: int = 10
+    ws_rate_max_violations: int = 10
+    ws_max_message_bytes: int = 8192
+
+    # Отключение узла перед перезапуском (SIGUSR1 или остановка приложения): клиенты получают
+    # случайную задержку переподключения до drain_reconnect_jitter секунд, сокеты закрываются
+    # в течение drain_window секунд, буфер RabbitMQ выгружается не дольше drain_flush_timeout секунд.
+    drain_window: float = 30
+    drain_reconnect_jitter: float = 10
+    drain_flush_timeout: float = 10
+
+    # Фоновая обработка входящих сообщений (доставка, кеш последних сообщений, сохранение):
+    # размер очереди каждого этапа и максимальный размер пачки.
+    ingest_queue_max_size: int = 10000
+    ingest_batch_max_size: int = 100
+    # Сколько получателей пачки обслуживается одновременно при доставке.
+    ingest_delivery_concurrency: int = 32
 
     redis_cache_url: str = "redis://localhost:6379/0"
     redis_cache_max_connections: int = 10
+    # Формат значений кеша: "msgpack" (компактный) или "pickle" (формат прежних версий).
+    # Узлы читают оба формата, pickle нужен только на время обновления кластера.
+    cache_serializer: CacheSerializerType = CacheSerializerType.MSGPACK
+    # Удаление пространства имен кеша увеличивает его поколение, узлы перечитывают поколения
+    # не чаще раза в cache_generation_refresh секунд.
+    cache_generation_refresh: float = 1
+    # Локальный уровень кеша перед Redis: пространства имен ключей (часть ключа до ":") и время жизни
+    # записей в памяти процесса (секунды) через запятую. Изменения рассылаются узлам через pub/sub Redis.
+    # Ключи остальных пространств (например, статусы online) всегда читаются из Redis.
+    cache_local_namespaces: str = "user_friendships=60,auth_user=60"
+    cache_local_max_size: int = 10000
+    # Кеш в памяти (если REDIS_CACHE_URL пуст): предел количества записей и объема значений (байт),
+    # при превышении удаляются давно не использованные записи.
+    cache_memory_max_entries: int = 100_000
+    cache_memory_max_bytes: int = 256 * 1024 * 1024
+    # Значения от cache_compress_threshold байт сжимаются (0 - без сжатия), значения больше
+    # cache_max_value_size байт не кешируются (0 - без ограничения).
+    cache_compress_threshold: int = 4096
+    cache_max_value_size: int = 1024 * 1024
+    # Время жизни ключей Redis без обращений (секунды) по пространствам имен через запятую:
+    # истории чатов и последние сообщения неактивных пользователей не занимают память.
+    # Время прочтения (last_read_message_time) хранится в таблице inbox, кеш загружает его при промахе.
+    cache_namespace_ttls: str = "read_messages=86400,last_message=604800"
+    # Счетчики непрочитанных сообщений сбрасываются после сохранения сообщений в базу
+    # и загружаются из таблицы inbox не реже раза в unread_counter_ttl секунд.
+    unread_counter_ttl: int = 3600
 
     database_url: str = "sqlite+aiosqlite:///db.sqlite3"
     database_max_connections: int = 10
@@ -76,9 +186,50 @@ class _Settings(BaseSettings):
 
     access_token_expire_minutes: int = 60
     refresh_token_expire_hours: int = 24 * 7
+    # Проверенные access токены хранятся в памяти процесса до истечения (не более auth_token_cache_size),
+    # данные пользователя - в кеше auth_user_cache_ttl секунд и сбрасываются при деактивации.
+    auth_token_cache_size: int = 10000
+    auth_user_cache_ttl: int = 300
 
     sync: _SyncSettings = _SyncSettings(_env_prefix="sync_")
 
+    @field_validator("ws_codecs")
+    @classmethod
+    def validate_ws_codecs(cls, value):
+        codecs = [WebSocketCodecType(item.strip()) for item in value.split(",") if item.strip()]
+        if WebSocketCodecType.MSGPACK_V1 in codecs:
+            _require_msgpack("WS_CODECS=msgpack.v1")
+        return value
+
+    @property
+    def ws_codecs_list(self) -> list[str]:
+        return [item.strip() for item in self.ws_codecs.split(",") if item.strip()]
+
+    @field_validator("cache_serializer")
+    @classmethod
+    def validate_cache_serializer(cls, value):
+        if value == CacheSerializerType.MSGPACK:
+            _require_msgpack("CACHE_SERIALIZER=msgpack")
+        return value
+
+    @field_validator("cache_local_namespaces", "cache_namespace_ttls")
+    @classmethod
+    def validate_cache_namespaces(cls, value):
+        for item in filter(None, value.split(",")):
+            _, ttl = item.split("=")
+            float(ttl)
+        return value
+
+    @property
+    def cache_local_namespaces_dict(self) -> dict[str, float]:
+        items = [item.split("=") for item in self.cache_local_namespaces.split(",") if item]
+        return {namespace.strip(): float(ttl) for namespace, ttl in items}
+
+    @property
+    def cache_namespace_ttls_dict(self) -> dict[str, int]:
+        items = [item.split("=") for item in self.cache_namespace_ttls.split(",") if item]
+        return {namespace.strip(): int(float(ttl)) for namespace, ttl in items}
+
     @field_validator("redis_cache_url", "broadcast_redis_url")
     @classmethod
     def validate_redis_url(cls, value):
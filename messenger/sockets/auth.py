@@ -1,22 +1,70 @@
-from fastapi import WebSocket, Depends, HTTPException
+import json
+import re
 
-from messenger.auth.models import User
+from fastapi import WebSocket, WebSocketDisconnect, WebSocketException, HTTPException
+from starlette import status
+
+from messenger.auth.schemas import CurrentUserSchema
 from messenger.auth.users import get_current_user
-from messenger.orm.session_manager import get_session
+from messenger.cache import get_cache
+from .codecs import negotiate_codec
+from .manager import get_active_connection_manager
+
 
+async def authenticate_websocket(websocket: WebSocket) -> CurrentUserSchema:
+    manager = get_active_connection_manager()
+    if manager is not None and manager.draining:
+        # Узел перезапускается, клиент подключится к другому.
+        raise WebSocketException(code=status.WS_1012_SERVICE_RESTART, reason="Service restart")
 
-async def authenticate_websocket(websocket: WebSocket, session=Depends(get_session)) -> User:
-    await websocket.accept()
+    # Формат сообщений выбирается по подпротоколу, предложенному клиентом.
+    codec = negotiate_codec(websocket)
+    websocket.state.codec = codec
+    await websocket.accept(subprotocol=codec.subprotocol)
     # Получаем токен из тела сообщения
-    token = await websocket.receive_text()
-    # Получаем пользователя
+    token, websocket.state.last_stream_id = _parse_auth_message(await _receive_token(websocket))
+    # Получаем пользователя. Сессия базы не удерживается на время жизни сокета.
     try:
-        user: User = await get_current_user(token, session)
+        user = await get_current_user(token, get_cache())
     except HTTPException as exc:
-        await websocket.send_json({"type": "system", "status": "exception", "message": exc.detail})
+        await codec.send_payload(websocket, {"type": "system", "status": "exception", "message": exc.detail})
         await websocket.close()
         raise exc
     else:
-        await websocket.send_json({"type": "system", "status": "ok", "message": "Connected"})
+        await codec.send_payload(websocket, {"type": "system", "status": "ok", "message": "Connected"})
 
     return user
+
+
+async def _receive_token(websocket: WebSocket) -> str:
+    """Токен принимается как текстовым, так и бинарным (UTF-8) кадром."""
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000))
+    if message.get("text") is not None:
+        return message["text"]
+    return (message.get("bytes") or b"").decode("utf-8", errors="replace")
+
+
+_STREAM_ID_RE = re.compile(r"^\d+-\d+$")
+
+
+def _parse_auth_message(message: str) -> tuple[str, str | None]:
+    """
+    Первое сообщение - токен, либо JSON `{"token": ..., "lastStreamId": ...}`
+    для восстановления пропущенных сообщений после переподключения.
+    """
+    if not message.startswith("{"):
+        return message, None
+    try:
+        data = json.loads(message)
+    except ValueError:
+        return message, None
+    if not isinstance(data, dict):
+        return message, None
+
+    token = str(data.get("token", ""))
+    last_stream_id = data.get("lastStreamId")
+    if not isinstance(last_stream_id, str) or not _STREAM_ID_RE.match(last_stream_id):
+        last_stream_id = None
+    return token, last_stream_id
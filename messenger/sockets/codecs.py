@@ -0,0 +1,107 @@
+from abc import ABC, abstractmethod
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+from .frames import Frame, msgpack, pack_compact, unpack_compact
+from .schemas import MessageRequestSchema
+from ..settings import settings
+
+
+class Codec(ABC):
+    """
+    Формат сообщений WebSocket подключения, выбирается через `Sec-WebSocket-Protocol`.
+    """
+
+    subprotocol: str | None = None
+
+    @abstractmethod
+    async def receive(self, websocket: WebSocket) -> str | bytes:
+        """Ожидает следующее сообщение от клиента."""
+        pass
+
+    @abstractmethod
+    def decode_request(self, data: str | bytes) -> MessageRequestSchema:
+        """Разбирает сообщение клиента. Ошибки формата - :class:`ValueError`."""
+        pass
+
+    @abstractmethod
+    async def send(self, websocket: WebSocket, frame: Frame) -> None:
+        pass
+
+    @abstractmethod
+    async def send_payload(self, websocket: WebSocket, payload: dict) -> None:
+        """Отправляет служебное сообщение."""
+        pass
+
+
+class JsonCodec(Codec):
+    """Текстовые JSON кадры с ключами в camelCase (по умолчанию)."""
+
+    async def receive(self, websocket: WebSocket) -> str:
+        return await websocket.receive_text()
+
+    def decode_request(self, data: str | bytes) -> MessageRequestSchema:
+        return MessageRequestSchema.model_validate_json(data)
+
+    async def send(self, websocket: WebSocket, frame: Frame) -> None:
+        await frame.send(websocket)
+
+    async def send_payload(self, websocket: WebSocket, payload: dict) -> None:
+        await websocket.send_json(payload)
+
+
+class MsgpackCodec(Codec):
+    """
+    Бинарные кадры MessagePack с целочисленными ключами (`msgpack.v1`).
+
+    Ключи: 0 - type, 1 - status, 2 - message, 3 - recipientId, 4 - senderId, 5 - createdAt,
+    6 - streamId (только в кадрах сервера при broadcast через Redis Streams).
+    """
+
+    subprotocol = "msgpack.v1"
+
+    async def receive(self, websocket: WebSocket) -> str | bytes:
+        # Текстовый кадр не обрывает подключение, его отклонит decode_request.
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(message.get("code", 1000))
+        if message.get("bytes") is not None:
+            return message["bytes"]
+        return message.get("text") or ""
+
+    def decode_request(self, data: str | bytes) -> MessageRequestSchema:
+        if isinstance(data, str):
+            raise ValueError("Подпротокол msgpack.v1 принимает только бинарные кадры")
+        try:
+            payload = unpack_compact(data)
+        except (TypeError, ValueError, msgpack.UnpackException) as e:
+            # Поврежденный кадр отклоняется так же, как некорректный JSON, и не обрывает подключение.
+            raise ValueError(f"Некорректный кадр msgpack.v1: {e}") from e
+        return MessageRequestSchema.model_validate(payload)
+
+    async def send(self, websocket: WebSocket, frame: Frame) -> None:
+        try:
+            await websocket.send_bytes(frame.packed)
+        except WebSocketDisconnect:
+            pass
+
+    async def send_payload(self, websocket: WebSocket, payload: dict) -> None:
+        await websocket.send_bytes(pack_compact(payload))
+
+
+json_codec = JsonCodec()
+
+_codecs: dict[str, Codec] = {}
+for _subprotocol in settings.ws_codecs_list:
+    if msgpack is None:
+        # Настройки проверяют наличие пакета, но подпротокол не должен пропасть незаметно.
+        raise RuntimeError(f"Подпротокол {_subprotocol} требует пакет msgpack")
+    _codecs[_subprotocol] = MsgpackCodec()
+
+
+def negotiate_codec(websocket: WebSocket) -> Codec:
+    """Выбирает первый поддерживаемый подпротокол из предложенных клиентом, иначе JSON."""
+    for subprotocol in websocket.scope.get("subprotocols", []):
+        if subprotocol in _codecs:
+            return _codecs[subprotocol]
+    return json_codec
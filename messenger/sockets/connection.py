@@ -0,0 +1,251 @@
+import asyncio
+import time
+from asyncio import Task
+from collections import deque
+from logging import getLogger
+
+from fastapi import WebSocket
+from starlette import status
+
+from .codecs import Codec, json_codec
+from .frames import Frame, stream_id_key
+
+logger = getLogger(__name__)
+
+
+class Connection:
+    """
+    Подключение WebSocket с собственной ограниченной очередью исходящих кадров.
+
+    Кадры ставятся в очередь без ожидания, а отправляет их отдельная задача записи,
+    поэтому медленный получатель не задерживает отправителя и других получателей.
+
+    При превышении лимита очереди сначала удаляются самые старые необязательные кадры
+    (события присутствия). Если очередь остается переполненной дольше `slow_timeout` секунд
+    или превышает лимит вдвое, подключение закрывается. Лимит проверяется при постановке кадров,
+    после каждой отправки и по таймеру, поэтому зависшая отправка не удерживает подключение.
+
+    Если `batch_size` больше 1, кадры, накопившиеся за `batch_window` секунд (но не более `batch_size`),
+    отправляются одним кадром-массивом.
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        user_id: int,
+        max_frames: int,
+        max_bytes: int,
+        slow_timeout: float,
+        batch_size: int = 1,
+        batch_window: float = 0,
+        codec: Codec = json_codec,
+    ):
+        self.websocket = websocket
+        self.user_id = user_id
+        self._max_frames = max_frames
+        self._max_bytes = max_bytes
+        self._slow_timeout = slow_timeout
+        self._batch_size = batch_size
+        self._batch_window = batch_window
+        self._codec = codec
+
+        self._queue: deque[Frame] = deque()
+        self._queued_bytes = 0
+        self._droppable_count = 0
+        self._ready = asyncio.Event()
+        self._batch_full = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._writer_task: Task | None = None
+        self._close_task: Task | None = None
+        self._over_budget_since: float | None = None
+        self._budget_timer: asyncio.TimerHandle | None = None
+        self._closing = False
+        # Задержка переподключения (секунды), назначенная клиенту при отключении узла.
+        self.reconnect_delay: float = 0
+
+        self.sent = 0
+        self.dropped = 0
+        self.max_depth = 0
+
+    def start(self):
+        self._writer_task = asyncio.create_task(self._run_writer())
+
+    async def stop(self):
+        self._cancel_budget_timer()
+        if self._writer_task is not None:
+            self._writer_task.cancel()
+            try:
+                await self._writer_task
+            except asyncio.CancelledError:
+                pass  # Это ожидаемая ошибка при отмене задач
+
+    @property
+    def depth(self) -> int:
+        return len(self._queue)
+
+    def enqueue(self, frame: Frame) -> bool:
+        """Ставит кадр в очередь отправки. Возвращает False, если кадр не принят."""
+        if self._closing:
+            return False
+
+        self._queue.append(frame)
+        self._queued_bytes += len(frame.data)
+        self._droppable_count += frame.droppable
+        self.max_depth = max(self.max_depth, len(self._queue))
+
+        if self._is_over_budget():
+            self._drop_optional_frames()
+        self._check_budget()
+
+        self._ready.set()
+        self._idle.clear()
+        if len(self._queue) >= self._batch_size:
+            self._batch_full.set()
+        return not self._closing
+
+    async def close(self, code: int, timeout: float = 1):
+        """Закрывает подключение, дождавшись отправки уже поставленных в очередь кадров (не дольше `timeout`)."""
+        if self._closing:
+            return
+        self._closing = True
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        await self._close(code)
+
+    def resume(self, frames: list[Frame]):
+        """
+        Ставит пропущенные клиентом кадры перед кадрами, пришедшими во время восстановления.
+        Вызывается до :meth:`start`. Кадры, уже попавшие в `frames`, повторно не отправляются.
+        """
+        stream_ids = [stream_id_key(frame.stream_id) for frame in frames if frame.stream_id]
+        last_stream_id = max(stream_ids, default=None)
+        live = [
+            frame
+            for frame in self._queue
+            if last_stream_id is None
+            or frame.stream_id is None
+            or stream_id_key(frame.stream_id) > last_stream_id
+        ]
+        self._clear()
+        for frame in [*frames, *live]:
+            self.enqueue(frame)
+
+    def stats(self) -> dict:
+        return {
+            "user_id": self.user_id,
+            "depth": len(self._queue),
+            "bytes": self._queued_bytes,
+            "max_depth": self.max_depth,
+            "sent": self.sent,
+            "dropped": self.dropped,
+        }
+
+    def _is_over_budget(self, factor: int = 1) -> bool:
+        return len(self._queue) > self._max_frames * factor or self._queued_bytes > self._max_bytes * factor
+
+    def _drop_optional_frames(self):
+        """Удаляет самые старые необязательные кадры, пока очередь превышает лимит."""
+        if not self._droppable_count:
+            return
+
+        kept = deque()
+        depth = len(self._queue)
+        for frame in self._queue:
+            if frame.droppable and (depth > self._max_frames or self._queued_bytes > self._max_bytes):
+                depth -= 1
+                self._queued_bytes -= len(frame.data)
+                self._droppable_count -= 1
+                self.dropped += 1
+            else:
+                kept.append(frame)
+        self._queue = kept
+
+    def _check_budget(self):
+        if self._closing:
+            return
+        if not self._is_over_budget():
+            self._over_budget_since = None
+            self._cancel_budget_timer()
+            return
+
+        now = time.monotonic()
+        if self._over_budget_since is None:
+            self._over_budget_since = now
+
+        if self._is_over_budget(factor=2) or now - self._over_budget_since >= self._slow_timeout:
+            logger.warning(
+                f"Медленное подключение пользователя {self.user_id} закрыто: "
+                f"в очереди {len(self._queue)} кадров, {self._queued_bytes} байт"
+            )
+            self._closing = True
+            self._close_task = asyncio.create_task(self._close(status.WS_1013_TRY_AGAIN_LATER))
+        elif self._budget_timer is None:
+            # Без новых кадров и отправок лимит проверит таймер.
+            self._budget_timer = asyncio.get_running_loop().call_later(
+                self._over_budget_since + self._slow_timeout - now, self._on_budget_timer
+            )
+
+    def _on_budget_timer(self):
+        self._budget_timer = None
+        self._check_budget()
+
+    def _cancel_budget_timer(self):
+        if self._budget_timer is not None:
+            self._budget_timer.cancel()
+            self._budget_timer = None
+
+    async def _close(self, code: int):
+        await self.stop()
+        self._clear()
+        try:
+            await self.websocket.close(code=code)
+        except RuntimeError:
+            pass  # Сокет уже закрыт.
+
+    def _clear(self):
+        self._queue.clear()
+        self._queued_bytes = 0
+        self._droppable_count = 0
+
+    def _pop_frames(self) -> list[Frame]:
+        frames = []
+        while self._queue and len(frames) < self._batch_size:
+            frame = self._queue.popleft()
+            self._queued_bytes -= len(frame.data)
+            self._droppable_count -= frame.droppable
+            frames.append(frame)
+        return frames
+
+    async def _wait_batch(self):
+        """Дает накопиться кадрам в пределах окна объединения."""
+        if len(self._queue) >= self._batch_size:
+            return
+        self._batch_full.clear()
+        try:
+            await asyncio.wait_for(self._batch_full.wait(), timeout=self._batch_window)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _run_writer(self):
+        while True:
+            await self._ready.wait()
+            while self._queue:
+                if self._batch_size > 1:
+                    await self._wait_batch()
+                frames = self._pop_frames()
+                # В режиме объединения клиент всегда получает массив, даже из одного кадра.
+                frame = Frame.batch(frames) if self._batch_size > 1 else frames[0]
+                try:
+                    await self._codec.send(self.websocket, frame)
+                except Exception as exc:
+                    logger.debug(f"Не удалось отправить кадр пользователю {self.user_id}: {exc}")
+                    self._clear()
+                    return
+                self.sent += len(frames)
+                if self._over_budget_since is not None:
+                    self._check_budget()
+            self._ready.clear()
+            self._idle.set()
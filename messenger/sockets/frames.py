@@ -0,0 +1,150 @@
+import json
+from typing import Any, Iterable, Iterator, Self
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+from .schemas import MessageResponseSchema
+
+try:
+    import msgpack
+except ImportError:  # msgpack нужен только для подпротокола msgpack.v1 (WS_CODECS).
+    msgpack = None
+
+# Целочисленные ключи компактного конверта вместо повторяющихся строковых ключей JSON.
+COMPACT_KEYS: dict[str, int] = {
+    "type": 0,
+    "status": 1,
+    "message": 2,
+    "recipientId": 3,
+    "senderId": 4,
+    "createdAt": 5,
+    "streamId": 6,
+}
+_COMPACT_FIELDS: dict[int, str] = {value: key for key, value in COMPACT_KEYS.items()}
+
+
+def pack_compact(payload: dict | list) -> bytes:
+    """Кодирует сообщение (или массив сообщений) в MessagePack с целочисленными ключами."""
+    if isinstance(payload, list):
+        return msgpack.packb([_to_compact(item) for item in payload])
+    return msgpack.packb(_to_compact(payload))
+
+
+def unpack_compact(data: bytes) -> Any:
+    """Декодирует сообщение MessagePack с целочисленными ключами в словарь с ключами JSON."""
+    payload = msgpack.unpackb(data, strict_map_key=False)
+    if isinstance(payload, dict):
+        return {_COMPACT_FIELDS.get(key, key): value for key, value in payload.items()}
+    return payload
+
+
+def _to_compact(item: dict) -> dict:
+    return {COMPACT_KEYS.get(key, key): value for key, value in item.items()}
+
+
+class Frame:
+    """
+    Исходящее сообщение WebSocket, сериализованное один раз.
+
+    Один и тот же объект отправляется в любое количество сокетов и пересылается между узлами.
+    Байтовое, текстовое и компактное (MessagePack) представления вычисляются лениво и только один раз.
+
+    `droppable` отмечает кадры, которые можно пропустить при переполнении очереди (события присутствия).
+    `stream_id` - идентификатор сообщения в потоке получателя (только для broadcast через Redis Streams).
+    """
+
+    __slots__ = ("_data", "_text", "_packed", "droppable", "stream_id")
+
+    def __init__(
+        self,
+        *,
+        data: bytes | None = None,
+        text: str | None = None,
+        droppable: bool = False,
+        stream_id: str | None = None,
+    ):
+        if data is None and text is None:
+            raise ValueError("Frame требует data или text")
+        self._data = data
+        self._text = text
+        self._packed: bytes | None = None
+        self.droppable = droppable
+        self.stream_id = stream_id
+
+    @classmethod
+    def from_schema(cls, message: MessageResponseSchema, droppable: bool = False) -> Self:
+        return cls(text=message.model_dump_json(by_alias=True), droppable=droppable)
+
+    @classmethod
+    def batch(cls, frames: list["Frame"]) -> Self:
+        """Объединяет кадры в один кадр с JSON-массивом, не сериализуя их повторно."""
+        return cls(data=b"[" + b",".join(frame.data for frame in frames) + b"]")
+
+    @classmethod
+    def system(cls, status: str, message: str, droppable: bool = False, extra: dict | None = None) -> Self:
+        """Служебное сообщение сервера, `extra` - дополнительные поля."""
+        payload = {"type": "system", "status": status, "message": message, **(extra or {})}
+        return cls(text=json.dumps(payload, ensure_ascii=False), droppable=droppable)
+
+    def with_stream_id(self, stream_id: str) -> "Frame":
+        """Копия кадра-объекта с полем `streamId`, добавленным в конец JSON без повторной сериализации."""
+        data = self.data[:-1] + b',"streamId":"' + stream_id.encode("ascii") + b'"}'
+        return Frame(data=data, droppable=self.droppable, stream_id=stream_id)
+
+    @property
+    def data(self) -> bytes:
+        if self._data is None:
+            self._data = self._text.encode("utf-8")
+        return self._data
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = self._data.decode("utf-8")
+        return self._text
+
+    @property
+    def packed(self) -> bytes:
+        if self._packed is None:
+            self._packed = pack_compact(json.loads(self.data))
+        return self._packed
+
+    async def send(self, websocket: WebSocket) -> None:
+        try:
+            await websocket.send_text(self.text)
+        except WebSocketDisconnect:
+            pass
+
+
+def stream_id_key(stream_id: str) -> tuple[int, int]:
+    """Ключ сравнения идентификаторов Redis Streams вида `<ms>-<seq>`."""
+    milliseconds, _, sequence = stream_id.partition("-")
+    return int(milliseconds), int(sequence or 0)
+
+
+_RECIPIENT_FIELD = b',"recipientId":'
+
+
+def frames_for_recipients(
+    message: MessageResponseSchema, recipient_ids: Iterable[int], droppable: bool = False
+) -> Iterator[tuple[int, Frame]]:
+    """
+    Создает кадры одного и того же сообщения для разных получателей.
+
+    Сообщение сериализуется один раз, для каждого получателя подставляется только `recipientId`.
+    Внутри JSON-строк кавычки экранируются, поэтому `,"recipientId":` встречается лишь как поле.
+    """
+    template = message.model_copy(update={"recipient_id": 0})
+    data = Frame.from_schema(template).data
+    prefix, found, rest = data.partition(_RECIPIENT_FIELD + b"0")
+
+    if not found:
+        for recipient_id in recipient_ids:
+            yield recipient_id, Frame.from_schema(
+                message.model_copy(update={"recipient_id": recipient_id}), droppable=droppable
+            )
+        return
+
+    prefix += _RECIPIENT_FIELD
+    for recipient_id in recipient_ids:
+        yield recipient_id, Frame(data=prefix + str(recipient_id).encode("ascii") + rest, droppable=droppable)
@@ -1,21 +1,55 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, HTTPException
+from starlette import status
+from starlette.websockets import WebSocketState
 
 from .auth import authenticate_websocket
+from .codecs import Codec
 from .manager import get_connection_manager
-from ..auth.models import User
+from .ratelimit import Verdict
+from ..auth.schemas import CurrentUserSchema
+from ..auth.users import get_current_user
 
 router = APIRouter(prefix="", tags=["ws"])
 
 
 @router.websocket("")
-async def private_chat(websocket: WebSocket, user: User = Depends(authenticate_websocket)):
-    """WebSocket для личной переписки"""
+async def private_chat(websocket: WebSocket, user: CurrentUserSchema = Depends(authenticate_websocket)):
+    """
+    WebSocket для личной переписки.
+
+    С параметром `?batch=1` сообщения, пришедшие почти одновременно, доставляются одним массивом.
+    По умолчанию используются текстовые JSON кадры, с подпротоколом `msgpack.v1` - бинарные MessagePack.
+    """
     manager = await get_connection_manager()
-    await manager.connect(websocket, user.id)
+    codec: Codec = websocket.state.codec
+    batch = websocket.query_params.get("batch") in ("1", "true")
+    connection = await manager.connect(
+        websocket, user.id, batch=batch, codec=codec, last_stream_id=websocket.state.last_stream_id
+    )
 
     try:
         while True:
-            data = await websocket.receive_text()  # Ожидание сообщения от сокета.
-            await manager.analyze_message(data, user.id)
+            data = await codec.receive(websocket)  # Ожидание сообщения от сокета.
+            verdict = manager.flood_control.check(connection, data)
+            if verdict is Verdict.DISCONNECT:
+                await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+                break
+            if verdict is Verdict.ACCEPT:
+                await manager.analyze_message(data, user.id, codec)
     except WebSocketDisconnect:
-        await manager.disconnect(websocket, user.id)
+        pass
+    except RuntimeError:
+        # Сокет закрыт сервером (медленный клиент, отключение узла) во время ожидания сообщения.
+        if websocket.application_state != WebSocketState.DISCONNECTED:
+            raise
+    finally:
+        await manager.disconnect(connection)
+
+
+@router.get("/stats")
+async def connections_stats(user: CurrentUserSchema = Depends(get_current_user)):
+    """Статистика очередей отправки подключений текущего узла"""
+    if not user.is_staff:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Недостаточно прав")
+    manager = await get_connection_manager()
+    return manager.stats()
@@ -0,0 +1,266 @@
+import asyncio
+import os
+import struct
+from asyncio import StreamReader, StreamWriter, Task
+from logging import getLogger
+
+from .frames import Frame
+from .manager import BroadcastManager, FrameReceiver
+
+logger = getLogger(__name__)
+
+_HEADER = struct.Struct("!cI")
+
+_HELLO = b"H"
+_ADD_USER = b"A"
+_REMOVE_USER = b"R"
+_FRAME = b"F"
+
+
+class _Peer:
+    """Соединение с другим воркером того же хоста."""
+
+    def __init__(self, reader: StreamReader, writer: StreamWriter, outbound: bool):
+        self.reader = reader
+        self.writer = writer
+        # Соединение открыто этим воркером (иначе - принято от соседа).
+        self.outbound = outbound
+        self.node_id: str | None = None
+        self.users: set[int] = set()
+        # Лишнее встречное соединение: по нему больше ничего не отправляется, оно дочитывается и закрывается.
+        self.closing = False
+
+    async def send(self, kind: bytes, body: bytes):
+        self.writer.write(_HEADER.pack(kind, len(body)) + body)
+        if self.writer.transport.get_write_buffer_size() > 1024 * 1024:
+            await self.writer.drain()
+
+    async def receive(self) -> tuple[bytes, bytes]:
+        kind, length = _HEADER.unpack(await self.reader.readexactly(_HEADER.size))
+        return kind, await self.reader.readexactly(length)
+
+    def close(self):
+        self.writer.close()
+
+
+class HostBroadcastManager(BroadcastManager):
+    """
+    Broadcast между воркерами одного хоста через Unix сокеты.
+
+    Каждый воркер слушает сокет `{ipc_dir}/worker-{pid}.sock` и соединяется с уже запущенными воркерами.
+    Воркеры сообщают друг другу, какие пользователи у них подключены, поэтому кадр передается
+    только тем соседям, у которых есть получатель. Через `cluster` (Redis) уходят лишь доставки
+    на другие хосты: узлы-соседи исключаются из его рассылки.
+
+    С каждым соседом используется одно соединение. Если воркеры запустились одновременно и соединились
+    встречно, оба оставляют соединение, открытое воркером с меньшим `node_id`.
+    """
+
+    def __init__(self, cluster: BroadcastManager, node_id: str, ipc_dir: str):
+        super().__init__()
+        self._cluster = cluster
+        self._node_id = node_id
+        self._ipc_dir = ipc_dir
+        self._path = os.path.join(ipc_dir, f"worker-{os.getpid()}.sock")
+        self._server: asyncio.AbstractServer | None = None
+        self._start_lock = asyncio.Lock()
+        self._local_users: set[int] = set()
+        self._peers: set[_Peer] = set()
+        # Используемое соединение с каждым соседом, через него идут кадры и учитываются его пользователи.
+        self._nodes: dict[str, _Peer] = {}
+        self._user_peers: dict[int, set[_Peer]] = {}
+        self._tasks: set[Task] = set()
+
+    def set_receiver(self, receiver: FrameReceiver):
+        super().set_receiver(receiver)
+        self._cluster.set_receiver(receiver)
+
+    async def append(self, frame: Frame, chat_id: int) -> Frame:
+        return await self._cluster.append(frame, chat_id)
+
+    async def read_since(self, chat_id: int, stream_id: str) -> list[Frame]:
+        return await self._cluster.read_since(chat_id, stream_id)
+
+    async def send(self, frame: Frame, chat_id: int):
+        peers = self._user_peers.get(chat_id)
+        if peers:
+            body = f"{chat_id}:{int(frame.droppable)}:{frame.stream_id or ''}:".encode("utf-8") + frame.data
+            for peer in list(peers):
+                await self._send_to_peer(peer, _FRAME, body)
+        await self._cluster.send(frame, chat_id)
+
+    async def run_listener(self, chat_id: int):
+        await self._ensure_started()
+        self._local_users.add(chat_id)
+        await self._announce(_ADD_USER, chat_id)
+        await self._cluster.run_listener(chat_id)
+
+    async def stop_listener(self, chat_id: int):
+        self._local_users.discard(chat_id)
+        await self._announce(_REMOVE_USER, chat_id)
+        await self._cluster.stop_listener(chat_id)
+
+    async def is_connected_elsewhere(self, chat_id: int) -> bool:
+        if self._user_peers.get(chat_id):
+            return True
+        return await self._cluster.is_connected_elsewhere(chat_id)
+
+    async def close(self):
+        # Сокет удаляется до закрытия соединений, чтобы запускающиеся воркеры не соединялись с этим.
+        if self._server is not None:
+            self._server.close()
+            try:
+                os.unlink(self._path)
+            except FileNotFoundError:
+                pass
+        for peer in list(self._peers):
+            self._remove_peer(peer)
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._server is not None:
+            await self._server.wait_closed()
+            self._server = None
+        await self._cluster.close()
+
+    async def _ensure_started(self):
+        async with self._start_lock:
+            if self._server is not None:
+                return
+            os.makedirs(self._ipc_dir, exist_ok=True)
+            if os.path.exists(self._path):
+                os.unlink(self._path)
+            self._server = await asyncio.start_unix_server(self._accept, path=self._path)
+            await self._connect_to_workers()
+
+    async def _connect_to_workers(self):
+        for name in os.listdir(self._ipc_dir):
+            path = os.path.join(self._ipc_dir, name)
+            if not name.endswith(".sock") or path == self._path:
+                continue
+            try:
+                reader, writer = await asyncio.open_unix_connection(path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Сокет завершившегося воркера.
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                continue
+            await self._add_peer(_Peer(reader, writer, outbound=True))
+
+    async def _accept(self, reader: StreamReader, writer: StreamWriter):
+        await self._add_peer(_Peer(reader, writer, outbound=False))
+
+    async def _add_peer(self, peer: _Peer):
+        self._peers.add(peer)
+        await peer.send(_HELLO, self._node_id.encode("utf-8"))
+        for user_id in self._local_users:
+            await peer.send(_ADD_USER, str(user_id).encode("ascii"))
+        task = asyncio.create_task(self._read_peer(peer))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _announce(self, kind: bytes, user_id: int):
+        body = str(user_id).encode("ascii")
+        for peer in list(self._peers):
+            if not peer.closing:
+                await self._send_to_peer(peer, kind, body)
+
+    async def _send_to_peer(self, peer: _Peer, kind: bytes, body: bytes):
+        try:
+            await peer.send(kind, body)
+        except (ConnectionError, RuntimeError) as e:
+            logger.warning(f"Соединение с воркером {peer.node_id} потеряно: {e}")
+            self._remove_peer(peer)
+
+    async def _read_peer(self, peer: _Peer):
+        try:
+            while True:
+                kind, body = await peer.receive()
+                if kind == _FRAME:
+                    recipient, droppable, stream_id, data = body.split(b":", 3)
+                    if self._receiver is not None:
+                        frame = Frame(
+                            data=data, droppable=droppable == b"1", stream_id=stream_id.decode() or None
+                        )
+                        self._receiver(frame, int(recipient))
+                elif kind == _ADD_USER:
+                    user_id = int(body)
+                    peer.users.add(user_id)
+                    if self._is_active(peer):
+                        self._user_peers.setdefault(user_id, set()).add(peer)
+                elif kind == _REMOVE_USER:
+                    user_id = int(body)
+                    peer.users.discard(user_id)
+                    if self._is_active(peer):
+                        self._discard_user_peer(user_id, peer)
+                elif kind == _HELLO:
+                    peer.node_id = body.decode("utf-8")
+                    self._on_hello(peer)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._remove_peer(peer)
+
+    def _on_hello(self, peer: _Peer):
+        current = self._nodes.get(peer.node_id)
+        if current is None:
+            self._activate(peer)
+            return
+        # Встречные соединения с одним соседом: оба воркера выбирают одно и то же, иначе кадры
+        # доставлялись бы дважды.
+        if self._is_preferred(peer) and not self._is_preferred(current):
+            self._deactivate(current)
+            self._activate(peer)
+            duplicate = current
+        else:
+            duplicate = peer
+        duplicate.closing = True
+        if duplicate.outbound:
+            # Кадры, отправленные соседом до того, как он сделал тот же выбор, еще будут прочитаны,
+            # а соединение закроет сосед, получив конец потока.
+            duplicate.writer.write_eof()
+
+    def _is_preferred(self, peer: _Peer) -> bool:
+        """Соединение открыто воркером с меньшим `node_id`."""
+        dialer = self._node_id if peer.outbound else peer.node_id
+        return dialer == min(self._node_id, peer.node_id)
+
+    def _is_active(self, peer: _Peer) -> bool:
+        return peer.node_id is not None and self._nodes.get(peer.node_id) is peer
+
+    def _activate(self, peer: _Peer):
+        self._nodes[peer.node_id] = peer
+        for user_id in peer.users:
+            self._user_peers.setdefault(user_id, set()).add(peer)
+        self._cluster.local_nodes.add(peer.node_id)
+
+    def _deactivate(self, peer: _Peer):
+        del self._nodes[peer.node_id]
+        for user_id in peer.users:
+            self._discard_user_peer(user_id, peer)
+
+    def _remove_peer(self, peer: _Peer):
+        if peer not in self._peers:
+            return
+        self._peers.discard(peer)
+        if self._is_active(peer):
+            self._deactivate(peer)
+            # Сосед доступен, пока с ним остается другое соединение.
+            replacement = next(
+                (other for other in self._peers if other.node_id == peer.node_id and not other.closing), None
+            )
+            if replacement is not None:
+                self._activate(replacement)
+            else:
+                self._cluster.local_nodes.discard(peer.node_id)
+        peer.close()
+
+    def _discard_user_peer(self, user_id: int, peer: _Peer):
+        peers = self._user_peers.get(user_id)
+        if peers is not None:
+            peers.discard(peer)
+            if not peers:
+                del self._user_peers[user_id]
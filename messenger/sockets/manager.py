@@ -1,16 +1,28 @@
 import asyncio
+import heapq
+import random
+import signal
+import time
 from abc import ABC, abstractmethod
 from asyncio import Task
 from datetime import datetime
 from functools import cache
 from logging import getLogger
+from typing import Callable
 
-from fastapi import WebSocket, WebSocketDisconnect
+from fastapi import WebSocket
 from pydantic import ValidationError
 from redis.asyncio import Redis, ConnectionPool, RedisError
-
-from .schemas import MessageRequestSchema, MessageResponseSchema
-from .status import set_user_online, set_user_offline, is_user_online
+from starlette import status
+
+from .codecs import Codec, json_codec
+from .connection import Connection
+from .frames import Frame, frames_for_recipients, stream_id_key
+from .schemas import MessageResponseSchema
+from .pipeline import IngestPipeline
+from .presence import PresenceEngine
+from .ratelimit import FloodControl
+from .status import get_users_online, ClusterPresence
 from .storages import (
     MessagesStorage,
     NoMessagesStorage,
@@ -18,118 +30,474 @@ from .storages import (
     RabbitMQMessagesStorage,
 )
 from ..cache import AbstractCache, get_cache
-from ..chats.messages import update_last_message
+from ..chats.messages import update_last_messages
 from ..deco import singleton
 from ..friendships.services import get_user_friendships
 from ..orm.session_manager import db_manager
-from ..settings import settings, MessageStorageType
+from ..settings import settings, BroadcastType, MessageStorageType
+
+logger = getLogger(__name__)
+
+FrameReceiver = Callable[[Frame, int], None]
 
 
 class BroadcastManager(ABC):
 
+    def __init__(self):
+        self._receiver: FrameReceiver | None = None
+        # Узлы того же хоста, доставка на которые идет в обход broadcast (см. HostBroadcastManager).
+        self.local_nodes: set[str] = set()
+
+    def set_receiver(self, receiver: FrameReceiver):
+        """Устанавливает обработчик кадров, пришедших с других узлов."""
+        self._receiver = receiver
+
+    async def append(self, frame: Frame, chat_id: int) -> Frame:
+        """
+        Сохраняет кадр в журнал получателя перед доставкой.
+        Возвращает кадр, который нужно доставить (с `streamId`, если журнал ведется).
+        """
+        return frame
+
+    async def read_since(self, chat_id: int, stream_id: str) -> list[Frame]:
+        """Возвращает кадры журнала получателя после `stream_id` для восстановления после переподключения."""
+        return []
+
     @abstractmethod
-    async def send(self, message: MessageResponseSchema, chat_id: int):
+    async def send(self, frame: Frame, chat_id: int):
         pass
 
     @abstractmethod
-    async def run_listener(self, websocket: WebSocket, chat_id: int):
+    async def run_listener(self, chat_id: int):
+        """Вызывается при первом локальном подключении пользователя."""
         pass
 
     @abstractmethod
     async def stop_listener(self, chat_id: int):
+        """Вызывается после последнего локального отключения пользователя."""
+        pass
+
+    @abstractmethod
+    async def is_connected_elsewhere(self, chat_id: int) -> bool:
+        """Есть ли у пользователя подключения на других узлах."""
+        pass
+
+    async def close(self):
+        """Вызывается при отключении узла: узел покидает кластер и больше не получает кадры."""
         pass
 
 
 class RedisBroadcastManager(BroadcastManager):
-    def __init__(self, redis: Redis):
+    """
+    Broadcast между узлами через Redis Pub/Sub.
+
+    Каждый узел подписан ровно на один канал `node:{node_id}` через одно pub/sub подключение.
+    Узлы, на которых подключен пользователь, хранятся в реестре :class:`ClusterPresence`,
+    поэтому сообщение публикуется один раз на каждый удаленный узел получателя
+    и не публикуется совсем, если получатель нигде не в сети.
+    """
+
+    def __init__(self, redis: Redis, presence: ClusterPresence, heartbeat_interval: int):
+        super().__init__()
         self.redis = redis
-        self._listener_tasks: dict[int, Task] = {}
+        self._presence = presence
+        self._heartbeat_interval = heartbeat_interval
+        self._pubsub = redis.pubsub()
+        self._local_users: set[int] = set()
+        self._registered: set[int] = set()
+        self._presence_lock = asyncio.Lock()
+        self._reader_task: Task | None = None
+        self._heartbeat_task: Task | None = None
 
-    async def send(self, message: MessageResponseSchema, chat_id: int):
+    @staticmethod
+    def _node_channel(node_id: str) -> str:
+        return f"node:{node_id}"
+
+    async def send(self, frame: Frame, chat_id: int):
         try:
-            await self.redis.publish(str(chat_id), message.model_dump_json(by_alias=True))
+            nodes = await self._presence.get_user_nodes(chat_id)
+            nodes.discard(self._presence.node_id)  # Локальные сокеты обслуживает ConnectionManager.
+            nodes -= self.local_nodes
+            if not nodes:
+                return
+            data = f"{chat_id}:{int(frame.droppable)}:".encode("utf-8") + frame.data
+            for node in nodes:
+                await self.redis.publish(self._node_channel(node), data)
         except RedisError as e:
-            print(e)
+            logger.error(f"Не удалось отправить сообщение пользователю {chat_id} на другие узлы: {e}")
 
-    async def run_listener(self, websocket: WebSocket, chat_id: int):
-        async def async_listener():
-            pubsub = self.redis.pubsub()
-            await pubsub.subscribe(str(chat_id))
-            try:
-                while True:
-                    msg = await pubsub.get_message(ignore_subscribe_messages=True, timeout=5)
-                    if msg is None or msg["type"] != "message" or msg["data"] is None:
-                        continue
-                    try:
-                        await websocket.send_text(msg["data"].decode("utf-8"))
-                    except WebSocketDisconnect:
-                        return
-            finally:
-                # Убедимся, что pubsub закрыт корректно
-                await pubsub.unsubscribe()
-                await pubsub.close()
-
-        self._listener_tasks[chat_id] = asyncio.create_task(async_listener())
+    async def run_listener(self, chat_id: int):
+        await self._ensure_started()
+        self._local_users.add(chat_id)
+        await self._sync_presence(chat_id)
 
     async def stop_listener(self, chat_id: int):
-        task = self._listener_tasks.get(chat_id)
-        if task:
-            task.cancel()
+        self._local_users.discard(chat_id)
+        await self._sync_presence(chat_id)
+
+    async def is_connected_elsewhere(self, chat_id: int) -> bool:
+        try:
+            nodes = await self._presence.get_user_nodes(chat_id)
+        except RedisError as e:
+            logger.error(f"Не удалось получить узлы пользователя {chat_id}: {e}")
+            return False
+        nodes.discard(self._presence.node_id)
+        return bool(nodes)
+
+    async def _ensure_started(self):
+        if self._heartbeat_task is None or self._heartbeat_task.done():
+            await self._heartbeat()
+            self._heartbeat_task = asyncio.create_task(self._run_heartbeat())
+
+        if self._reader_task is None or self._reader_task.done():
+            await self._start_reader()
+
+    async def _start_reader(self):
+        await self._pubsub.subscribe(self._node_channel(self._presence.node_id))
+        self._reader_task = asyncio.create_task(self._read_messages())
+
+    async def _sync_presence(self, chat_id: int):
+        """
+        Приводит запись пользователя в реестре присутствия в соответствие с его локальными сокетами.
+        Вызовы сериализуются, поэтому быстрые подключения/отключения не путают порядок команд.
+        """
+        async with self._presence_lock:
+            required = chat_id in self._local_users
+            try:
+                if required and chat_id not in self._registered:
+                    await self._presence.add_user(chat_id)
+                    self._registered.add(chat_id)
+                elif not required and chat_id in self._registered:
+                    await self._presence.remove_user(chat_id)
+                    self._registered.discard(chat_id)
+            except RedisError as e:
+                logger.error(f"Не удалось обновить присутствие пользователя {chat_id}: {e}")
+
+    async def _run_heartbeat(self):
+        while True:
+            await asyncio.sleep(self._heartbeat_interval)
+            try:
+                await self._heartbeat()
+            except RedisError as e:
+                logger.error(f"Не удалось отправить heartbeat узла: {e}")
+
+    async def _heartbeat(self):
+        # Под блокировкой реестра: иначе heartbeat вернул бы запись только что отключившегося пользователя.
+        async with self._presence_lock:
+            await self._presence.heartbeat(self._registered)
+
+    async def close(self):
+        for task in (self._heartbeat_task, self._reader_task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass  # Это ожидаемая ошибка при отмене задач
+        self._heartbeat_task = self._reader_task = None
+        try:
+            if self._pubsub.subscribed:
+                await self._pubsub.unsubscribe()
+            await self._pubsub.aclose()
+        except RedisError as e:
+            logger.error(f"Не удалось отписаться от канала узла: {e}")
+        async with self._presence_lock:
+            try:
+                await self._presence.leave(list(self._registered))
+            except RedisError as e:
+                logger.error(f"Не удалось удалить узел из реестра присутствия: {e}")
+            self._registered.clear()
+
+    async def _read_messages(self):
+        while True:
+            try:
+                # Блокирующее чтение без периодического опроса.
+                msg = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=None)
+            except RedisError as e:
+                logger.error(f"Ошибка чтения из Redis Pub/Sub: {e}")
+                await asyncio.sleep(1)
+                continue
+
+            if msg is None or msg["type"] != "message" or msg["data"] is None:
+                continue
+
+            recipient, droppable, payload = msg["data"].split(b":", 2)
+            if self._receiver is not None:
+                self._receiver(Frame(data=payload, droppable=droppable == b"1"), int(recipient))
+
+
+class RedisStreamsBroadcastManager(RedisBroadcastManager):
+    """
+    Broadcast между узлами через Redis Streams с восстановлением после переподключения.
+
+    Каждое сообщение добавляется в ограниченный поток получателя `stream:user:{id}`
+    (по длине `max_len` и возрасту `max_age` секунд), а на удаленные узлы получателя
+    доставляется через потоки узлов `stream:node:{node_id}`.
+    Клиент передает последний полученный `streamId` при подключении и получает только пропущенное.
+    События присутствия в поток получателя не записываются.
+    """
+
+    node_stream_max_len = 10000
+
+    def __init__(
+        self, redis: Redis, presence: ClusterPresence, heartbeat_interval: int, max_len: int, max_age: int
+    ):
+        super().__init__(redis, presence, heartbeat_interval)
+        self._max_len = max_len
+        self._max_age = max_age
+        self._last_node_entry = "$"
+
+    @staticmethod
+    def _user_stream(chat_id: int) -> str:
+        return f"stream:user:{chat_id}"
+
+    @staticmethod
+    def _node_stream(node_id: str) -> str:
+        return f"stream:node:{node_id}"
+
+    async def append(self, frame: Frame, chat_id: int) -> Frame:
+        if frame.droppable:
+            return frame
+
+        key = self._user_stream(chat_id)
+        min_id = int((time.time() - self._max_age) * 1000)
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.xadd(key, {"d": frame.data}, maxlen=self._max_len, approximate=True)
+                pipe.xtrim(key, minid=min_id, approximate=True)
+                pipe.expire(key, self._max_age)
+                stream_id, *_ = await pipe.execute()
+        except RedisError as e:
+            logger.error(f"Не удалось записать сообщение в поток пользователя {chat_id}: {e}")
+            return frame
+        return frame.with_stream_id(stream_id.decode())
+
+    async def read_since(self, chat_id: int, stream_id: str) -> list[Frame]:
+        key = self._user_stream(chat_id)
+        try:
+            first = await self.redis.xrange(key, count=1)
+            entries = await self.redis.xrange(key, min=f"({stream_id}")
+        except RedisError as e:
+            logger.error(f"Не удалось прочитать поток пользователя {chat_id}: {e}")
+            return [Frame.system("resync", "История недоступна, загрузите последние сообщения")]
+
+        frames = []
+        # Если `stream_id` уже удален из потока, часть сообщений после него могла быть обрезана.
+        if not first or stream_id_key(first[0][0].decode()) > stream_id_key(stream_id):
+            frames.append(Frame.system("resync", "Часть истории недоступна, загрузите последние сообщения"))
+        for entry_id, fields in entries:
+            frames.append(Frame(data=fields[b"d"]).with_stream_id(entry_id.decode()))
+        return frames
+
+    async def send(self, frame: Frame, chat_id: int):
+        try:
+            nodes = await self._presence.get_user_nodes(chat_id)
+            nodes.discard(self._presence.node_id)
+            nodes -= self.local_nodes
+            if not nodes:
+                return
+            fields = {"r": chat_id, "p": int(frame.droppable), "s": frame.stream_id or "", "d": frame.data}
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for node in nodes:
+                    key = self._node_stream(node)
+                    pipe.xadd(key, fields, maxlen=self.node_stream_max_len, approximate=True)
+                    # Поток остановленного узла удаляется сам.
+                    pipe.expire(key, self._presence.node_ttl * 2)
+                await pipe.execute()
+        except RedisError as e:
+            logger.error(f"Не удалось отправить сообщение пользователю {chat_id} на другие узлы: {e}")
+
+    async def _start_reader(self):
+        self._reader_task = asyncio.create_task(self._read_messages())
+
+    async def _read_messages(self):
+        key = self._node_stream(self._presence.node_id)
+        while True:
             try:
-                await task
-            except asyncio.CancelledError:
-                pass  # Это ожидаемая ошибка при отмене задач
+                # Блокирующее чтение, позиция сохраняется между вызовами, поэтому записи не теряются.
+                response = await self.redis.xread({key: self._last_node_entry}, count=100, block=0)
+            except RedisError as e:
+                logger.error(f"Ошибка чтения потока узла: {e}")
+                await asyncio.sleep(1)
+                continue
+
+            for _, entries in response or ():
+                for entry_id, fields in entries:
+                    self._last_node_entry = entry_id
+                    if self._receiver is not None:
+                        frame = Frame(
+                            data=fields[b"d"],
+                            droppable=fields[b"p"] == b"1",
+                            stream_id=fields[b"s"].decode() or None,
+                        )
+                        self._receiver(frame, int(fields[b"r"]))
 
 
 class LocalBroadcastManager(BroadcastManager):
-    async def send(self, message: MessageResponseSchema, chat_id: int):
-        print(f"{chat_id}: {message}")
+    """Broadcast в пределах одного процесса: все подключения обслуживает ConnectionManager."""
+
+    async def send(self, frame: Frame, chat_id: int):
+        pass
 
-    async def run_listener(self, websocket: WebSocket, chat_id: int):
+    async def run_listener(self, chat_id: int):
         pass
 
     async def stop_listener(self, chat_id: int):
         pass
 
+    async def is_connected_elsewhere(self, chat_id: int) -> bool:
+        return False
+
 
 @singleton
 class ConnectionManager:
-    def __init__(self, broadcast: BroadcastManager, storage: MessagesStorage, cache: AbstractCache):
-        self._active_connections: dict[int, list[WebSocket]] = {}
+    def __init__(
+        self,
+        broadcast: BroadcastManager,
+        storage: MessagesStorage,
+        cache: AbstractCache,
+        flood_control: FloodControl | None = None,
+    ):
+        self._active_connections: dict[int, list[Connection]] = {}
+        self.flood_control = flood_control or create_flood_control()
+        # Узел готовится к перезапуску: новые подключения не принимаются.
+        self.draining = False
         self._storage = storage
         self._broadcast_manager = broadcast
+        self._broadcast_manager.set_receiver(self.send_message_locally)
         self._cache = cache
-
-        asyncio.create_task(self._check_user_online_status())
-
-    async def connect(self, websocket: WebSocket, user_id: int):
-        """Подключение пользователя."""
-        self._active_connections.setdefault(user_id, []).append(websocket)
-
-        # Подписываемся на обновления сообщений.
-        await self._broadcast_manager.run_listener(websocket, user_id)
-        await self._set_online(user_id)
-
-    async def disconnect(self, websocket: WebSocket, user_id: int):
-        self._active_connections[user_id].remove(websocket)
-        await self._broadcast_manager.stop_listener(user_id)
-
-    async def send_message_locally(self, message: MessageResponseSchema, chat_id: int):
-        tasks = []
-        for connection in self._active_connections.get(chat_id, []):
-            tasks.append(self._send_message_to_websocket(connection, message))
-        await asyncio.gather(*tasks)  # Параллельно отправляем сообщения
-
-    @staticmethod
-    async def _send_message_to_websocket(websocket: WebSocket, message: MessageResponseSchema):
-        try:
-            await websocket.send_text(message.model_dump_json(by_alias=True))
-        except WebSocketDisconnect:
-            pass
-
-    async def analyze_message(self, data: str, sender_user_id: int):
+        self._presence = PresenceEngine(
+            cache,
+            notify=self._send_status_to_all_friendships,
+            is_connected_elsewhere=broadcast.is_connected_elsewhere,
+            ttl=settings.presence_ttl,
+            heartbeat_interval=settings.presence_heartbeat_interval,
+            offline_delay=settings.presence_offline_delay,
+        )
+        self._presence.start()
+        self._delivery_slots = asyncio.Semaphore(settings.ingest_delivery_concurrency)
+        self._pipeline = IngestPipeline(
+            deliver=self._deliver_messages,
+            update_cache=self._update_last_messages,
+            store=storage.process_messages,
+            max_size=settings.ingest_queue_max_size,
+            batch_size=settings.ingest_batch_max_size,
+        )
+        self._pipeline.start()
+
+    async def connect(
+        self,
+        websocket: WebSocket,
+        user_id: int,
+        batch: bool = False,
+        codec: Codec = json_codec,
+        last_stream_id: str | None = None,
+    ) -> Connection:
+        """
+        Подключение пользователя.
+
+        :param websocket: Сокет пользователя.
+        :param user_id: Идентификатор пользователя.
+        :param batch: Объединять исходящие кадры, пришедшие в пределах окна, в один массив.
+        :param codec: Формат сообщений подключения.
+        :param last_stream_id: Последний полученный клиентом `streamId`, пропущенные после него
+         сообщения будут отправлены первыми.
+        """
+        connection = Connection(
+            websocket,
+            user_id,
+            max_frames=settings.ws_send_queue_max_frames,
+            max_bytes=settings.ws_send_queue_max_bytes,
+            slow_timeout=settings.ws_slow_consumer_timeout,
+            batch_size=settings.ws_batch_max_size if batch else 1,
+            batch_window=settings.ws_batch_window_ms / 1000,
+            codec=codec,
+        )
+
+        connections = self._active_connections.setdefault(user_id, [])
+        connections.append(connection)
+        if len(connections) == 1:
+            # Подписываемся на обновления сообщений.
+            await self._broadcast_manager.run_listener(user_id)
+        if last_stream_id is not None:
+            # Новые сообщения уже копятся в очереди, пропущенные ставятся перед ними.
+            connection.resume(await self._broadcast_manager.read_since(user_id, last_stream_id))
+        connection.start()
+        await self._presence.connected(user_id)
+        return connection
+
+    async def disconnect(self, connection: Connection):
+        await connection.stop()
+        user_id = connection.user_id
+        connections = self._active_connections.get(user_id, [])
+        if connection in connections:
+            connections.remove(connection)
+        if not connections:
+            self._active_connections.pop(user_id, None)
+            self.flood_control.forget(user_id)
+            await self._broadcast_manager.stop_listener(user_id)
+        await self._presence.disconnected(user_id, reconnect_delay=connection.reconnect_delay)
+
+    async def drain(self, window: float, reconnect_jitter: float):
+        """
+        Плавно отключает все сокеты узла перед перезапуском.
+
+        Каждый клиент получает служебное сообщение `reconnect` со случайной задержкой
+        переподключения (`reconnectDelay`, мс, до `reconnect_jitter` секунд), а сокеты закрываются
+        равномерно в течение `window` секунд. Затем дожидается обработки принятых сообщений
+        и выгрузки буфера хранилища.
+        """
+        if self.draining:
+            return
+        self.draining = True
+
+        connections = [connection for items in self._active_connections.values() for connection in items]
+        random.shuffle(connections)
+        logger.warning(f"Отключение узла: {len(connections)} подключений в течение {window} с")
+
+        for connection in connections:
+            # Пока клиент ждет переподключения, друзья не получают offline (см. PresenceEngine).
+            connection.reconnect_delay = random.uniform(0, reconnect_jitter)
+            delay = int(connection.reconnect_delay * 1000)
+            connection.enqueue(
+                Frame.system("reconnect", "Сервер перезапускается", extra={"reconnectDelay": delay})
+            )
+
+        interval = window / len(connections) if connections else 0
+        for connection in connections:
+            await connection.close(status.WS_1012_SERVICE_RESTART)
+            await asyncio.sleep(interval)
+
+        await self.flush()
+        await self._storage.flush()
+        await self._broadcast_manager.close()
+        logger.warning("Отключение узла завершено")
+
+    def send_message_locally(self, frame: Frame, chat_id: int):
+        # Кадр ставится в очереди подключений без ожидания отправки.
+        for connection in self._active_connections.get(chat_id, ()):
+            connection.enqueue(frame)
+
+    def stats(self, top: int = 20) -> dict:
+        """Статистика очередей отправки подключений узла."""
+        connections = [connection for items in self._active_connections.values() for connection in items]
+        return {
+            "users": len(self._active_connections),
+            "connections": len(connections),
+            "queued_frames": sum(connection.depth for connection in connections),
+            "dropped_frames": sum(connection.dropped for connection in connections),
+            "pipeline": self._pipeline.stats(),
+            "flood_control": self.flood_control.stats(),
+            "cache": self._cache.stats(),
+            "deepest": [
+                connection.stats()
+                for connection in heapq.nlargest(top, connections, key=lambda connection: connection.depth)
+            ],
+        }
+
+    async def analyze_message(self, data: str | bytes, sender_user_id: int, codec: Codec = json_codec):
         try:
-            msg = MessageRequestSchema.model_validate_json(data)
+            msg = codec.decode_request(data)
             if msg.type == "message" and msg.recipient_id:
                 response = MessageResponseSchema(
                     type=msg.type,
@@ -139,81 +507,105 @@ class ConnectionManager:
                     sender_id=sender_user_id,
                     created_at=int(datetime.now().timestamp() * 1000),
                 )
-                # Сначала отправляем.
-                await self.broadcast(response, msg.recipient_id)
-                # Перезаписываем в кеш.
-                await update_last_message(response, self._cache)
-                # Затем обрабатываем сохранение.
-                await self._storage.process_message(response)
-
-        except ValidationError as e:
-            print(e)
+                # Доставка, кеш и сохранение выполняются в фоне, здесь только постановка в очередь.
+                await self._pipeline.submit(response)
+
+        except (ValidationError, ValueError) as e:
+            logger.error(f"Некорректное сообщение от пользователя {sender_user_id}: {e}")
+
+    async def flush(self):
+        """Ожидает доставки и сохранения всех принятых сообщений."""
+        await self._pipeline.join()
+
+    async def _deliver_messages(self, messages: list[MessageResponseSchema]):
+        # Медленный получатель (или запрос в Redis) не задерживает остальных: получатели пачки
+        # обслуживаются параллельно, а сообщения одному получателю отправляются по порядку.
+        by_recipient: dict[int, list[MessageResponseSchema]] = {}
+        for message in messages:
+            by_recipient.setdefault(message.recipient_id, []).append(message)
+
+        async def deliver(recipient_messages: list[MessageResponseSchema]):
+            async with self._delivery_slots:
+                for message in recipient_messages:
+                    await self.broadcast(message, message.recipient_id)
+
+        # Следующая пачка начинается только после завершения всех доставок этой,
+        # иначе сообщения одного получателя из разных пачек могли бы поменяться местами.
+        results = await asyncio.gather(*map(deliver, by_recipient.values()), return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+
+    async def _update_last_messages(self, messages: list[MessageResponseSchema]):
+        # Для каждого диалога в кеш записывается только последнее сообщение пачки, одним запросом.
+        await update_last_messages(messages, self._cache)
 
     async def broadcast(self, message: MessageResponseSchema, chat_id: int):
-        if self._active_connections.get(chat_id, []):
-            # Оба пользователя на одном сервере, передаем сообщение напрямую
-            await self.send_message_locally(message, chat_id)
-        else:
-            # Пользователи на разных серверах, используем Redis для передачи
-            await self._broadcast_manager.send(message, chat_id)
-
-    async def _check_user_online_status(self):
-        while True:
-            for user_id, connections in list(self._active_connections.items()):
-                if connections:
-                    # Пользователь находится в сети.
-                    await self._set_online(user_id)
+        await self.broadcast_frame(Frame.from_schema(message), chat_id)
 
-                # Если до этого был онлайн.
-                elif await is_user_online(user_id, self._cache):
-                    # Пользователь вышел из сети.
-                    await self._set_offline(user_id)
-
-            await asyncio.sleep(5)
-
-    async def _set_online(self, user_id: int):
-        """Пользователь находится в сети."""
-        await set_user_online(user_id, self._cache)
-        await self._send_status_to_all_friendships(user_id, "online")
-
-    async def _set_offline(self, user_id: int):
-        """Пользователь вышел из сети."""
-        await set_user_offline(user_id, self._cache)
-        await self._send_status_to_all_friendships(user_id, "offline")
+    async def broadcast_frame(self, frame: Frame, chat_id: int):
+        frame = await self._broadcast_manager.append(frame, chat_id)
+        # У получателя могут быть подключения на этом узле, передаем сообщение напрямую.
+        self.send_message_locally(frame, chat_id)
+        # Остальные устройства получателя могут быть подключены к другим узлам.
+        await self._broadcast_manager.send(frame, chat_id)
 
     async def _send_status_to_all_friendships(self, user_id: int, status: str):
+        """Рассылает смену статуса пользователя друзьям, находящимся в сети."""
         async with db_manager.session() as session:
             friendships = await get_user_friendships(session, user_id, self._cache)
-            tasks = []
-            for friendship in friendships:
-                if friendship.id == user_id:
-                    # Пропускаем самого себя.
-                    continue
-
-                if await is_user_online(friendship.id, self._cache):
-                    message = MessageResponseSchema(
-                        type="change_status",
-                        status=status,
-                        recipient_id=friendship.id,
-                        sender_id=user_id,
-                        message=f"Пользователь {user_id} {status}.",
-                        created_at=int(datetime.now().timestamp() * 1000),
-                    )
-                    tasks.append(self.broadcast(message, friendship.id))
-            await asyncio.gather(*tasks)  # Параллельная отправка статусов
 
-
-logger = getLogger(__name__)
+        # Пропускаем самого себя.
+        online = await get_users_online([friendship.id for friendship in friendships], self._cache)
+        recipients = [
+            friend_id for friend_id, is_online in online.items() if is_online and friend_id != user_id
+        ]
+
+        message = MessageResponseSchema(
+            type="change_status",
+            status=status,
+            recipient_id=user_id,
+            sender_id=user_id,
+            message=f"Пользователь {user_id} {status}.",
+            created_at=int(datetime.now().timestamp() * 1000),
+        )
+        # Сообщение сериализуется один раз, для каждого друга подставляется только получатель.
+        tasks = [
+            self.broadcast_frame(frame, recipient)
+            for recipient, frame in frames_for_recipients(message, recipients, droppable=True)
+        ]
+        await asyncio.gather(*tasks)  # Параллельная отправка статусов
 
 
 @cache
-def get_redis_broadcast_manager() -> BroadcastManager:
-    logger.info("Использование Redis очереди в качестве broadcast")
+def get_broadcast_redis() -> Redis:
     pool = ConnectionPool.from_url(
         settings.broadcast_redis_url,
         max_connections=settings.broadcast_redis_max_connections,
     )
-    return RedisBroadcastManager(Redis(connection_pool=pool))
+    return Redis(connection_pool=pool)
+
+
+@cache
+def get_redis_broadcast_manager() -> BroadcastManager:
+    logger.info("Использование Redis очереди в качестве broadcast")
+    redis = get_broadcast_redis()
+    presence = ClusterPresence(redis, node_id=settings.node_id, node_ttl=settings.node_ttl)
+    return RedisBroadcastManager(redis, presence, heartbeat_interval=settings.node_heartbeat_interval)
+
+
+@cache
+def get_redis_streams_broadcast_manager() -> BroadcastManager:
+    logger.info("Использование Redis Streams в качестве broadcast")
+    redis = get_broadcast_redis()
+    presence = ClusterPresence(redis, node_id=settings.node_id, node_ttl=settings.node_ttl)
+    return RedisStreamsBroadcastManager(
+        redis,
+        presence,
+        heartbeat_interval=settings.node_heartbeat_interval,
+        max_len=settings.broadcast_stream_max_len,
+        max_age=settings.broadcast_stream_max_age,
+    )
 
 
 @cache
@@ -223,12 +615,75 @@ def get_local_broadcast_manager() -> BroadcastManager:
 
 
 @cache
-def get_broadcast_manager() -> BroadcastManager:
-    if settings.broadcast_type == "redis":
+def get_cluster_broadcast_manager() -> BroadcastManager:
+    if settings.broadcast_type == BroadcastType.REDIS:
         return get_redis_broadcast_manager()
+    if settings.broadcast_type == BroadcastType.REDIS_STREAMS:
+        return get_redis_streams_broadcast_manager()
     return get_local_broadcast_manager()
 
 
+@cache
+def get_broadcast_manager() -> BroadcastManager:
+    if settings.workers_ipc_dir:
+        logger.info(f"Обмен сообщениями между воркерами хоста через {settings.workers_ipc_dir}")
+        from .ipc import HostBroadcastManager
+
+        return HostBroadcastManager(
+            get_cluster_broadcast_manager(), node_id=settings.node_id, ipc_dir=settings.workers_ipc_dir
+        )
+    return get_cluster_broadcast_manager()
+
+
+def get_active_connection_manager() -> "ConnectionManager | None":
+    """Возвращает менеджер подключений, если он уже был создан."""
+    return getattr(ConnectionManager.__wrapped__, "_instance", None)
+
+
+async def drain_connections(window: float | None = None):
+    """Переводит узел в режим отключения (см. :meth:`ConnectionManager.drain`)."""
+    manager = get_active_connection_manager()
+    if manager is None:
+        return
+    await manager.drain(
+        window=settings.drain_window if window is None else window,
+        reconnect_jitter=settings.drain_reconnect_jitter,
+    )
+
+
+_drain_task: Task | None = None
+
+
+def install_drain_signal_handler():
+    """Запускает отключение узла по сигналу SIGUSR1."""
+
+    def on_signal():
+        global _drain_task
+        if _drain_task is None:
+            _drain_task = asyncio.create_task(drain_connections())
+
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, on_signal)
+    except (ValueError, RuntimeError, NotImplementedError) as e:
+        # Сигналы доступны только в главном потоке и не на всех платформах.
+        logger.warning(f"Отключение узла по сигналу SIGUSR1 недоступно: {e}")
+
+
+def create_flood_control() -> FloodControl:
+    # В кластере лимит пользователя дополнительно контролируется общим счетчиком в Redis.
+    redis = get_broadcast_redis() if settings.broadcast_type != BroadcastType.LOCAL else None
+    return FloodControl(
+        connection_rate=settings.ws_rate_connection,
+        connection_burst=settings.ws_rate_connection_burst,
+        user_rate=settings.ws_rate_user,
+        user_burst=settings.ws_rate_user_burst,
+        max_message_bytes=settings.ws_max_message_bytes,
+        max_violations=settings.ws_rate_max_violations,
+        cluster_window=settings.ws_rate_cluster_window,
+        redis=redis,
+    )
+
+
 @cache
 def get_db_message_storage() -> MessagesStorage:
     logger.info("Использование БД в качестве хранилища сообщений")
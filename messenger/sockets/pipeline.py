@@ -0,0 +1,136 @@
+import asyncio
+import statistics
+import time
+from asyncio import Queue, Task
+from collections import deque
+from logging import getLogger
+from typing import Awaitable, Callable
+
+from .schemas import MessageResponseSchema
+
+logger = getLogger(__name__)
+
+BatchHandler = Callable[[list[MessageResponseSchema]], Awaitable[None]]
+
+
+class Stage:
+    """
+    Этап обработки входящих сообщений: ограниченная очередь и одна задача-обработчик.
+
+    Обработчик получает сообщения пачками (до `batch_size`) в порядке поступления,
+    поэтому порядок сообщений каждого диалога сохраняется. Обработанная пачка передается
+    в следующие этапы. Если очередь заполнена, `put` ожидает освобождения места.
+    """
+
+    def __init__(self, name: str, handler: BatchHandler, max_size: int, batch_size: int):
+        self.name = name
+        self._handler = handler
+        self._batch_size = batch_size
+        self._queue: Queue[tuple[float, MessageResponseSchema]] = Queue(maxsize=max_size)
+        self._next: list[Stage] = []
+        self._task: Task | None = None
+
+        self.processed = 0
+        self.batches = 0
+        self.errors = 0
+        self.max_depth = 0
+        # Время от постановки в очередь до завершения обработки последних сообщений (мс).
+        self._latencies: deque[float] = deque(maxlen=1000)
+
+    def then(self, *stages: "Stage") -> "Stage":
+        self._next.extend(stages)
+        return self
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass  # Это ожидаемая ошибка при отмене задач
+
+    async def put(self, message: MessageResponseSchema):
+        await self._queue.put((time.perf_counter(), message))
+        self.max_depth = max(self.max_depth, self._queue.qsize())
+
+    async def join(self):
+        """Ожидает обработки всех сообщений, поставленных в очередь."""
+        await self._queue.join()
+
+    def stats(self) -> dict:
+        latencies = sorted(self._latencies)
+        return {
+            "depth": self._queue.qsize(),
+            "max_depth": self.max_depth,
+            "processed": self.processed,
+            "batches": self.batches,
+            "errors": self.errors,
+            "latency_ms_p50": round(statistics.median(latencies), 3) if latencies else None,
+            "latency_ms_max": round(latencies[-1], 3) if latencies else None,
+        }
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self._batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            messages = [message for _, message in batch]
+            try:
+                await self._handler(messages)
+            except Exception as exc:
+                self.errors += 1
+                logger.exception(f"Ошибка этапа {self.name}: {exc}")
+
+            now = time.perf_counter()
+            self._latencies.extend((now - enqueued_at) * 1000 for enqueued_at, _ in batch)
+            self.processed += len(batch)
+            self.batches += 1
+
+            for stage in self._next:
+                for message in messages:
+                    await stage.put(message)
+            for _ in batch:
+                self._queue.task_done()
+
+
+class IngestPipeline:
+    """
+    Обработка входящих сообщений вне цикла чтения сокета.
+
+    Сначала этап `delivery` доставляет сообщения получателям, затем пачки передаются
+    в независимые этапы `last_message` (кеш последних сообщений) и `storage` (сохранение).
+    Отправитель ожидает только постановку сообщения в очередь доставки.
+    """
+
+    def __init__(
+        self,
+        deliver: BatchHandler,
+        update_cache: BatchHandler,
+        store: BatchHandler,
+        max_size: int,
+        batch_size: int,
+    ):
+        self.last_message = Stage("last_message", update_cache, max_size, batch_size)
+        self.storage = Stage("storage", store, max_size, batch_size)
+        self.delivery = Stage("delivery", deliver, max_size, batch_size).then(self.last_message, self.storage)
+        self._stages = [self.delivery, self.last_message, self.storage]
+
+    def start(self):
+        for stage in self._stages:
+            stage.start()
+
+    async def submit(self, message: MessageResponseSchema):
+        await self.delivery.put(message)
+
+    async def join(self):
+        """Ожидает обработки всех принятых сообщений всеми этапами."""
+        for stage in self._stages:
+            await stage.join()
+
+    def stats(self) -> dict:
+        return {stage.name: stage.stats() for stage in self._stages}
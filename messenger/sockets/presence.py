@@ -0,0 +1,129 @@
+import asyncio
+from asyncio import Task
+from logging import getLogger
+from typing import Awaitable, Callable
+
+from .status import set_user_online, set_users_online, set_user_offline, is_user_online
+from ..cache import AbstractCache
+
+logger = getLogger(__name__)
+
+StatusNotifier = Callable[[int, str], Awaitable[None]]
+ElsewhereChecker = Callable[[int], Awaitable[bool]]
+
+
+class PresenceEngine:
+    """
+    Присутствие пользователей текущего узла.
+
+    События online/offline рассылаются только при смене состояния:
+    - первое подключение пользователя -> online (если он не был в сети на другом узле);
+    - последнее отключение -> offline через `offline_delay` секунд (плюс задержка переподключения,
+      если подключение закрыто при отключении узла), если пользователь не переподключился
+      и не подключен к другим узлам.
+
+    Статус online хранится в кэше с TTL, который периодически продлевается,
+    поэтому после падения узла его пользователи сами становятся offline.
+    """
+
+    def __init__(
+        self,
+        cache: AbstractCache,
+        notify: StatusNotifier,
+        is_connected_elsewhere: ElsewhereChecker,
+        ttl: int,
+        heartbeat_interval: int,
+        offline_delay: float,
+    ):
+        self._cache = cache
+        self._notify = notify
+        self._is_connected_elsewhere = is_connected_elsewhere
+        self._ttl = ttl
+        self._heartbeat_interval = heartbeat_interval
+        self._offline_delay = offline_delay
+
+        self._connections: dict[int, int] = {}
+        self._online: set[int] = set()
+        self._pending_offline: dict[int, Task] = {}
+        # Пользователи, для которых уже записывается offline: такую задачу отменять нельзя.
+        self._writing_offline: set[int] = set()
+        self._heartbeat_task: Task | None = None
+
+    def start(self):
+        if self._heartbeat_task is None or self._heartbeat_task.done():
+            self._heartbeat_task = asyncio.create_task(self._run_heartbeat())
+
+    @property
+    def online_count(self) -> int:
+        return len(self._online)
+
+    async def connected(self, user_id: int):
+        """Новое подключение пользователя к узлу."""
+        self._connections[user_id] = self._connections.get(user_id, 0) + 1
+        if self._connections[user_id] > 1:
+            return
+
+        if pending := self._pending_offline.pop(user_id, None):
+            if user_id not in self._writing_offline:
+                # Быстрое переподключение: пользователь не успел стать offline.
+                pending.cancel()
+                return
+            # Статус offline уже записывается, после записи пользователь снова отмечается online.
+            await asyncio.wait([pending])
+            if user_id not in self._connections:
+                return
+
+        self._online.add(user_id)
+        was_online = await is_user_online(user_id, self._cache)
+        await set_user_online(user_id, self._cache, expire=self._ttl)
+        if not was_online:
+            await self._notify(user_id, "online")
+
+    async def disconnected(self, user_id: int, reconnect_delay: float = 0):
+        """
+        Отключение одного из подключений пользователя.
+
+        :param reconnect_delay: Через сколько секунд клиент переподключится (отключение узла),
+         offline откладывается на это время.
+        """
+        count = self._connections.get(user_id, 0) - 1
+        if count > 0:
+            self._connections[user_id] = count
+            return
+
+        self._connections.pop(user_id, None)
+        if user_id in self._online and user_id not in self._pending_offline:
+            self._pending_offline[user_id] = asyncio.create_task(
+                self._go_offline_later(user_id, self._offline_delay + reconnect_delay)
+            )
+
+    async def _go_offline_later(self, user_id: int, delay: float):
+        # Задача остается в `_pending_offline` до завершения, поэтому переподключение во время
+        # проверки других узлов отменяет ее, а во время записи offline - дожидается ее.
+        try:
+            await asyncio.sleep(delay)
+            elsewhere = await self._is_connected_elsewhere(user_id)
+            self._online.discard(user_id)
+            if elsewhere:
+                return
+            self._writing_offline.add(user_id)
+            await set_user_offline(user_id, self._cache)
+            await self._notify(user_id, "offline")
+        except Exception as exc:
+            self._online.discard(user_id)
+            logger.error(f"Не удалось отметить пользователя {user_id} offline: {exc}")
+        finally:
+            self._writing_offline.discard(user_id)
+            if self._pending_offline.get(user_id) is asyncio.current_task():
+                del self._pending_offline[user_id]
+
+    async def _run_heartbeat(self):
+        while True:
+            await asyncio.sleep(self._heartbeat_interval)
+            if not self._online:
+                continue
+            # Продлеваем TTL статусов одним запросом, без обращений к БД и рассылки событий.
+            try:
+                await set_users_online(list(self._online), self._cache, expire=self._ttl)
+            except Exception as exc:
+                logger.error(f"Не удалось продлить статус {len(self._online)} пользователей: {exc}")
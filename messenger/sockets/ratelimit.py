@@ -0,0 +1,186 @@
+import asyncio
+import enum
+import time
+import weakref
+from asyncio import Task
+from logging import getLogger
+
+from redis.asyncio import Redis, RedisError
+
+from .connection import Connection
+from .frames import Frame
+
+logger = getLogger(__name__)
+
+
+class TokenBucket:
+    """Ведро токенов: `rate` токенов в секунду, не более `burst` одновременно."""
+
+    __slots__ = ("_rate", "_burst", "_tokens", "_updated_at")
+
+    def __init__(self, rate: float, burst: int):
+        self._rate = rate
+        self._burst = burst
+        self._tokens = float(burst)
+        self._updated_at = time.monotonic()
+
+    def consume(self) -> bool:
+        now = time.monotonic()
+        self._tokens = min(self._burst, self._tokens + (now - self._updated_at) * self._rate)
+        self._updated_at = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+
+class Verdict(enum.Enum):
+    ACCEPT = "accept"
+    REJECT = "reject"
+    DISCONNECT = "disconnect"
+
+
+class _UserState:
+    __slots__ = ("bucket", "pending", "synced_at", "blocked_until")
+
+    def __init__(self, bucket: TokenBucket):
+        self.bucket = bucket
+        self.pending = 0
+        self.synced_at = 0.0
+        self.blocked_until = 0.0
+
+
+class _ConnectionState:
+    __slots__ = ("bucket", "violations")
+
+    def __init__(self, bucket: TokenBucket, violations: TokenBucket):
+        self.bucket = bucket
+        self.violations = violations
+
+
+class FloodControl:
+    """
+    Ограничение частоты входящих сообщений WebSocket.
+
+    Проверяются размер сообщения, ведро токенов подключения и общее ведро пользователя
+    на узле (все его устройства). Проверки выполняются в памяти. Если передан `redis`,
+    узел не чаще раза в `sync_interval` секунд добавляет принятые сообщения пользователя
+    в общий счетчик кластера за окно `cluster_window` секунд и при превышении лимита
+    блокирует пользователя до конца окна.
+
+    Нарушителю отправляется служебное сообщение `throttled`, а после `max_violations`
+    нарушений подряд (восстанавливается одно в секунду) подключение закрывается.
+    """
+
+    sync_interval = 1
+
+    def __init__(
+        self,
+        connection_rate: float,
+        connection_burst: int,
+        user_rate: float,
+        user_burst: int,
+        max_message_bytes: int,
+        max_violations: int,
+        cluster_window: int,
+        redis: Redis | None = None,
+    ):
+        self._connection_rate = connection_rate
+        self._connection_burst = connection_burst
+        self._user_rate = user_rate
+        self._user_burst = user_burst
+        self._max_message_bytes = max_message_bytes
+        self._max_violations = max_violations
+        self._cluster_window = cluster_window
+        self._cluster_limit = int(user_rate * cluster_window) + user_burst
+        self._redis = redis
+
+        self._users: dict[int, _UserState] = {}
+        self._connections: weakref.WeakKeyDictionary[Connection, _ConnectionState] = (
+            weakref.WeakKeyDictionary()
+        )
+        self._tasks: set[Task] = set()
+
+        self.rejected = 0
+        self.disconnected = 0
+
+    def check(self, connection: Connection, data: str | bytes) -> Verdict:
+        reason = self._violation(connection, data)
+        if reason is None:
+            return Verdict.ACCEPT
+
+        self.rejected += 1
+        if not self._connection_state(connection).violations.consume():
+            self.disconnected += 1
+            logger.warning(f"Подключение пользователя {connection.user_id} закрыто за превышение лимитов")
+            return Verdict.DISCONNECT
+
+        connection.enqueue(Frame.system("throttled", reason, droppable=True))
+        return Verdict.REJECT
+
+    def forget(self, user_id: int):
+        """Удаляет состояние пользователя после отключения его последнего сокета."""
+        self._users.pop(user_id, None)
+
+    def stats(self) -> dict:
+        return {"users": len(self._users), "rejected": self.rejected, "disconnected": self.disconnected}
+
+    def _violation(self, connection: Connection, data: str | bytes) -> str | None:
+        if self._size(data) > self._max_message_bytes:
+            return f"Сообщение больше {self._max_message_bytes} байт"
+
+        user = self._user_state(connection.user_id)
+        if user.blocked_until > time.time():
+            return "Превышен лимит сообщений, попробуйте позже"
+        # Ведро подключения проверяется первым, чтобы одно устройство не расходовало лимит остальных.
+        if not self._connection_state(connection).bucket.consume() or not user.bucket.consume():
+            return "Слишком много сообщений, попробуйте позже"
+
+        if self._redis is not None:
+            user.pending += 1
+            now = time.monotonic()
+            if now - user.synced_at >= self.sync_interval:
+                user.synced_at = now
+                self._spawn(self._sync_user(connection.user_id, user))
+        return None
+
+    def _size(self, data: str | bytes) -> int:
+        # В UTF-8 символ занимает не более 4 байт, кодировать короткие сообщения не нужно.
+        if isinstance(data, bytes) or len(data) * 4 <= self._max_message_bytes:
+            return len(data)
+        return len(data.encode("utf-8"))
+
+    def _user_state(self, user_id: int) -> _UserState:
+        state = self._users.get(user_id)
+        if state is None:
+            state = self._users[user_id] = _UserState(TokenBucket(self._user_rate, self._user_burst))
+        return state
+
+    def _connection_state(self, connection: Connection) -> _ConnectionState:
+        state = self._connections.get(connection)
+        if state is None:
+            state = self._connections[connection] = _ConnectionState(
+                TokenBucket(self._connection_rate, self._connection_burst),
+                TokenBucket(1, self._max_violations),
+            )
+        return state
+
+    async def _sync_user(self, user_id: int, user: _UserState):
+        count, user.pending = user.pending, 0
+        window = int(time.time() // self._cluster_window)
+        key = f"ratelimit:user:{user_id}:{window}"
+        try:
+            async with self._redis.pipeline(transaction=False) as pipe:
+                pipe.incrby(key, count)
+                pipe.expire(key, self._cluster_window * 2)
+                total, _ = await pipe.execute()
+        except RedisError as e:
+            logger.error(f"Не удалось обновить счетчик сообщений пользователя {user_id}: {e}")
+            return
+        if total > self._cluster_limit:
+            user.blocked_until = (window + 1) * self._cluster_window
+
+    def _spawn(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
@@ -1,14 +1,126 @@
+import time
+from typing import Iterable
+
+from redis.asyncio import Redis
+
 from messenger.cache import AbstractCache
 
 
-async def set_user_online(user_id: int, cache: AbstractCache):
-    await cache.set(f"{user_id}_online", True, expire=-1)
+async def set_user_online(user_id: int, cache: AbstractCache, expire: int = -1):
+    await cache.set(f"{user_id}_online", True, expire=expire)
+
+
+async def set_users_online(user_ids: list[int], cache: AbstractCache, expire: int = -1):
+    """Отмечает пользователей online (продлевает статус) одним запросом к кешу."""
+    await cache.set_many({f"{user_id}_online": True for user_id in user_ids}, expire=expire)
 
 
 async def set_user_offline(user_id: int, cache: AbstractCache):
-    await cache.set(f"{user_id}_online", False, expire=-1)
+    await cache.delete(f"{user_id}_online")
+    await cache.set(f"{user_id}_last_seen", int(time.time() * 1000), expire=-1)
 
 
 async def is_user_online(user_id: int, cache: AbstractCache) -> bool:
     status = await cache.get(f"{user_id}_online")
     return status or False
+
+
+async def get_user_last_seen(user_id: int, cache: AbstractCache) -> int | None:
+    """Возвращает время (мс), когда пользователь последний раз был в сети."""
+    return await cache.get(f"{user_id}_last_seen")
+
+
+async def get_users_online(user_ids: list[int], cache: AbstractCache) -> dict[int, bool]:
+    """Возвращает статус online нескольких пользователей одним запросом к кешу."""
+    statuses = await cache.get_many([f"{user_id}_online" for user_id in user_ids])
+    return {user_id: bool(status) for user_id, status in zip(user_ids, statuses)}
+
+
+async def get_users_last_seen(user_ids: list[int], cache: AbstractCache) -> dict[int, int | None]:
+    """Возвращает время (мс), когда пользователи последний раз были в сети."""
+    return dict(zip(user_ids, await cache.get_many([f"{user_id}_last_seen" for user_id in user_ids])))
+
+
+class ClusterPresence:
+    """
+    Реестр присутствия пользователей в кластере: пользователь -> множество узлов.
+
+    Узлы подтверждают свою работу heartbeat'ом в общем ZSET.
+    Узлы без heartbeat дольше `node_ttl` секунд не учитываются,
+    а их записи у пользователей удаляются при следующем обращении.
+    Записи пользователей живут `node_ttl` секунд и продлеваются heartbeat'ом узлов,
+    на которых пользователь подключен, поэтому записи пользователей остановленных узлов не копятся.
+    """
+
+    nodes_key = "presence:nodes"
+
+    def __init__(self, redis: Redis, node_id: str, node_ttl: int):
+        self._redis = redis
+        self.node_id = node_id
+        self._node_ttl = node_ttl
+        self._alive_nodes: set[str] = set()
+
+    @property
+    def node_ttl(self) -> int:
+        return self._node_ttl
+
+    @staticmethod
+    def _user_key(user_id: int) -> str:
+        return f"presence:user:{user_id}"
+
+    async def add_user(self, user_id: int) -> None:
+        """Отмечает, что у пользователя есть подключения на текущем узле."""
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.sadd(self._user_key(user_id), self.node_id)
+            pipe.expire(self._user_key(user_id), self._node_ttl)
+            await pipe.execute()
+
+    async def remove_user(self, user_id: int) -> None:
+        """Отмечает, что у пользователя не осталось подключений на текущем узле."""
+        await self._redis.srem(self._user_key(user_id), self.node_id)
+
+    async def get_user_nodes(self, user_id: int) -> set[str]:
+        """Возвращает работающие узлы, на которых подключен пользователь."""
+        nodes = {node.decode("utf-8") for node in await self._redis.smembers(self._user_key(user_id))}
+        alive = set()
+        for node in nodes:
+            if await self._is_node_alive(node):
+                alive.add(node)
+            else:
+                await self._redis.srem(self._user_key(user_id), node)
+        return alive
+
+    async def heartbeat(self, user_ids: Iterable[int] = ()) -> None:
+        """
+        Обновляет heartbeat текущего узла и локальный список работающих узлов.
+        Записи пользователей `user_ids`, подключенных к узлу, продлеваются (и восстанавливаются,
+        если истекли, пока Redis был недоступен).
+        """
+        now = time.time()
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.zadd(self.nodes_key, {self.node_id: now})
+            pipe.zremrangebyscore(self.nodes_key, "-inf", now - self._node_ttl)
+            for user_id in user_ids:
+                pipe.sadd(self._user_key(user_id), self.node_id)
+                pipe.expire(self._user_key(user_id), self._node_ttl)
+            pipe.zrange(self.nodes_key, 0, -1)
+            *_, nodes = await pipe.execute()
+        self._alive_nodes = {node.decode("utf-8") for node in nodes}
+
+    async def leave(self, user_ids: Iterable[int] = ()) -> None:
+        """Удаляет текущий узел из кластера и из записей пользователей `user_ids`."""
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.zrem(self.nodes_key, self.node_id)
+            for user_id in user_ids:
+                pipe.srem(self._user_key(user_id), self.node_id)
+            await pipe.execute()
+
+    async def _is_node_alive(self, node: str) -> bool:
+        if node == self.node_id or node in self._alive_nodes:
+            return True
+        # Узел мог появиться после последнего heartbeat, проверяем напрямую.
+        score = await self._redis.zscore(self.nodes_key, node)
+        if score is not None and score > time.time() - self._node_ttl:
+            self._alive_nodes.add(node)
+            return True
+        return False
@@ -1,11 +1,12 @@
 from abc import ABC, abstractmethod
-from datetime import datetime
 
 import aio_pika
 
+from ..cache import get_cache
 from ..orm.session_manager import db_manager
 from .schemas import MessageResponseSchema
-from ..chats.models import Message
+from ..chats.inbox import store_messages
+from ..chats.messages import invalidate_unread_messages_counts
 from ..settings import settings
 
 
@@ -15,25 +16,36 @@ class MessagesStorage(ABC):
     async def process_message(self, message: MessageResponseSchema):
         pass
 
+    async def process_messages(self, messages: list[MessageResponseSchema]):
+        """Обрабатывает пачку сообщений в порядке поступления."""
+        for message in messages:
+            await self.process_message(message)
+
+    async def flush(self):
+        """Дожидается сохранения сообщений, буферизированных в памяти."""
+        pass
+
 
 class NoMessagesStorage(MessagesStorage):
     async def process_message(self, message: MessageResponseSchema):
         pass
 
+    async def process_messages(self, messages: list[MessageResponseSchema]):
+        pass
+
 
 class DatabaseDirectMessagesStorage(MessagesStorage):
 
     async def process_message(self, message: MessageResponseSchema):
+        await self.process_messages([message])
+
+    async def process_messages(self, messages: list[MessageResponseSchema]):
+        # Пачка сообщений и переписки в inbox записываются одной транзакцией.
         async with db_manager.session() as session:
-            session.add(
-                Message(
-                    message=message.message,
-                    sender_id=message.sender_id,
-                    recipient_id=message.recipient_id,
-                    created_at=datetime.now(),
-                )
-            )
+            await store_messages(session, messages)
             await session.commit()
+        # Счетчики загружаются из базы, поэтому сбрасываются только после фиксации сообщений.
+        await invalidate_unread_messages_counts(messages, get_cache())
 
 
 class RabbitMQMessagesStorage(MessagesStorage):
@@ -43,3 +55,6 @@ class RabbitMQMessagesStorage(MessagesStorage):
 
     async def process_message(self, message: MessageResponseSchema):
         await self._rmq_connector.publish_message(message.model_dump_json())
+
+    async def flush(self):
+        await self._rmq_connector.flush(timeout=settings.drain_flush_timeout)
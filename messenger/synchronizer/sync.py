@@ -1,10 +1,10 @@
 from abc import ABC, abstractmethod
-from datetime import datetime
 
-from sqlalchemy import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from messenger.chats.models import Message
+from messenger.cache import get_cache
+from messenger.chats.inbox import store_messages
+from messenger.chats.messages import invalidate_unread_messages_counts
 from messenger.sockets.schemas import MessageResponseSchema
 from messenger.orm.session_manager import db_manager
 
@@ -29,19 +29,9 @@ class DataBaseSynchronizer(BaseSynchronizer):
 
     async def synchronize(self, messages: list[MessageResponseSchema]):
         async with db_manager.session() as session:  # type: AsyncSession
-            stmt = insert(Message).values(
-                [
-                    {
-                        "sender_id": message.sender_id,
-                        "recipient_id": message.recipient_id,
-                        "message": message.message,
-                        "created_at": datetime.fromtimestamp(message.created_at / 1000),
-                    }
-                    for message in messages
-                ]
-            )
-            await session.execute(stmt)
+            await store_messages(session, messages)
             await session.commit()
+        await invalidate_unread_messages_counts(messages, get_cache())
 
 
 class ElasticsearchSynchronizer(BaseSynchronizer):
@@ -0,0 +1,42 @@
+"""messages keyset index
+
+Revision ID: 5c1e7a9d2f40
+Revises: 0bd38dc05b84
+Create Date: 2026-10-18 18:05:12.318204
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "5c1e7a9d2f40"
+down_revision: Union[str, None] = "0bd38dc05b84"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Индекс строится без блокировки записи в таблицу сообщений. Ревизия 8e2b4d61c3a7 заменяет его
+    # индексом (conversation_id, id), но до ее применения по нему читают историю узлы этой версии,
+    # а обычное построение блокирует отправку сообщений на все время построения, сколько бы индекс
+    # ни прожил после.
+    with op.get_context().autocommit_block():
+        op.create_index(
+            op.f("ix__messages__sender_id_recipient_id_id"),
+            "messages",
+            ["sender_id", "recipient_id", "id"],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            op.f("ix__messages__sender_id_recipient_id_id"),
+            table_name="messages",
+            postgresql_concurrently=True,
+        )
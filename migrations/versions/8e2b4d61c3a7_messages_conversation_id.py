@@ -0,0 +1,113 @@
+"""messages conversation id
+
+Revision ID: 8e2b4d61c3a7
+Revises: 5c1e7a9d2f40
+Create Date: 2026-10-18 18:20:41.902517
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "8e2b4d61c3a7"
+down_revision: Union[str, None] = "5c1e7a9d2f40"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Количество строк, заполняемых одной транзакцией.
+BACKFILL_BATCH_SIZE = 10_000
+
+# Значение совпадает с messenger.chats.models.get_conversation_id.
+CONVERSATION_ID = {
+    "postgresql": "(LEAST(sender_id, recipient_id)::bigint << 32) | GREATEST(sender_id, recipient_id)",
+    "sqlite": "(MIN(sender_id, recipient_id) << 32) | MAX(sender_id, recipient_id)",
+}
+
+# Узлы прежней версии продолжают записывать сообщения во время обновления, поле заполняет триггер.
+TRIGGER_FUNCTION = """
+CREATE FUNCTION messages_set_conversation_id() RETURNS trigger AS $$
+BEGIN
+    NEW.conversation_id := (LEAST(NEW.sender_id, NEW.recipient_id)::bigint << 32)
+        | GREATEST(NEW.sender_id, NEW.recipient_id);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql
+"""
+TRIGGER = """
+CREATE TRIGGER messages_set_conversation_id
+BEFORE INSERT OR UPDATE OF sender_id, recipient_id ON messages
+FOR EACH ROW EXECUTE FUNCTION messages_set_conversation_id()
+"""
+
+
+def upgrade() -> None:
+    op.add_column("messages", sa.Column("conversation_id", sa.BigInteger(), nullable=True))
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute(TRIGGER_FUNCTION)
+        op.execute(TRIGGER)
+
+    # Заполнение и построение индексов не блокируют запись: каждая пачка - отдельная транзакция,
+    # индексы строятся CONCURRENTLY.
+    with op.get_context().autocommit_block():
+        _backfill(op.get_bind())
+        op.create_index(
+            op.f("ix__messages__conversation_id_id"),
+            "messages",
+            ["conversation_id", "id"],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            op.f("ix__messages__conversation_id_created_at"),
+            "messages",
+            ["conversation_id", "created_at"],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+        # Заменен индексом (conversation_id, id).
+        op.drop_index(
+            op.f("ix__messages__sender_id_recipient_id_id"),
+            table_name="messages",
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            op.f("ix__messages__sender_id_recipient_id_id"),
+            "messages",
+            ["sender_id", "recipient_id", "id"],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+        op.drop_index(
+            op.f("ix__messages__conversation_id_created_at"),
+            table_name="messages",
+            postgresql_concurrently=True,
+        )
+        op.drop_index(
+            op.f("ix__messages__conversation_id_id"),
+            table_name="messages",
+            postgresql_concurrently=True,
+        )
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute("DROP TRIGGER messages_set_conversation_id ON messages")
+        op.execute("DROP FUNCTION messages_set_conversation_id()")
+    op.drop_column("messages", "conversation_id")
+
+
+def _backfill(connection: sa.Connection):
+    """Заполняет conversation_id существующих сообщений пачками по диапазонам id."""
+    min_id, max_id = connection.execute(sa.text("SELECT min(id), max(id) FROM messages")).one()
+    if max_id is None:
+        return
+    update = sa.text(
+        f"UPDATE messages SET conversation_id = {CONVERSATION_ID[connection.dialect.name]} "
+        "WHERE id > :start AND id <= :end AND conversation_id IS NULL"
+    )
+    for start in range(min_id - 1, max_id, BACKFILL_BATCH_SIZE):
+        connection.execute(update, {"start": start, "end": start + BACKFILL_BATCH_SIZE})
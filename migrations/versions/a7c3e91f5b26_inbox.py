@@ -0,0 +1,119 @@
+"""inbox
+
+Revision ID: a7c3e91f5b26
+Revises: 8e2b4d61c3a7
+Create Date: 2026-10-18 18:42:09.517733
+
+"""
+
+import logging
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from redis import Redis, RedisError
+
+from messenger.cache.serializers import get_serializer
+from messenger.settings import settings
+
+# Дочерний логгер alembic: fileConfig из env.py не отключает его.
+logger = logging.getLogger(f"alembic.{__name__}")
+
+# revision identifiers, used by Alembic.
+revision: str = "a7c3e91f5b26"
+down_revision: Union[str, None] = "8e2b4d61c3a7"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Последнее сообщение каждой переписки.
+BACKFILL = """
+INSERT INTO inbox (user_id, peer_id, last_message_id, last_message, last_sender_id, last_datetime, unread_count)
+SELECT pairs.user_id, pairs.peer_id, messages.id, messages.message, messages.sender_id, messages.created_at, 0
+FROM (
+    SELECT user_id, peer_id, max(id) AS id
+    FROM (
+        SELECT sender_id AS user_id, recipient_id AS peer_id, id FROM messages
+        UNION ALL
+        SELECT recipient_id AS user_id, sender_id AS peer_id, id FROM messages
+    ) AS directions
+    GROUP BY user_id, peer_id
+) AS pairs
+JOIN messages ON messages.id = pairs.id
+"""
+
+SET_LAST_READ_AT = """
+UPDATE inbox SET last_read_at = :read_at WHERE user_id = :user_id AND peer_id = :peer_id
+"""
+
+# Непрочитанные - сообщения собеседника после времени прочтения, как в `mark_inbox_read`.
+BACKFILL_UNREAD = """
+UPDATE inbox SET unread_count = (
+    SELECT count(*) FROM messages
+    WHERE messages.sender_id = inbox.peer_id
+        AND messages.recipient_id = inbox.user_id
+        AND (inbox.last_read_at IS NULL OR messages.created_at > inbox.last_read_at)
+)
+"""
+
+
+def _cached_read_times() -> list[dict]:
+    """
+    Время прочтения переписок до этой версии хранилось только в кеше Redis (`last_read_message_time`).
+    Без Redis (или если он недоступен) непрочитанными считаются все сообщения собеседника.
+    """
+    if not settings.redis_cache_url:
+        return []
+    serializer = get_serializer(settings.cache_serializer)
+    redis = Redis.from_url(settings.redis_cache_url)
+    try:
+        generation = int(redis.hget("cache:generations", "last_read_message_time") or 0)
+        prefix = "last_read_message_time:" if generation == 0 else f"last_read_message_time@{generation}:"
+        keys = list(redis.scan_iter(match=prefix + "*", count=1000))
+        rows = []
+        for start in range(0, len(keys), 1000):
+            batch = keys[start : start + 1000]
+            for key, data in zip(batch, redis.mget(batch)):
+                if data is None:
+                    continue
+                peer_id, user_id = key.decode()[len(prefix) :].split(":")
+                rows.append(
+                    {"user_id": int(user_id), "peer_id": int(peer_id), "read_at": serializer.loads(data)}
+                )
+        return rows
+    except RedisError as e:
+        logger.warning(f"Время прочтения переписок не загружено из Redis, все сообщения непрочитаны: {e}")
+        return []
+    finally:
+        redis.close()
+
+
+def upgrade() -> None:
+    op.create_table(
+        "inbox",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("peer_id", sa.Integer(), nullable=False),
+        sa.Column("last_message_id", sa.Integer(), nullable=True),
+        sa.Column("last_message", sa.Text(), nullable=True),
+        sa.Column("last_sender_id", sa.Integer(), nullable=True),
+        sa.Column("last_datetime", sa.DateTime(), nullable=True),
+        sa.Column("unread_count", sa.Integer(), server_default="0", nullable=False),
+        sa.Column("last_read_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("user_id", "peer_id", name=op.f("pk__inbox")),
+    )
+    op.execute(BACKFILL)
+    if read_times := _cached_read_times():
+        op.get_bind().execute(
+            sa.text(SET_LAST_READ_AT).bindparams(sa.bindparam("read_at", type_=sa.DateTime())), read_times
+        )
+    op.execute(BACKFILL_UNREAD)
+    op.create_index(
+        op.f("ix__inbox__user_id_last_datetime_peer_id"),
+        "inbox",
+        ["user_id", "last_datetime", "peer_id"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix__inbox__user_id_last_datetime_peer_id"), table_name="inbox")
+    op.drop_table("inbox")
@@ -1,5 +1,11 @@
 # Применение миграций
 alembic upgrade head;
 
+# Количество воркеров uvicorn. Воркеры хоста обмениваются сообщениями через Unix сокеты.
+WORKERS=${WORKERS:-1}
+if [ "$WORKERS" -gt 1 ]; then
+  export WORKERS_IPC_DIR=${WORKERS_IPC_DIR:-/tmp/messenger-ipc}
+fi
+
 # Запуск приложения
-uvicorn main:app --host 0.0.0.0 --port 8000;
+uvicorn main:app --host 0.0.0.0 --port 8000 --workers "$WORKERS";
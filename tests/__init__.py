@@ -0,0 +1,6 @@
+import os
+import tempfile
+
+# Настройки читаются при импорте messenger.settings: тесты используют кеш в памяти и временную базу SQLite.
+os.environ.setdefault("REDIS_CACHE_URL", "")
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/messenger.sqlite3")
@@ -0,0 +1,61 @@
+import unittest
+
+import msgpack
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+
+from messenger.settings import settings
+from messenger.sockets.codecs import MsgpackCodec
+
+MALFORMED_FRAMES = {
+    "ключ-массив": b"\x81\x91\x01\x02",
+    "обрезанный кадр": b"\x81\x00",
+    "лишние данные": b"\x93\x01\x02\x03\x04",
+    "неизвестный формат": b"\xc1",
+    "глубокая вложенность": b"\x91" * 5000,
+}
+
+
+class MsgpackDecodeRequestTests(unittest.TestCase):
+    def test_malformed_frames_raise_value_error(self):
+        for name, data in MALFORMED_FRAMES.items():
+            with self.subTest(name), self.assertRaises(ValueError):
+                MsgpackCodec().decode_request(data)
+
+    def test_text_frame_is_rejected(self):
+        with self.assertRaises(ValueError):
+            MsgpackCodec().decode_request('{"type": "message"}')
+
+
+class MsgpackSocketTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        from main import app
+        from messenger.orm.base_model import OrmBase
+
+        engine = create_engine(settings.database_url.replace("+aiosqlite", ""))
+        OrmBase.metadata.create_all(engine)
+        engine.dispose()
+        cls.app = app
+
+    def test_malformed_frame_keeps_connection(self):
+        with TestClient(self.app) as client:
+            client.post(
+                "/api/v1/auth/users",
+                json={"username": "codec_user", "email": "codec@example.com", "password": "password123"},
+            )
+            token = client.post(
+                "/api/v1/auth/token", json={"username": "codec_user", "password": "password123"}
+            ).json()["accessToken"]
+            headers = {"Authorization": f"Bearer {token}"}
+            user_id = client.get("/api/v1/auth/myself", headers=headers).json()["id"]
+
+            with client.websocket_connect("/ws", subprotocols=["msgpack.v1"]) as websocket:
+                websocket.send_text(token)
+                websocket.receive_bytes()
+                for data in MALFORMED_FRAMES.values():
+                    websocket.send_bytes(data)
+                websocket.send_bytes(msgpack.packb({0: "message", 1: "new", 2: "still alive", 3: user_id}))
+                reply = msgpack.unpackb(websocket.receive_bytes(), strict_map_key=False)
+
+        self.assertEqual(reply[2], "still alive")
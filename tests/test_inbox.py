@@ -0,0 +1,93 @@
+import unittest
+from datetime import datetime
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from messenger.cache import InMemoryCache
+from messenger.chats.inbox import mark_inbox_read, store_messages
+from messenger.chats.messages import get_last_read_message_time, get_many_last_messages
+from messenger.chats.models import Inbox
+from messenger.settings import settings
+from messenger.sockets.schemas import MessageResponseSchema
+
+
+def _message(sender_id: int, recipient_id: int, created_at: datetime) -> MessageResponseSchema:
+    return MessageResponseSchema(
+        type="message",
+        status="sent",
+        message="text",
+        sender_id=sender_id,
+        recipient_id=recipient_id,
+        created_at=int(created_at.timestamp() * 1000),
+    )
+
+
+class InboxReadTests(unittest.IsolatedAsyncioTestCase):
+    @classmethod
+    def setUpClass(cls):
+        from messenger.orm.base_model import OrmBase
+
+        engine = create_engine(settings.database_url.replace("+aiosqlite", ""))
+        OrmBase.metadata.create_all(engine)
+        engine.dispose()
+
+    async def asyncSetUp(self):
+        self.engine = create_async_engine(settings.database_url)
+        self.session = async_sessionmaker(self.engine, expire_on_commit=False)()
+        self.cache = getattr(InMemoryCache, "__wrapped__", InMemoryCache)()
+
+    async def asyncTearDown(self):
+        await self.session.close()
+        await self.engine.dispose()
+
+    async def get_inbox(self, user_id: int, peer_id: int) -> Inbox:
+        query = (
+            select(Inbox)
+            .where(Inbox.user_id == user_id, Inbox.peer_id == peer_id)
+            .execution_options(populate_existing=True)
+        )
+        return (await self.session.execute(query)).scalar_one()
+
+    async def test_read_before_messages_are_stored(self):
+        user_id, peer_id = 101, 102
+        read_at = datetime(2026, 1, 1, 12)
+        # Сохранение сообщений в очереди отстало от прочтения переписки.
+        self.assertEqual(await mark_inbox_read(self.session, user_id, peer_id, read_at), 0)
+        self.assertEqual(
+            await get_last_read_message_time(self.session, peer_id, user_id, self.cache), read_at
+        )
+        self.assertEqual(
+            await get_many_last_messages(self.session, [peer_id], user_id, self.cache), {peer_id: None}
+        )
+
+        await store_messages(self.session, [_message(peer_id, user_id, datetime(2026, 1, 1, 11))])
+        await self.session.commit()
+        inbox = await self.get_inbox(user_id, peer_id)
+        self.assertEqual((inbox.unread_count, inbox.last_read_at), (0, read_at))
+        self.assertIsNotNone(inbox.last_message_id)
+
+        await store_messages(self.session, [_message(peer_id, user_id, datetime(2026, 1, 1, 13))])
+        await self.session.commit()
+        self.assertEqual((await self.get_inbox(user_id, peer_id)).unread_count, 1)
+
+    async def test_read_recounts_unread_messages(self):
+        user_id, peer_id = 201, 202
+        await store_messages(
+            self.session,
+            [_message(peer_id, user_id, datetime(2026, 1, 1, hour)) for hour in (10, 11, 12)],
+        )
+        await self.session.commit()
+        self.assertEqual(
+            await mark_inbox_read(self.session, user_id, peer_id, datetime(2026, 1, 1, 10, 30)), 2
+        )
+        self.assertEqual(await mark_inbox_read(self.session, user_id, peer_id, datetime(2026, 1, 1, 12)), 0)
+
+    async def test_never_read_conversation_starts_at_epoch(self):
+        # Все сообщения непрочитанной переписки считаются непрочитанными, как и в inbox.
+        user_id, peer_id = 301, 302
+        await store_messages(self.session, [_message(peer_id, user_id, datetime(2026, 1, 1))])
+        await self.session.commit()
+        last_read = await get_last_read_message_time(self.session, peer_id, user_id, self.cache)
+        self.assertEqual(last_read.timestamp(), 0)
+        self.assertEqual((await self.get_inbox(user_id, peer_id)).unread_count, 1)
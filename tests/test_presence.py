@@ -0,0 +1,51 @@
+import asyncio
+import unittest
+
+from messenger.cache import InMemoryCache
+from messenger.sockets.presence import PresenceEngine
+
+USER_ID = 1
+
+
+class PresenceDrainTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.events: list[str] = []
+        self.connected_elsewhere = False
+
+        async def notify(user_id: int, status: str):
+            self.events.append(status)
+
+        async def is_connected_elsewhere(user_id: int) -> bool:
+            return self.connected_elsewhere
+
+        self.presence = PresenceEngine(
+            getattr(InMemoryCache, "__wrapped__", InMemoryCache)(),
+            notify=notify,
+            is_connected_elsewhere=is_connected_elsewhere,
+            ttl=60,
+            heartbeat_interval=60,
+            offline_delay=0.05,
+        )
+        await self.presence.connected(USER_ID)
+        self.assertEqual(self.events, ["online"])
+
+    async def test_offline_after_delay(self):
+        await self.presence.disconnected(USER_ID)
+        await asyncio.sleep(0.1)
+        self.assertEqual(self.events, ["online", "offline"])
+
+    async def test_drain_reconnect_to_other_node_sends_no_events(self):
+        # Клиент отключенного узла переподключается к другому узлу позже offline_delay,
+        # но в пределах назначенной ему задержки переподключения.
+        await self.presence.disconnected(USER_ID, reconnect_delay=0.2)
+        await asyncio.sleep(0.1)
+        self.connected_elsewhere = True
+        await asyncio.sleep(0.2)
+        self.assertEqual(self.events, ["online"])
+
+    async def test_drain_without_reconnect_goes_offline(self):
+        await self.presence.disconnected(USER_ID, reconnect_delay=0.1)
+        await asyncio.sleep(0.1)
+        self.assertEqual(self.events, ["online"])
+        await asyncio.sleep(0.1)
+        self.assertEqual(self.events, ["online", "offline"])
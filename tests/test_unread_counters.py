@@ -0,0 +1,72 @@
+import unittest
+
+from messenger.cache import InMemoryCache
+from messenger.chats.messages import get_many_unread_messages_counts, invalidate_unread_messages_counts
+from messenger.sockets.schemas import MessageResponseSchema
+
+SENDER_ID, RECIPIENT_ID = 1, 2
+
+
+class _Result:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def tuples(self):
+        return self
+
+    def all(self):
+        return self._rows
+
+
+class _InboxSession:
+    """Сессия, которая отвечает на запрос счетчиков из inbox и перед ответом вызывает `on_execute`."""
+
+    def __init__(self, unread_count: int):
+        self.unread_count = unread_count
+        self.on_execute = None
+
+    async def execute(self, query):
+        rows = [(SENDER_ID, self.unread_count)]
+        if self.on_execute is not None:
+            on_execute, self.on_execute = self.on_execute, None
+            await on_execute()
+        return _Result(rows)
+
+
+class UnreadCountersTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.cache = getattr(InMemoryCache, "__wrapped__", InMemoryCache)()
+        self.session = _InboxSession(unread_count=1)
+
+    async def send_message(self):
+        """Сохраняет сообщение в inbox и сбрасывает счетчик, как после фиксации в базе."""
+        self.session.unread_count += 1
+        message = MessageResponseSchema(
+            type="message",
+            status="sent",
+            sender_id=SENDER_ID,
+            recipient_id=RECIPIENT_ID,
+            message="text",
+            created_at=0,
+        )
+        await invalidate_unread_messages_counts([message], self.cache)
+
+    async def get_count(self) -> int:
+        return (await get_many_unread_messages_counts(self.session, [SENDER_ID], RECIPIENT_ID, self.cache))[
+            SENDER_ID
+        ]
+
+    async def test_message_saved_during_load_is_counted_once(self):
+        # Загрузка прочитала inbox до сохранения сообщения, а записывает счетчик после сброса.
+        self.session.on_execute = self.send_message
+        self.assertEqual(await self.get_count(), 1)
+        self.assertEqual(await self.get_count(), 2)
+        self.assertEqual(await self.get_count(), 2)
+
+    async def test_message_saved_after_load_is_counted_once(self):
+        self.assertEqual(await self.get_count(), 1)
+        await self.send_message()
+        self.assertEqual(await self.get_count(), 2)
+        await self.send_message()
+        await self.send_message()
+        self.assertEqual(await self.get_count(), 4)